@@ -0,0 +1,195 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  bench_hot_paths.py
+#
+#   Micro-benchmarks of the parsing and decoding done for every
+#   response, at the sizes seen in use: 290 (Basic) and 450 (Ultra)
+#   point sweeps, 10k point segmented sweeps and full screen captures.
+#       clean_return        echo and prompt removal
+#       serial_return       prompt framing in get_serial_view(),
+#                           through tinySA_serial() on a canned port
+#       scanraw_decode      '{' ('x' LSB MSB)*pts '}' to dBm
+#       scan_parse          scan text, outmask=3 (and into a sweepResult)
+#       data_parse          data text
+#       rgb565_decode       capture to RGB888
+#       frequency_grid      sweep frequencies
+#   No device needed. Results are printed as a table, and can be
+#   written as JSON to compare between library or numpy versions.
+#
+#   Run from the repository root:
+#       python -m benchmarks.bench_hot_paths
+#       python -m benchmarks.bench_hot_paths --json results.json
+#       python -m benchmarks.bench_hot_paths --filter scan --repeat 9
+##--------------------------------------------------------------------\
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+import timeit
+
+import numpy as np
+
+from src.tinySA_python import tinySA
+from src.data_decode.scanraw_decode import decode_scanraw
+from src.data_decode.text_decode import parse_scan, parse_scan_into, parse_data
+from src.screen.rgb565_decode import decode_rgb565
+from src.sweep.sweep_result import frequency_grid, sweepResult
+
+SWEEP_SIZES = [290, 450, 10000]
+SCREEN_SIZES = [(320, 240), (480, 320)]
+
+
+class cannedPort():
+    # answers every write with the same response, read back in USB
+    # sized chunks, so the framing sees the same reads as on a device
+    def __init__(self, response, chunk=64):
+        self.response = response
+        self.chunk = chunk
+        self.rx = bytearray()
+        self.pos = 0
+        self.timeout = 1
+
+    @property
+    def in_waiting(self):
+        return min(self.chunk, len(self.rx) - self.pos)
+
+    def write(self, data):
+        cmd = bytes(data).split(b'\r\n')[0]
+        self.rx = bytearray(cmd + b'\r\n' + self.response + b'ch> ')
+        self.pos = 0
+        return len(data)
+
+    def readinto(self, b):
+        count = min(len(b), self.chunk, len(self.rx) - self.pos)
+        b[:count] = self.rx[self.pos:self.pos+count]
+        self.pos = self.pos + count
+        return count
+
+
+def scan_text(rows, seed=0):
+    # scan output (outmask=3), as sent by the device
+    rng = np.random.default_rng(seed)
+    freqs = np.linspace(100e3, 5.3e9, rows)
+    levels = rng.uniform(-120, -20, rows)
+    return b''.join([b'%d %.6e \r\n' % (f, l) for f, l in zip(freqs, levels)])
+
+
+def data_text(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return b''.join([b'%.6e\r\n' % l for l in rng.uniform(-120, -20, rows)])
+
+
+def scanraw_frame(pts, seed=0):
+    rng = np.random.default_rng(seed)
+    out = np.empty((pts, 3), dtype=np.uint8)
+    out[:, 0] = ord('x')
+    out[:, 1:] = rng.integers(0, 65535, pts, dtype=np.uint16).astype('<u2').view(np.uint8).reshape(pts, 2)
+    return b'{' + out.tobytes() + b'}'
+
+
+def capture_data(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 65535, width*height, dtype=np.uint16).astype('>u2').tobytes()
+
+
+def cases():
+    # (name, size label, bytes handled per call, function)
+    tsa = tinySA()
+    for pts in SWEEP_SIZES:
+        text = scan_text(pts)
+        response = bytearray(b'scan 0 1 ' + bytes(str(pts), 'utf-8') + b' 3\r\n' + text + b'ch>')
+        yield "clean_return", pts, len(response), lambda r=response: tsa.clean_return(r)
+        yield "clean_return_view", pts, len(response), lambda r=memoryview(response): tsa.clean_return(r)
+
+        port = cannedPort(text)
+        t = tinySA()
+        t.ser = port
+        writebyte = 'scan 0 1 ' + str(pts) + ' 3\r\n'
+        yield "serial_return", pts, len(port.response), lambda t=t, w=writebyte: t.tinySA_serial(w)
+
+        frame = scanraw_frame(pts)
+        out = np.empty(pts, dtype=np.float32)
+        yield "scanraw_decode", pts, len(frame), lambda f=frame, p=pts: decode_scanraw(f, p)
+        yield "scanraw_decode_out", pts, len(frame), lambda f=frame, p=pts, o=out: decode_scanraw(f, p, 32, 174, o)
+
+        yield "scan_parse", pts, len(text), lambda d=text: parse_scan(d, 3)
+        res = sweepResult(pts)
+        res.reserve(pts)
+        yield "scan_parse_into", pts, len(text), lambda d=text, r=res: parse_scan_into(d, r.frequencies, r.levels, r.valid)
+        data = data_text(pts)
+        yield "data_parse", pts, len(data), lambda d=data: parse_data(d)
+
+        grid = np.empty(pts, dtype=np.float64)
+        yield "frequency_grid", pts, grid.nbytes, lambda p=pts: frequency_grid(100e6, 900e6, p)
+        yield "frequency_grid_out", pts, grid.nbytes, lambda p=pts, g=grid: frequency_grid(100e6, 900e6, p, g)
+
+    for width, height in SCREEN_SIZES:
+        data = capture_data(width, height)
+        out = np.empty((height, width, 3), dtype=np.uint8)
+        label = str(width) + "x" + str(height)
+        yield "rgb565_decode", label, len(data), lambda d=data, w=width, h=height: decode_rgb565(d, w, h)
+        yield "rgb565_decode_out", label, len(data), lambda d=data, w=width, h=height, o=out: decode_rgb565(d, w, h, o)
+
+
+def measure(func, repeat, minTime):
+    # seconds per call, from 'repeat' runs of enough calls to take minTime
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        if timer.timeit(number) >= minTime:
+            break
+        number = number * 2
+    times = [t / number for t in timer.repeat(repeat, number)]
+    return times, number
+
+
+def run(repeat=5, minTime=0.05, nameFilter=None):
+    results = []
+    for name, size, nbytes, func in cases():
+        if (nameFilter != None) and not(nameFilter in name):
+            continue
+        times, number = measure(func, repeat, minTime)
+        best = min(times)
+        results.append({"name": name, "size": size, "bytes": nbytes,
+                        "min_s": best, "median_s": statistics.median(times),
+                        "mean_s": statistics.mean(times),
+                        "stdev_s": statistics.stdev(times) if len(times) > 1 else 0.0,
+                        "calls_per_s": 1.0 / best, "mb_per_s": nbytes / best / 1e6,
+                        "number": number, "repeat": repeat})
+    return results
+
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__,
+            "platform": platform.platform(), "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="parsing and decoding micro-benchmarks")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case")
+    parser.add_argument("--min-time", type=float, default=0.05, help="min seconds per timed run")
+    parser.add_argument("--filter", default=None, help="only cases with this in their name")
+    parser.add_argument("--json", default=None, help="write the results to this file, '-' for stdout")
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.min_time, args.filter)
+    if args.json == "-":
+        json.dump({"environment": environment(), "results": results}, sys.stdout, indent=2)
+        print()
+        return
+    print(f"{'case':<20} {'size':>8} {'min (us)':>12} {'median (us)':>12} {'MB/s':>10}")
+    for r in results:
+        print(f"{r['name']:<20} {str(r['size']):>8} {r['min_s']*1e6:>12.2f} {r['median_s']*1e6:>12.2f} {r['mb_per_s']:>10.1f}")
+    if args.json != None:
+        with open(args.json, 'w') as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+        print("results written to " + args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  bench_scan_cpu.py
+#
+#   Compares the CPU time spent per scan() with the original
+#   in_waiting busy-spin receive loop and the current blocking
+#   receive in get_serial_view().
+#
+#   Run from the repository root:
+#       python -m benchmarks.bench_scan_cpu --port COM10 --sweeps 20
+#       python -m benchmarks.bench_scan_cpu --sim --sweeps 20
+#   If no port is given, autoconnect() is used. --sim runs against the
+#   simulator with its real time clock, so each scan waits for the
+#   modelled sweep time like on a device and the comparison can be
+#   repeated without one.
+##--------------------------------------------------------------------\
+
+import argparse
+import time
+
+from src.tinySA_python import tinySA
+
+
+def legacy_get_serial_return(tsa):
+    # the original receive loop. polls in_waiting with no sleep
+    # kept here only to measure against
+    buffer = bytes()
+    while True:
+        if tsa.ser.in_waiting > 0:
+            buffer += tsa.ser.read(tsa.ser.in_waiting)
+            try:
+                complete = buffer[:buffer.index(b'>')+1]
+                buffer = buffer[buffer.index(b'ch>')+1:]
+            except ValueError:
+                continue
+            break
+    return bytearray(complete)
+
+
+def positive_int(val):
+    # argparse type for counts that must be at least 1
+    val = int(val)
+    if val < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return val
+
+
+def time_scans(tsa, start, stop, pts, sweeps):
+    # run the scans and return (cpu seconds, wall seconds) per scan
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(sweeps):
+        tsa.scan(start, stop, pts, 2)
+    cpu_per_scan = (time.process_time() - cpu_start) / sweeps
+    wall_per_scan = (time.perf_counter() - wall_start) / sweeps
+    return cpu_per_scan, wall_per_scan
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU time per scan() before/after the blocking receive path")
+    parser.add_argument("--port", default=None, help="serial port. autoconnect if not set")
+    parser.add_argument("--sim", action="store_true", help="use the simulator instead of a device")
+    parser.add_argument("--seed", type=int, default=0, help="simulator noise seed")
+    parser.add_argument("--sweeps", type=positive_int, default=10, help="number of scans per run")
+    parser.add_argument("--start", type=int, default=int(100e6))
+    parser.add_argument("--stop", type=int, default=int(900e6))
+    parser.add_argument("--pts", type=int, default=290)
+    args = parser.parse_args()
+
+    tsa = tinySA()
+    if args.sim == True:
+        # the busy-spin loop polls in_waiting, which only advances in
+        # real time, so the virtual clock cannot be used here
+        connected_bool = tsa.connect_simulator("realtime", args.seed)
+    elif args.port == None:
+        found_bool, connected_bool = tsa.autoconnect()
+    else:
+        connected_bool = tsa.connect(args.port)
+    if connected_bool == False:
+        print("ERROR: could not connect")
+        return
+
+    # before: swap in the original busy-spin loop on this instance only
+    tsa.get_serial_view = lambda: legacy_get_serial_return(tsa)
+    cpu_before, wall_before = time_scans(tsa, args.start, args.stop, args.pts, args.sweeps)
+
+    # after: back to the class implementation
+    del tsa.get_serial_view
+    cpu_after, wall_after = time_scans(tsa, args.start, args.stop, args.pts, args.sweeps)
+
+    tsa.resume() # resume so the screen is not left frozen
+    tsa.disconnect()
+
+    print(f"{'receive path':<14} {'cpu s/scan':>12} {'wall s/scan':>12} {'cpu %':>8}")
+    for name, cpu, wall in [("busy-spin", cpu_before, wall_before),
+                            ("blocking", cpu_after, wall_after)]:
+        print(f"{name:<14} {cpu:>12.4f} {wall:>12.4f} {100*cpu/wall:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  bench_text_parse.py
+#
+#   Compares the list comprehension parsing used in the examples
+#   against the numpy parsers in src/data_decode/text_decode.py
+#   for scan output with 2 columns (outmask=3). No device needed.
+#
+#   Run from the repository root:
+#       python -m benchmarks.bench_text_parse
+##--------------------------------------------------------------------\
+
+import argparse
+import timeit
+
+import numpy as np
+
+from src.data_decode.text_decode import parse_scan
+
+
+def make_scan_text(rows, corrupt_every=1000, seed=0):
+    # cleaned scan output (outmask=3) as returned by tinySA.scan()
+    rng = np.random.default_rng(seed)
+    freqs = np.linspace(100e3, 5.3e9, rows)
+    levels = rng.uniform(-120, -20, rows)
+    lines = [b'%d %.6e \r\n' % (f, l) for f, l in zip(freqs, levels)]
+    # the firmware occasionally prints '-:' for a level
+    for i in range(corrupt_every//2, rows, corrupt_every):
+        lines[i] = b'%d -:.000000e+01 \r\n' % freqs[i]
+    return bytearray(b''.join(lines)[:-1]) # last '\n' is removed by clean_return()
+
+
+def list_parse(data):
+    # the approach from the examples
+    data1 = bytearray(data.replace(b"-:.0", b"-10.0"))
+    return [list(map(float, line.split())) for line in data1.decode('utf-8').split('\n') if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ASCII scan parsing: list comprehension vs numpy")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'list (ms)':>12} {'numpy (ms)':>12} {'speedup':>8}")
+    for rows in [290, 450, 10000, 50000]:
+        data = make_scan_text(rows)
+        number = max(1, 20000 // rows)
+        t_list = min(timeit.repeat(lambda: list_parse(data), number=number, repeat=args.repeat)) / number
+        t_np = min(timeit.repeat(lambda: parse_scan(data, 3), number=number, repeat=args.repeat)) / number
+        print(f"{rows:>8} {t_list*1e3:>12.3f} {t_np*1e3:>12.3f} {t_list/t_np:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
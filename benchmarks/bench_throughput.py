@@ -0,0 +1,273 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  bench_throughput.py
+#
+#   End to end sweep throughput through the tinySA class: connect,
+#   configure, then N sweeps with scan_arrays() or scan_raw_arrays()
+#   (command, framing and decode). Reports sweeps/sec, CPU seconds
+#   per sweep and peak RSS, and two latencies:
+#       command: write of the sweep command to the end of its
+#           response, from the command metrics (see enable_metrics())
+#       sweep call: the whole scan_arrays()/scan_raw_arrays() call,
+#           including the decode
+#
+#   Transports (one of):
+#       --sim [--clock virtual|realtime]    the simulator (default)
+#       --replay FILE                       a traffic recording
+#       --port PORT                         a device
+#   --record FILE saves the traffic of a run, so the same run can be
+#   replayed later (with the same sweep arguments) without the device.
+#
+#   Regression gating: --save-baseline FILE stores the results, and
+#   --baseline FILE compares against them and exits with 1 if any
+#   metric is worse by more than --max-regression (0.10 = 10%).
+#
+#   Run from the repository root:
+#       python -m benchmarks.bench_throughput --sweeps 200 --save-baseline base.json
+#       python -m benchmarks.bench_throughput --sweeps 200 --baseline base.json
+##--------------------------------------------------------------------\
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from src.tinySA_python import tinySA
+
+try:
+    import resource
+except ImportError:
+    resource = None # Windows
+
+# metric: True if higher is better
+METRICS = {"sweeps_per_s": True, "command_p50_s": False, "command_p99_s": False,
+           "sweep_call_p50_s": False, "sweep_call_p99_s": False,
+           "cpu_s_per_sweep": False, "peak_rss_mb": False}
+
+
+def peak_rss_mb():
+    # peak resident memory of this process, or None if not available
+    if resource == None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / 1e6   # bytes
+    return peak / 1e3       # kB
+
+
+def positive_int(val):
+    # argparse type for counts that must be at least 1
+    val = int(val)
+    if val < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return val
+
+
+def auto_or_int(val):
+    # argparse type for settings that take "auto" or an integer
+    if val == "auto":
+        return val
+    try:
+        return int(val)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected 'auto' or an integer, got " + repr(val))
+
+
+def configure(tsa, args):
+    # sets the rbw and attenuation. returns the name of a setting that
+    # was rejected, or None.
+    # with the error byte on, a setting the library rejects returns
+    # b'ERROR', and the device answers a bad setting with its usage
+    # text. the setters return nothing when they are accepted
+    errByte = tsa.get_error_byte_return()
+    tsa.set_error_byte_return(True)
+    try:
+        if len(tsa.rbw(args.rbw)) > 0:
+            return "--rbw " + str(args.rbw)
+        if len(tsa.attenuate(args.attenuate)) > 0:
+            return "--attenuate " + str(args.attenuate)
+        return None
+    finally:
+        tsa.set_error_byte_return(errByte)
+
+
+def connect(tsa, args):
+    # connects to the selected transport. returns True if connected
+    if args.device_type != None:
+        tsa.set_device_type(args.device_type)
+    if args.replay != None:
+        return tsa.replay_traffic(args.replay, None if args.clock == "virtual" else 1.0)
+    if args.port != None:
+        return tsa.connect(args.port)
+    # --sim, or no transport given
+    return tsa.connect_simulator(args.clock, args.seed)
+
+
+def run(args):
+    tsa = tinySA()
+    connected = connect(tsa, args)
+    if connected == False:
+        return None
+    if args.record != None:
+        tsa.record_traffic(args.record)
+
+    # configure. with the state cache, repeats of a run send the same commands
+    rejected = configure(tsa, args)
+    if rejected != None:
+        tsa.disconnect()
+        print("ERROR: the setting " + rejected + " was rejected")
+        sys.exit(2)
+    if args.method == "scan":
+        sweep = lambda out: tsa.scan_arrays(args.start, args.stop, args.pts, out)
+    else:
+        sweep = lambda out: tsa.scan_raw_arrays(args.start, args.stop, args.pts, 1, out)
+
+    out = None
+    for _ in range(args.warmup):
+        out = sweep(out)
+
+    # only the measured sweeps go into the command metrics
+    metrics = tsa.enable_metrics()
+
+    latencies = np.empty(args.sweeps, dtype=np.float64)
+    failed = 0
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for i in range(args.sweeps):
+        t0 = time.perf_counter()
+        res = sweep(out)
+        latencies[i] = time.perf_counter() - t0
+        if res == None:
+            failed = failed + 1
+        else:
+            out = res
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    tsa.disable_metrics()
+    commands = metrics.summary()
+    sweepCommand = metrics.snapshot().get(args.method)
+
+    if args.record != None:
+        tsa.stop_recording_traffic()
+    modelled = None
+    if hasattr(tsa.ser, "now") and (args.port == None) and (args.replay == None):
+        modelled = tsa.ser.now()
+    tsa.disconnect()
+
+    return {"sweeps": args.sweeps, "failed": failed, "wall_s": wall,
+            "sweeps_per_s": args.sweeps / wall,
+            "command_p50_s": None if sweepCommand == None else sweepCommand.prompt.percentile(50),
+            "command_p99_s": None if sweepCommand == None else sweepCommand.prompt.percentile(99),
+            "command_first_byte_p50_s": None if sweepCommand == None else sweepCommand.firstByte.percentile(50),
+            "sweep_call_p50_s": float(np.percentile(latencies, 50)),
+            "sweep_call_p99_s": float(np.percentile(latencies, 99)),
+            "sweep_call_max_s": float(latencies.max()),
+            "cpu_s_per_sweep": cpu / args.sweeps,
+            "peak_rss_mb": peak_rss_mb(),
+            "device_time_s": modelled,
+            "commands": commands}
+
+
+def compare(results, baseline, maxRegression):
+    # returns a list of (metric, baseline value, value, change) for
+    # every metric worse than the baseline by more than maxRegression
+    worse = []
+    for metric, higherIsBetter in METRICS.items():
+        base = baseline.get(metric)
+        val = results.get(metric)
+        if (base == None) or (val == None) or (base == 0):
+            continue
+        change = (val - base) / base
+        if higherIsBetter == True:
+            change = -change
+        if change > maxRegression:
+            worse.append((metric, base, val, change))
+    return worse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="end to end sweep throughput, with baseline regression gating")
+    transport = parser.add_mutually_exclusive_group()
+    transport.add_argument("--port", default=None, help="serial port of a device")
+    transport.add_argument("--replay", default=None, help="traffic recording to replay")
+    transport.add_argument("--sim", action="store_true", help="use the simulator (the default)")
+    parser.add_argument("--clock", default="virtual", choices=["virtual", "realtime"],
+                        help="simulator clock. for --replay, virtual replays as fast as possible")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--device-type", default=None, help="BASIC|ULTRA_ZS405|ULTRA_P_ZS406|ULTRA_P_ZS407")
+    parser.add_argument("--record", default=None, help="save the traffic of this run to a file")
+    parser.add_argument("--method", default="scanraw", choices=["scanraw", "scan"])
+    parser.add_argument("--sweeps", type=positive_int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--start", type=int, default=int(100e6))
+    parser.add_argument("--stop", type=int, default=int(900e6))
+    parser.add_argument("--pts", type=int, default=450)
+    parser.add_argument("--rbw", type=auto_or_int, default="auto", help="auto|kHz")
+    parser.add_argument("--attenuate", type=auto_or_int, default="auto", help="auto|dB")
+    parser.add_argument("--json", default=None, help="write the results to this file, '-' for stdout")
+    parser.add_argument("--save-baseline", default=None, help="write the results as the baseline")
+    parser.add_argument("--baseline", default=None, help="baseline to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="allowed fraction a metric can be worse than the baseline")
+    args = parser.parse_args()
+
+    results = run(args)
+    if results == None:
+        print("ERROR: could not connect")
+        sys.exit(2)
+    transport = "port" if args.port != None else ("replay" if args.replay != None else "sim-" + args.clock)
+    report = {"environment": {"python": platform.python_version(), "numpy": np.__version__,
+                              "platform": platform.platform()},
+              "settings": {"transport": transport, "method": args.method, "start": args.start,
+                           "stop": args.stop, "pts": args.pts, "sweeps": args.sweeps},
+              "results": results}
+
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        print(f"{transport} {args.method} {args.pts} pts x {args.sweeps}")
+        print(f"  sweeps/s        {results['sweeps_per_s']:.1f}")
+        if results["command_p50_s"] != None:
+            print(f"  {args.method} command p50 {results['command_p50_s']*1e3:.3f} ms (write to prompt)")
+            print(f"  {args.method} command p99 {results['command_p99_s']*1e3:.3f} ms")
+        print(f"  sweep call p50  {results['sweep_call_p50_s']*1e3:.3f} ms (command and decode)")
+        print(f"  sweep call p99  {results['sweep_call_p99_s']*1e3:.3f} ms")
+        print(f"  cpu s/sweep     {results['cpu_s_per_sweep']*1e3:.3f} ms")
+        if results["peak_rss_mb"] != None:
+            print(f"  peak rss        {results['peak_rss_mb']:.1f} MB")
+        if results["device_time_s"] != None:
+            print(f"  device time     {results['device_time_s']:.3f} s (modelled)")
+        if results["failed"] > 0:
+            print(f"  failed sweeps   {results['failed']}")
+        if args.json != None:
+            with open(args.json, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if args.save_baseline != None:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+    status = 0
+    if results["failed"] > 0:
+        status = 1
+    if args.baseline != None:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get("settings") != report["settings"]:
+            print("WARNING: the baseline was run with different settings " + str(baseline.get("settings")), file=sys.stderr)
+        worse = compare(results, baseline["results"], args.max_regression)
+        for metric, base, val, change in worse:
+            print(f"REGRESSION: {metric} {base:.6g} -> {val:.6g} ({change*100:+.1f}% worse)", file=sys.stderr)
+        if len(worse) > 0:
+            status = 1
+        else:
+            print(f"no regression beyond {args.max_regression*100:.0f}% of the baseline", file=sys.stderr)
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
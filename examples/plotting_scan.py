@@ -1,6 +1,7 @@
 # import tinySA library
 # (NOTE: check library path relative to script path)
 from src.tinySA_python import tinySA 
+from src.data_decode.text_decode import parse_scan
 
 
 # imports FOR THE EXAMPLE
@@ -17,15 +18,12 @@ def convert_data_to_arrays(start, stop, pts, data):
     # As of the Jan. 2024 build in some data returned with SWEEP or SCAN calls there is error data.  
     # https://groups.io/g/tinysa/topic/tinasa_ultra_sweep_command/104194367  
     # this shows up as "-:.000000e+01".
-    # TEMP fix - replace the colon character with a -10. This puts the 'filled in' points around the noise floor.
+    # parse_scan() returns these as NaN with a validity mask, so matplotlib leaves a gap.
     # more advanced filtering should be applied for actual analysis.
-    data1 =bytearray(data.replace(b"-:.0", b"-10.0"))
-    
-    # get both values in each row returned (for reference)
-    #data_arr = [list(map(float, line.split())) for line in data.decode('utf-8').split('\n') if line.strip()] 
+    values, valid = parse_scan(data, outmask=2)
    
-    # get first value in each returned row
-    data_arr = [float(line.split()[0]) for line in data1.decode('utf-8').split('\n') if line.strip()]
+    # one column for outmask=2 (measured data)
+    data_arr = values[:, 0]
 
     return freq_arr, data_arr
 
@@ -11,7 +11,6 @@ from src.tinySA_python import tinySA
 # imports FOR THE EXAMPLE
 import numpy as np
 import matplotlib.pyplot as plt
-import struct
 
 def convert_data_to_arrays(start, stop, pts, data):
     # FOR PLOTTING
@@ -60,8 +59,8 @@ else: # if port found and connected, then complete task(s) and disconnect
     # SCAN
     scan_data_bytes = tsa.scan(start, stop, pts, outmask)
 
-    # SCAN RAW
-    scanraw_data_bytes = tsa.scan_raw(start, stop, pts, outmask)
+    # SCAN RAW - decoded to dBm by the library
+    scanraw_dBm = tsa.scan_raw_array(start, stop, pts)
 
     # disconnect because we don't need the tinySA to process data
     tsa.disconnect()
@@ -70,22 +69,11 @@ else: # if port found and connected, then complete task(s) and disconnect
     # convert data to 2 arrays for X and Y
     freq_arr, data_arr = convert_data_to_arrays(start, stop, pts, scan_data_bytes)
 
-    # PROCESS SCANRAW into an array & reuse the FREQ_ARR value
-    # remove the intro curly brace ({) 
-    bin_scanraw = scanraw_data_bytes[1:] #skip the first char because it's the raminaing curly brace
-    # use struct.unpack() because of the repeating pattern
-        # <: indicates little-endian byte order, meaning the least significant byte is stored first
-        # 'xH'*pts: a repetition of the format 'xH' once per point.
-        # 'x': represents a pad byte, which is ignored
-        # 'H': represents an unsigned short integer (2 bytes)
-    processed_scanraw = struct.unpack( '<' + 'xH'*pts, bin_scanraw ) # ignore trailing '}ch> '
-    processed_scanraw = np.array(processed_scanraw, dtype=np.uint16 ).reshape(-1, 1) #unit8 has overflow error
-
-    # CONVERT to dBm Power
-    # take the processed binary data and convert it to dBm. 
-    # The equation is from tinySA.org & official documentation
-    SCALE_FACTOR = 174  # tinySA Basic: 128, tinySA Ultra and newer is 174
-    dBm_data = processed_scanraw / 32 - SCALE_FACTOR
+    # SCANRAW is already in dBm. The library lays a numpy dtype of ('x', LSB, MSB)
+    # over the returned bytes and applies the device scale factor:
+    #   dBm = raw / 32 - 128 for the tinySA Basic, 174 for the tinySA Ultra and newer
+    # (see set_device_type() to select the device)
+    dBm_data = scanraw_dBm
     print(dBm_data)
 
     # plot
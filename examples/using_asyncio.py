@@ -0,0 +1,49 @@
+# import the asyncio tinySA library
+# (NOTE: check library path relative to script path)
+from src.tinySA_async import asyncTinySA
+
+# imports FOR THE EXAMPLE
+import asyncio
+import serial.tools.list_ports
+
+
+async def sweep_device(port):
+    # each device gets its own asyncTinySA object. they all share one event loop
+    atsa = asyncTinySA()
+    connected_bool = await atsa.connect(port)
+    if connected_bool == False:
+        return port, None
+
+    atsa.set_response_timeout(5) # seconds
+    print(port, await atsa.version())
+
+    # a single sweep, as numpy arrays
+    res = await atsa.scan_raw_arrays(int(150e6), int(200e6), 450)
+    print(port, res)
+
+    # 10 sweeps from a continuous scanraw. the device is stopped when the block is left
+    count = 0
+    async with atsa.sweeps(int(150e6), int(200e6), 450) as stream:
+        async for sweep in stream:
+            print(port, sweep.timestamp, sweep.levels.max())
+            count = count + 1
+            if count == 10:
+                break
+
+    await atsa.resume()
+    atsa.disconnect()
+    return port, res
+
+
+async def main():
+    ports = [p.device for p in serial.tools.list_ports.comports()
+             if (p.vid != None) and (hex(p.vid) == '0x483') and (hex(p.pid) == '0x5740')]
+    if len(ports) == 0:
+        print("ERROR: no tinySA found")
+        return
+    results = await asyncio.gather(*[sweep_device(port) for port in ports])
+    for port, res in results:
+        print(port, "done" if res != None else "failed")
+
+
+asyncio.run(main())
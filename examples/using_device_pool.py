@@ -0,0 +1,35 @@
+# import the device pool
+# (NOTE: check library path relative to script path)
+from src.device_pool import devicePool
+
+# imports FOR THE EXAMPLE
+import time
+
+
+# create a pool and connect to every attached tinySA
+pool = devicePool(verbose=False)
+count = pool.connect_all()
+
+if count == 0:
+    print("ERROR: no tinySA found")
+else:
+    # the identity of each device, by port
+    for port, info in pool.info.items():
+        print(port, info["device_id"], info["version"])
+
+    # same settings on every device
+    pool.command("rbw", 10)
+
+    # one sweep on every device at the same time
+    start_time = time.time()
+    results = pool.scan_raw_arrays(int(150e6), int(200e6), 450)
+    print("sweep time (s):", time.time() - start_time)
+
+    for port, res in results.items():
+        if res == None:
+            print(port, "failed")
+        else:
+            print(port, res.settings["device_id"], res.levels.max())
+
+    pool.command("resume")
+    pool.disconnect_all()
@@ -0,0 +1,50 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  scanraw_decode.py
+#
+#   Vectorized decode of the scanraw binary format:
+#       '{' ('x' LSB MSB)*points '}'
+#   A structured NumPy dtype (pad byte + little endian uint16) is
+#   laid directly over the received bytes, so the levels are read
+#   without building any Python objects.
+#
+#   dBm = raw / SCANRAW_SCALE - SCANRAW_OFFSET
+#   where the scale and offset come from the device preset
+#   (128 offset for the tinySA Basic, 174 for the Ultra and newer)
+##--------------------------------------------------------------------\
+
+import numpy as np
+
+# one scanraw point: 'x' then the 16 bit level
+SCANRAW_DTYPE = np.dtype([('x', 'u1'), ('level', '<u2')])
+
+
+def scanraw_levels(data, pts=None):
+    # returns a uint16 view of the raw levels in data. no copy is made,
+    # so the view is only valid as long as data is.
+    # data: scanraw frame, with or without the '{' and '}'
+    # pts: number of points. defaults to everything in data
+    mv = memoryview(data)
+    if mv[:1] == b'{':
+        mv = mv[1:]
+    if pts == None:
+        pts = len(mv) // SCANRAW_DTYPE.itemsize
+    return np.frombuffer(mv, dtype=SCANRAW_DTYPE, count=pts)['level']
+
+
+def decode_scanraw(data, pts=None, scale=32, offset=174, out=None):
+    # returns the scanraw levels in dBm as float32
+    # data: scanraw frame, with or without the '{' and '}'
+    # pts: number of points. defaults to everything in data
+    # scale, offset: from the device preset (SCANRAW_SCALE, SCANRAW_OFFSET)
+    # out: optional preallocated float32 array of at least pts values.
+    #   the decoded values are written into it and it is returned
+    levels = scanraw_levels(data, pts)
+    if out is None:
+        out = np.empty(len(levels), dtype=np.float32)
+    else:
+        out = out[:len(levels)]
+    np.multiply(levels, np.float32(1.0/scale), out=out, casting='unsafe')
+    np.subtract(out, np.float32(offset), out=out)
+    return out
@@ -0,0 +1,156 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  text_decode.py
+#
+#   One pass parsers for the ASCII output of scan, data and
+#   frequencies into numpy arrays.
+#
+#   The rows are whitespace separated columns ending in '\r\n'.
+#   For scan, the columns are set by the outmask:
+#       1=frequencies, 2=measured data, 4=stored data
+#   Some firmware builds print corrupted values such as
+#   "-:.000000e+01". These are parsed as NaN and marked False in
+#   the returned validity mask instead of being patched over.
+#   https://groups.io/g/tinysa/topic/tinasa_ultra_sweep_command/104194367
+##--------------------------------------------------------------------\
+
+import warnings
+
+import numpy as np
+
+CORRUPT_DIGIT = b':'    # the firmware prints ':' for a digit of 10
+
+
+def fromstring_raises():
+    # newer numpy raises ValueError when np.fromstring(sep=' ') meets
+    # text that is not a number. older versions warn and return the
+    # values before it
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            np.fromstring(b'1 x', dtype=np.float64, sep=' ')
+    except ValueError:
+        return True
+    return False
+
+STRICT_FROMSTRING = fromstring_raises()
+
+
+def parse_values(data):
+    # all whitespace separated numbers in data as one float64 array.
+    # a single pass in C over the bytes, no Python object per value.
+    # raises ValueError if data has anything that is not a number
+    if STRICT_FROMSTRING == True:
+        return np.fromstring(data, dtype=np.float64, sep=' ')
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            return np.fromstring(data, dtype=np.float64, sep=' ')
+        except DeprecationWarning as err:
+            raise ValueError(str(err))
+
+
+def outmask_columns(outmask):
+    # number of columns printed for a scan outmask
+    return bin(int(outmask) & 0x7).count("1")
+
+
+def invalid_tokens(data, ncols=1):
+    # returns the flat index (row*ncols + column) of every value in data
+    # that contains the corrupt digit. corrupted values are rare, so only
+    # the lines that hold one are looked at
+    bad = []
+    row = 0
+    last_pos = 0
+    pos = data.find(CORRUPT_DIGIT)
+    while pos != -1:
+        row = row + data.count(b'\n', last_pos, pos)
+        line_start = data.rfind(b'\n', 0, pos) + 1
+        # values before this one on the line, plus this one
+        col = len(data[line_start:pos+1].split()) - 1
+        bad.append(row*ncols + col)
+        last_pos = pos
+        pos = data.find(CORRUPT_DIGIT, pos+1)
+    return np.unique(np.array(bad, dtype=np.int64))
+
+
+def repair_corrupt(data, ncols=1):
+    # returns data as bytes with the corrupted values made parseable,
+    # and the flat index of those values (see invalid_tokens())
+    data = bytes(data)
+    bad = invalid_tokens(data, ncols)
+    if len(bad) > 0:
+        # same length replacement, so the value positions do not move
+        data = data.replace(CORRUPT_DIGIT, b'0')
+    return data, bad
+
+
+def parse_columns(data, ncols=1):
+    # parses rows of ncols values into a (rows, ncols) float64 array
+    # returns values, valid
+    #   valid is a bool array of the same shape, False for corrupted values
+    #   both have 0 rows if data is not numeric, such as an error,
+    #   'usage: ...' or unknown command response
+    data, bad = repair_corrupt(data, ncols)
+    try:
+        values = parse_values(data)
+    except ValueError:
+        return np.empty((0, ncols)), np.empty((0, ncols), dtype=bool)
+    # drop a partial last row, if any
+    rows = len(values) // ncols
+    values = values[:rows*ncols].reshape(rows, ncols)
+    valid = np.ones(values.shape, dtype=bool)
+    if len(bad) > 0:
+        bad = bad[bad < rows*ncols]
+        values.reshape(-1)[bad] = np.nan
+        valid.reshape(-1)[bad] = False
+    return values, valid
+
+
+def parse_scan(data, outmask=2):
+    # parses scan output. returns values, valid with one column
+    # per bit set in the outmask (frequencies, measured, stored order)
+    ncols = outmask_columns(outmask)
+    if ncols == 0:
+        return np.empty((0, 0)), np.empty((0, 0), dtype=bool)
+    return parse_columns(data, ncols)
+
+
+def parse_scan_into(data, frequencies, levels, valid):
+    # parses scan output with outmask=3 (frequency, level rows) straight
+    # into preallocated arrays, such as the ones of a sweepResult, so
+    # they are reused for every sweep
+    # valid: set False where the level is corrupted (the level is NaN)
+    # returns the number of rows in data, 0 if data is not numeric.
+    #   nothing is written if there are more rows than the arrays hold
+    data, bad = repair_corrupt(data, 2)
+    try:
+        values = parse_values(data)
+    except ValueError:
+        return 0
+    rows = len(values) // 2
+    if rows > min(len(frequencies), len(levels), len(valid)):
+        return rows
+    frequencies[:rows] = values[0:2*rows:2]
+    levels[:rows] = values[1:2*rows:2]
+    valid[:rows] = True
+    for i in bad[bad < 2*rows]:
+        if i % 2 == 0:
+            frequencies[i // 2] = np.nan
+        else:
+            levels[i // 2] = np.nan
+            valid[i // 2] = False
+    return rows
+
+
+def parse_data(data):
+    # parses data() output. returns 1D values, valid
+    values, valid = parse_columns(data, 1)
+    return values[:, 0], valid[:, 0]
+
+
+def parse_frequencies(data):
+    # parses frequencies() output. returns 1D values, valid
+    values, valid = parse_columns(data, 1)
+    return values[:, 0], valid[:, 0]
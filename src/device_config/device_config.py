@@ -15,6 +15,16 @@ except:
     from device_config.presets  import config_tinysa_ultra_p_ZS406 as tinyUPZS406
     from device_config.presets  import config_tinysa_ultra_p_ZS407 as tinyUPZS407
 
+# presets by their DEVICE_TYPE
+PRESETS = {tinyBasic.DEVICE_TYPE: tinyBasic,
+           tinyUZS405.DEVICE_TYPE: tinyUZS405,
+           tinyUPZS406.DEVICE_TYPE: tinyUPZS406,
+           tinyUPZS407.DEVICE_TYPE: tinyUPZS407}
+
+def get_preset(model):
+    # returns the preset module for a DEVICE_TYPE, or None
+    return PRESETS.get(model, None)
+
 
 class deviceConfig():
     def __init__(self, parent=None):
@@ -26,16 +36,8 @@ class deviceConfig():
             
     def select_preset_model(self, model):
         self.deviceModel = model
-        if model == "":
-            self.presetSelected = tinyBasic
-        elif model == "":
-            self.presetSelected = tinyUZS405
-        elif model == "":
-            self.presetSelected = tinyUPZS406
-        elif model == "":
-            self.presetSelected = tinyUPZS407
-        else:
-            self.presetSelected = None
+        self.presetSelected = get_preset(model)
+        if self.presetSelected == None:
             self.deviceModel = None
             print("ERROR: selected preset not in library")
         
@@ -25,6 +25,11 @@ DISPLAY_PTS = 290       # max num scan points displayed on screen
     #  51, 101, 145 or 290 
 #16 bits per RGB pixel
 
+## scanraw
+# dBm = raw / SCANRAW_SCALE - SCANRAW_OFFSET
+SCANRAW_SCALE = 32
+SCANRAW_OFFSET = 128     # tinySA Basic
+
 ## battery
 MAX_DEVICE_BATTERY = 4095  # val read from device. analogue
 
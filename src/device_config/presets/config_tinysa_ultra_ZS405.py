@@ -25,6 +25,11 @@ DISPLAY_PTS = 450       # max num scan points displayed on screen
     #  5 
 #16 bits per RGB pixel
 
+## scanraw
+# dBm = raw / SCANRAW_SCALE - SCANRAW_OFFSET
+SCANRAW_SCALE = 32
+SCANRAW_OFFSET = 174     # tinySA Ultra and newer
+
 ## battery
 MAX_DEVICE_BATTERY = 4095  # val read from device. analogue
 
@@ -0,0 +1,177 @@
+#! /usr/bin/python3
+
+##------------------------------------------------------------------------------------------------\
+#   tinySA_python
+#   './device_pool.py'
+#   Runs several tinySA devices from one process. Every attached tinySA
+#   (USB VID 0x483, PID 0x5740) is found and connected, and commands and sweeps
+#   are run on all of them at the same time with one worker thread per device.
+#   The serial reads release the GIL while waiting, so N devices take about
+#   the time of one sweep instead of N.
+#
+#   Results are returned as a dict keyed by port. Sweep results also have the
+#   port, device ID and version added to their settings.
+##--------------------------------------------------------------------------------------------------\
+
+from concurrent.futures import ThreadPoolExecutor
+import re
+
+import serial.tools.list_ports
+
+try:
+    from src.tinySA_python import tinySA
+except:
+    from tinySA_python import tinySA
+
+
+def find_ports():
+    # returns the port names of every attached tinySA
+    ports = []
+    for port_info in serial.tools.list_ports.comports():
+        if (port_info.vid == None):
+            pass
+        elif (hex(port_info.vid) == '0x483') and (hex(port_info.pid) == '0x5740'):
+            ports.append(port_info.device)
+    return ports
+
+
+class devicePool():
+    def __init__(self, verbose=False):
+        self.verboseEnabled = verbose
+        self.devices = {}   # port: tinySA
+        self.info = {}      # port: {"port", "device_id", "version"}
+        self.executor = None
+
+    def __len__(self):
+        return len(self.devices)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.disconnect_all()
+
+    def print_message(self, msg):
+        if self.verboseEnabled == True:
+            print(msg)
+
+    def ports(self):
+        return list(self.devices.keys())
+
+######################################################################
+# Connecting
+######################################################################
+
+    def connect_all(self, ports=None, timeout=1, deviceType=None):
+        # connects to every port in ports, or every attached tinySA if None.
+        # each device is identified with deviceid and version
+        # deviceType: optional preset name passed to set_device_type()
+        # returns: number of devices connected
+        if ports == None:
+            ports = find_ports()
+        for port in ports:
+            if port in self.devices:
+                continue
+            tsa = tinySA()
+            tsa.set_verbose(self.verboseEnabled)
+            if tsa.connect(port, timeout) == False:
+                continue
+            if deviceType != None:
+                tsa.set_device_type(deviceType)
+            self.add_device(port, tsa)
+        self.print_message(str(len(self.devices)) + " tinySA device(s) connected")
+        return len(self.devices)
+
+    def add_device(self, port, tsa):
+        # adds an already connected tinySA object to the pool
+        self.devices[port] = tsa
+        self.info[port] = {"port": port,
+                           "device_id": self.read_device_id(tsa),
+                           "version": self.read_version(tsa)}
+        if self.executor != None:
+            # resized on the next run
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def read_device_id(self, tsa):
+        # the user settable device ID as an int, None if not set or unreadable
+        msgbytes = tsa.device_id()
+        found = re.search(rb'(\d+)', bytes(msgbytes))
+        if found == None:
+            return None
+        return int(found.group(1))
+
+    def read_version(self, tsa):
+        # first line of the version text
+        msgbytes = bytes(tsa.version()).strip()
+        return msgbytes.split(b'\r\n')[0].decode('utf-8', errors='replace')
+
+    def disconnect_all(self):
+        for port, tsa in self.devices.items():
+            try:
+                tsa.disconnect()
+            except Exception as err:
+                self.print_message("ERROR: could not close " + str(port))
+                self.print_message(err)
+        self.devices = {}
+        self.info = {}
+        if self.executor != None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+######################################################################
+# Running on every device
+######################################################################
+
+    def run(self, func, *args, **kwargs):
+        # calls func(tsa, *args, **kwargs) for every device at the same time.
+        # returns: {port: return value}. None for a device that raised
+        return self.run_each(lambda port, tsa: func(tsa, *args, **kwargs))
+
+    def run_each(self, func):
+        # calls func(port, tsa) for every device at the same time.
+        # returns: {port: return value}. None for a device that raised
+        if len(self.devices) == 0:
+            return {}
+        if self.executor == None:
+            self.executor = ThreadPoolExecutor(max_workers=len(self.devices))
+        futures = {}
+        for port, tsa in self.devices.items():
+            futures[port] = self.executor.submit(func, port, tsa)
+        results = {}
+        for port, future in futures.items():
+            try:
+                results[port] = future.result()
+            except Exception as err:
+                self.print_message("ERROR: " + str(port) + " failed")
+                self.print_message(err)
+                results[port] = None
+        return results
+
+    def command(self, name, *args, **kwargs):
+        # calls the tinySA function called name on every device.
+        #   pool.command("rbw", 10)
+        # returns: {port: return value}
+        return self.run(lambda tsa: getattr(tsa, name)(*args, **kwargs))
+
+    def tag(self, results):
+        # adds the device identity to the settings of sweep results
+        for port, res in results.items():
+            if (res != None) and hasattr(res, "settings"):
+                res.settings.update(self.info[port])
+        return results
+
+    def scan_raw_arrays(self, start, stop, pts=250, unbuf=1, outs=None):
+        # one scanraw sweep on every device. see tinySA.scan_raw_arrays()
+        # outs: optional {port: sweepResult} to reuse
+        # returns: {port: sweepResult}
+        if outs == None:
+            outs = {}
+        return self.tag(self.run_each(lambda port, tsa: tsa.scan_raw_arrays(start, stop, pts, unbuf, outs.get(port))))
+
+    def scan_arrays(self, start, stop, pts=250, outs=None):
+        # one scan sweep on every device. see tinySA.scan_arrays()
+        # returns: {port: sweepResult}
+        if outs == None:
+            outs = {}
+        return self.tag(self.run_each(lambda port, tsa: tsa.scan_arrays(start, stop, pts, outs.get(port))))
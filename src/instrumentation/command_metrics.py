@@ -0,0 +1,265 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  command_metrics.py
+#
+#   Per command metrics for tinySA_serial() and tinySA_serial_binary().
+#   For each command verb (the first word of the command):
+#       count, errors, bytes written, bytes read,
+#       time to first byte (write to the first byte of the response),
+#       time to prompt (write to the end of the response)
+#   The times go into latencyHistograms, which bucket values the way
+#   HDR histograms do: 64 linear buckets per power of two, so every
+#   value is kept to within 1/64 (1.6%) in a fixed amount of memory,
+#   and recording one is a few integer operations.
+#
+#   Hooks are functions called with a commandEvent after every
+#   command, for logging or sending the numbers somewhere else.
+#
+#   Nothing is measured unless metrics are enabled on the tinySA
+#   object (tinySA.enable_metrics()). When disabled, the only cost
+#   is one check in tinySA_serial().
+#
+#   Errors are exceptions, responses shorter than their binary size,
+#   'usage: ...' responses and '<command>?' (unknown command).
+##--------------------------------------------------------------------\
+
+import threading
+import time
+
+SUB_BITS = 6                    # 64 sub buckets, 1/64 precision
+SUB_COUNT = 1 << SUB_BITS
+MAX_SHIFT = 40                  # values up to 2^46 ns (about 19 hours)
+
+
+class latencyHistogram():
+    def __init__(self):
+        # values are recorded in nanoseconds
+        self.counts = [0] * (SUB_COUNT * (MAX_SHIFT + 2))
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def index(self, value):
+        shift = value.bit_length() - SUB_BITS - 1
+        if shift < 0:
+            return value
+        shift = min(shift, MAX_SHIFT)
+        return SUB_COUNT * (shift + 1) + min(value >> shift, 2*SUB_COUNT - 1) - SUB_COUNT
+
+    def bucket_value(self, i):
+        # highest value in bucket i
+        if i < 2*SUB_COUNT:
+            return i
+        shift = i // SUB_COUNT - 1
+        sub = i % SUB_COUNT + SUB_COUNT
+        return ((sub + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = int(seconds * 1e9)
+        if value < 0:
+            value = 0
+        self.counts[self.index(value)] += 1
+        self.count = self.count + 1
+        self.total = self.total + value
+        if (self.min == None) or (value < self.min):
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        # value (seconds) at or below which p percent of the values are
+        if self.count == 0:
+            return None
+        target = max(1, int(round(self.count * p / 100.0)))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen = seen + c
+            if seen >= target:
+                return min(self.bucket_value(i), self.max) / 1e9
+        return self.max / 1e9
+
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.total / self.count / 1e9
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            if c:
+                self.counts[i] += c
+        self.count = self.count + other.count
+        self.total = self.total + other.total
+        if (other.min != None) and ((self.min == None) or (other.min < self.min)):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+
+    def copy(self):
+        h = latencyHistogram()
+        h.counts = list(self.counts)
+        h.count = self.count
+        h.total = self.total
+        h.min = self.min
+        h.max = self.max
+        return h
+
+    def summary(self):
+        # seconds
+        return {"count": self.count, "mean": self.mean(),
+                "min": None if self.min == None else self.min / 1e9,
+                "p50": self.percentile(50), "p90": self.percentile(90),
+                "p99": self.percentile(99), "p999": self.percentile(99.9),
+                "max": self.max / 1e9 if self.count > 0 else None}
+
+
+class commandStats():
+    # totals for one command verb
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytesWritten = 0
+        self.bytesRead = 0
+        self.firstByte = latencyHistogram()
+        self.prompt = latencyHistogram()
+
+    def copy(self):
+        s = commandStats()
+        s.count = self.count
+        s.errors = self.errors
+        s.bytesWritten = self.bytesWritten
+        s.bytesRead = self.bytesRead
+        s.firstByte = self.firstByte.copy()
+        s.prompt = self.prompt.copy()
+        return s
+
+    def summary(self):
+        return {"count": self.count, "errors": self.errors,
+                "bytes_written": self.bytesWritten, "bytes_read": self.bytesRead,
+                "first_byte": self.firstByte.summary(), "prompt": self.prompt.summary()}
+
+
+class commandEvent():
+    # one measured command, passed to the hooks
+    def __init__(self, verb, writebyte, start):
+        self.verb = verb
+        self.command = writebyte
+        self.start = start          # time.perf_counter() at the write
+        self.firstByte = None       # seconds from the write, None if not measured
+        self.duration = None        # seconds from the write to the end of the response
+        self.bytesWritten = 0
+        self.bytesRead = 0
+        self.error = None           # None, or what went wrong
+        self.binary = False
+
+    def __repr__(self):
+        return "commandEvent(" + self.verb + ", " + str(self.duration) + " s, error=" + str(self.error) + ")"
+
+
+class commandMetrics():
+    def __init__(self):
+        self.stats = {}     # verb: commandStats
+        self.hooks = []
+        self.lock = threading.Lock()
+
+    def add_hook(self, hook):
+        # hook: function(commandEvent) called after every measured command,
+        #   from the thread that sent it. keep it short
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        if hook in self.hooks:
+            self.hooks.remove(hook)
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+
+    def command(self, tsa, writebyte, read, write=True, size=None):
+        # sends writebyte (if write) and returns read(), measuring both.
+        # read: function that reads the response, such as tsa.read_response
+        # size: expected length of a binary response, to count short ones as errors
+        words = writebyte.split()
+        event = commandEvent(words[0] if len(words) > 0 else "", writebyte, time.perf_counter())
+        event.binary = size != None
+        event.bytesWritten = len(writebyte)
+        reader = None
+        unread = 0
+        received = 0
+        if write == True:
+            reader = tsa.stream_reader()
+            unread = len(reader)
+            received = reader.rxBuf.received
+            tsa.ser.write(bytes(writebyte, 'utf-8'))
+            # wait (up to the serial timeout) for the first new byte.
+            # it stays in the buffer for read()
+            if reader.fill() > 0:
+                event.firstByte = time.perf_counter() - event.start
+        try:
+            msgbytes = read()
+        except Exception as err:
+            event.error = err
+            self.finish(event, reader, unread, received)
+            raise
+        self.check(event, msgbytes, size)
+        if (reader == None) and isinstance(msgbytes, (bytes, bytearray, memoryview)):
+            event.bytesRead = len(msgbytes)
+        self.finish(event, reader, unread, received)
+        return msgbytes
+
+    def check(self, event, msgbytes, size):
+        if size != None:
+            if (msgbytes is False) or (msgbytes is None):
+                event.error = "incomplete response"
+            elif isinstance(msgbytes, (bytes, bytearray, memoryview)) and (len(msgbytes) < size):
+                event.error = "incomplete response"
+            return
+        if not(isinstance(msgbytes, (bytes, bytearray, memoryview))):
+            return
+        head = bytes(msgbytes[:64])
+        if head.startswith(b'usage:'):
+            event.error = "usage"
+        elif head.rstrip(b'\r\n') == bytes(event.verb, 'utf-8') + b'?':
+            event.error = "unknown command"
+
+    def finish(self, event, reader, unread, received):
+        event.duration = time.perf_counter() - event.start
+        if reader != None:
+            # bytes taken from the port for this response
+            event.bytesRead = (reader.rxBuf.received - received) - (len(reader) - unread)
+        with self.lock:
+            stats = self.stats.get(event.verb)
+            if stats == None:
+                stats = commandStats()
+                self.stats[event.verb] = stats
+            stats.count = stats.count + 1
+            stats.bytesWritten = stats.bytesWritten + event.bytesWritten
+            stats.bytesRead = stats.bytesRead + event.bytesRead
+            if event.error != None:
+                stats.errors = stats.errors + 1
+            if event.firstByte != None:
+                stats.firstByte.record(event.firstByte)
+            stats.prompt.record(event.duration)
+        for hook in self.hooks:
+            hook(event)
+
+    def snapshot(self):
+        # copies of the commandStats by verb, taken under the lock
+        with self.lock:
+            return {verb: s.copy() for verb, s in self.stats.items()}
+
+    def summary(self):
+        # counts, bytes and latency percentiles (seconds) by verb
+        return {verb: s.summary() for verb, s in self.snapshot().items()}
+
+    def total(self):
+        # commandStats of every verb together
+        total = commandStats()
+        for s in self.snapshot().values():
+            total.count = total.count + s.count
+            total.errors = total.errors + s.errors
+            total.bytesWritten = total.bytesWritten + s.bytesWritten
+            total.bytesRead = total.bytesRead + s.bytesRead
+            total.firstByte.merge(s.firstByte)
+            total.prompt.merge(s.prompt)
+        return total
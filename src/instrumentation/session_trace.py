@@ -0,0 +1,166 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  session_trace.py
+#
+#   Timeline of an acquisition session in the Chrome trace event
+#   format, which opens in Perfetto (https://ui.perfetto.dev) and
+#   chrome://tracing. Each span has its thread id, so the serial
+#   writes, the waits and reads on the port, the decoding and any
+#   processing done with the results can be seen side by side.
+#
+#   A tracer is enabled on a tinySA object with enable_tracing(). It
+#   wraps the methods of that object (and the write of its port and
+#   the fill of its stream reader) with spans, and disable_tracing()
+#   puts them back, so nothing is added when tracing is off.
+#   Processing stages are added with tracer.span():
+#       with tracer.span("find peaks"):
+#           ...
+##--------------------------------------------------------------------\
+
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+# tinySA methods traced, by category
+TRACED_METHODS = {
+    "command": ["tinySA_serial", "tinySA_serial_binary"],
+    "serial": ["read_response", "read_binary_response", "get_serial_return",
+               "get_serial_view", "get_serial_until", "get_serial_sized",
+               "read_until_end_marker"],
+    "decode": ["clean_return"],
+    "sweep": ["scan", "scan_raw", "scan_arrays", "scan_raw_array", "scan_raw_arrays",
+              "scan_segmented", "scan_adaptive", "data", "frequencies",
+              "capture", "capture_array", "capture_png"],
+}
+
+
+class sessionTracer():
+    def __init__(self, maxEvents=1000000):
+        # maxEvents: events kept. later ones are counted in 'dropped'
+        self.maxEvents = maxEvents
+        self.events = []    # (name, category, start ns, end ns, tid, args)
+        self.threadNames = {}
+        self.dropped = 0
+        self.t0 = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+
+    def add(self, name, cat, start, end, args=None):
+        # records a span. start, end: time.perf_counter_ns()
+        tid = threading.get_ident()
+        with self.lock:
+            if len(self.events) >= self.maxEvents:
+                self.dropped = self.dropped + 1
+                return
+            if not(tid in self.threadNames):
+                self.threadNames[tid] = threading.current_thread().name
+            self.events.append((name, cat, start, end, tid, args))
+
+    @contextmanager
+    def span(self, name, cat="user", args=None):
+        # times the code in a with block
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add(name, cat, start, time.perf_counter_ns(), args)
+
+    def instant(self, name, cat="user", args=None):
+        # an event with no duration, such as a dropped sweep
+        now = time.perf_counter_ns()
+        self.add(name, cat, now, None, args)
+
+    def wrap(self, func, name, cat, argsFunc=None):
+        # func with every call recorded as a span.
+        # argsFunc: optional function(*args) returning the span args
+        def traced(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(name, cat, start, time.perf_counter_ns(),
+                         argsFunc(*args) if argsFunc != None else None)
+        traced.traced = func
+        return traced
+
+    def clear(self):
+        with self.lock:
+            self.events = []
+            self.dropped = 0
+
+######################################################################
+# Export
+######################################################################
+
+    def trace_events(self):
+        # the events as Chrome trace event dicts. times in microseconds
+        with self.lock:
+            events = list(self.events)
+            names = dict(self.threadNames)
+        out = [{"name": "process_name", "ph": "M", "pid": self.pid, "tid": 0,
+                "args": {"name": "tinySA_python"}}]
+        for tid, name in names.items():
+            out.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid,
+                        "args": {"name": name}})
+        for name, cat, start, end, tid, args in events:
+            event = {"name": name, "cat": cat, "pid": self.pid, "tid": tid,
+                     "ts": (start - self.t0) / 1000.0}
+            if end == None:
+                event["ph"] = "i"
+                event["s"] = "t"
+            else:
+                event["ph"] = "X"
+                event["dur"] = (end - start) / 1000.0
+            if args != None:
+                event["args"] = args
+            out.append(event)
+        return out
+
+    def write(self, filename):
+        # writes the trace as JSON. returns the number of events written
+        events = self.trace_events()
+        with open(filename, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms",
+                       "otherData": {"dropped": self.dropped}}, f)
+        return len(events)
+
+######################################################################
+# Tracing a tinySA object
+######################################################################
+
+    def attach(self, tsa):
+        # wraps the methods of tsa, the write of its port and the
+        # fill of its stream reader
+        for cat, methods in TRACED_METHODS.items():
+            for method in methods:
+                argsFunc = None
+                if cat == "command":
+                    argsFunc = lambda writebyte, *args: {"command": writebyte.strip()}
+                setattr(tsa, method, self.wrap(getattr(tsa, method), method, cat, argsFunc))
+        # decoding handlers run inside read_binary_response
+        read_binary = tsa.read_binary_response
+        def read_binary_response(size, payload_size=None, handler=None):
+            if handler != None:
+                handler = self.wrap(handler, "decode", "decode")
+            return read_binary(size, payload_size, handler)
+        tsa.read_binary_response = read_binary_response
+        if tsa.ser != None:
+            tsa.ser.write = self.wrap(tsa.ser.write, "serial write", "io",
+                                      lambda data: {"bytes": len(data)})
+            reader = tsa.stream_reader()
+            reader.fill = self.wrap(reader.fill, "serial read", "io")
+
+    def detach(self, tsa):
+        # removes what attach() added
+        for methods in TRACED_METHODS.values():
+            for method in methods:
+                tsa.__dict__.pop(method, None)
+        tsa.__dict__.pop("read_binary_response", None)
+        if tsa.ser != None:
+            if hasattr(tsa.ser.__dict__.get("write"), "traced"):
+                del tsa.ser.write
+            if (tsa.reader != None) and hasattr(tsa.reader.__dict__.get("fill"), "traced"):
+                del tsa.reader.fill
@@ -0,0 +1,189 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  spectrogram.py
+#
+#   Fixed size ring buffer of sweeps (sweeps x bins) for waterfall
+#   plots and long recordings. Memory use does not grow: when the
+#   ring is full, the oldest sweep is overwritten.
+#
+#   The levels can be kept as float32 dBm, or as uint16 in the raw
+#   scanraw units (half the size, dBm = raw / scale - offset). With a
+#   filename, the ring is an np.memmap on disk and survives restarts.
+#
+#   Every sweep is written twice, at its slot and at slot + capacity,
+#   so the most recent N sweeps are always one contiguous block and
+#   latest(N) returns a view without copying. The buffer is 2x the
+#   capacity for this.
+##--------------------------------------------------------------------\
+
+import json
+import os
+
+import numpy as np
+
+try:
+    from src.data_decode.scanraw_decode import scanraw_levels
+except:
+    from data_decode.scanraw_decode import scanraw_levels
+
+DTYPES = {"float32": np.float32, "uint16": np.uint16}
+
+
+class spectrogramRing():
+    def __init__(self, capacity, bins, dtype="float32", filename=None, scale=32, offset=174,
+                 start=None, stop=None):
+        # capacity: number of sweeps kept
+        # bins: points per sweep
+        # dtype: "float32" (dBm) | "uint16" (raw scanraw units)
+        # filename: optional file for an np.memmap. an existing ring with
+        #   the same capacity, bins and dtype is reopened, otherwise it is replaced
+        # scale, offset: raw to dBm, from the device preset
+        # start, stop: optional sweep frequencies (Hz), kept with the data
+        if not(dtype in DTYPES):
+            raise ValueError("dtype must be 'float32' or 'uint16'")
+        self.capacity = int(capacity)
+        self.bins = int(bins)
+        self.dtype = dtype
+        self.filename = filename
+        self.scale = scale
+        self.offset = offset
+        self.start = start
+        self.stop = stop
+        self.head = 0       # next slot to write
+        self.count = 0      # sweeps held
+        self.appended = 0   # sweeps ever appended
+
+        shape = (2*self.capacity, self.bins)
+        if filename == None:
+            self.levels = np.zeros(shape, dtype=DTYPES[dtype])
+            self.timestamps = np.zeros(2*self.capacity, dtype=np.float64)
+        else:
+            reopen = self.load_meta() and os.path.exists(self.levels_file()) and \
+                     os.path.exists(self.time_file())
+            mode = 'r+' if reopen else 'w+'
+            self.levels = np.memmap(self.levels_file(), dtype=DTYPES[dtype], mode=mode, shape=shape)
+            self.timestamps = np.memmap(self.time_file(), dtype=np.float64, mode=mode, shape=(2*self.capacity,))
+            if reopen == False:
+                self.head = 0
+                self.count = 0
+                self.appended = 0
+                self.save_meta()
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+######################################################################
+# Files
+######################################################################
+
+    def levels_file(self):
+        return self.filename
+
+    def time_file(self):
+        return self.filename + ".time"
+
+    def meta_file(self):
+        return self.filename + ".json"
+
+    def load_meta(self):
+        # reads head/count from the metadata file of an existing ring.
+        # returns False if there is none or it does not match
+        try:
+            with open(self.meta_file(), 'r') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if (meta.get("capacity") != self.capacity) or (meta.get("bins") != self.bins) \
+            or (meta.get("dtype") != self.dtype):
+            return False
+        self.head = meta["head"]
+        self.count = meta["count"]
+        self.appended = meta["appended"]
+        for key in ["scale", "offset", "start", "stop"]:
+            if meta.get(key) != None:
+                setattr(self, key, meta[key])
+        return True
+
+    def save_meta(self):
+        meta = {"capacity": self.capacity, "bins": self.bins, "dtype": self.dtype,
+                "head": self.head, "count": self.count, "appended": self.appended,
+                "scale": self.scale, "offset": self.offset, "start": self.start, "stop": self.stop}
+        with open(self.meta_file(), 'w') as f:
+            json.dump(meta, f)
+
+    def flush(self):
+        # writes the memmap and the ring position to disk
+        if self.filename != None:
+            self.levels.flush()
+            self.timestamps.flush()
+            self.save_meta()
+
+    def close(self):
+        self.flush()
+
+######################################################################
+# Appending
+######################################################################
+
+    def append(self, levels, timestamp=0.0):
+        # adds one sweep, overwriting the oldest when full. O(1) in the
+        # number of sweeps held
+        # levels: bins values in dBm (float) or raw units (uint16)
+        row = self.levels[self.head]
+        if (self.dtype == "uint16") and (np.asarray(levels).dtype != np.uint16):
+            # dBm to raw units
+            raw = (np.asarray(levels, dtype=np.float32) + np.float32(self.offset)) * np.float32(self.scale)
+            np.rint(np.clip(raw, 0, 65535), out=row, casting='unsafe')
+        elif (self.dtype == "float32") and (np.asarray(levels).dtype == np.uint16):
+            # raw units to dBm
+            np.multiply(levels, np.float32(1.0/self.scale), out=row, casting='unsafe')
+            np.subtract(row, np.float32(self.offset), out=row)
+        else:
+            row[:] = levels
+        self.commit(timestamp)
+
+    def append_scanraw(self, frame, timestamp=0.0):
+        # adds one sweep from a scanraw frame (with or without '{' and '}')
+        self.append(scanraw_levels(frame, self.bins), timestamp)
+
+    def commit(self, timestamp):
+        # mirrors the row at head and moves to the next slot
+        self.levels[self.head + self.capacity] = self.levels[self.head]
+        self.timestamps[self.head] = timestamp
+        self.timestamps[self.head + self.capacity] = timestamp
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.appended = self.appended + 1
+
+######################################################################
+# Reading
+######################################################################
+
+    def latest(self, n=None):
+        # view of the most recent n sweeps (all held if None), oldest first.
+        # returns: levels (n, bins), timestamps (n,). no copy is made, so
+        #   they change as sweeps are appended
+        if (n == None) or (n > self.count):
+            n = self.count
+        end = self.head + self.capacity
+        return self.levels[end-n:end], self.timestamps[end-n:end]
+
+    def latest_dbm(self, n=None):
+        # latest() levels in dBm. a view for float32 rings, a new array for uint16
+        levels, timestamps = self.latest(n)
+        if self.dtype == "float32":
+            return levels, timestamps
+        return levels.astype(np.float32) / np.float32(self.scale) - np.float32(self.offset), timestamps
+
+    def frequencies(self):
+        # frequencies of the bins, if start and stop are known
+        if (self.start == None) or (self.stop == None):
+            return None
+        return np.linspace(self.start, self.stop, self.bins)
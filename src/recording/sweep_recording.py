@@ -0,0 +1,362 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  sweep_recording.py
+#
+#   Append-only binary recording of sweeps, with an index file for
+#   seeking by time or by sweep number without reading the recording.
+#
+#   Recording file:
+#       file header (32 bytes):
+#           'TSASWEEP' version dtype scale offset (padding)
+#       one record per sweep, back to back:
+#           record header (48 bytes, little endian):
+#               'SWP1' payload_size timestamp start stop pts rbw attenuation (padding)
+#           levels: pts float32 (dBm) or uint16 (raw scanraw units)
+#   Index file (filename + ".idx"):
+#       one (timestamp float64, offset uint64) entry per sweep
+#
+#   rbw (kHz) and attenuation (dB) are NaN when they are not known,
+#   or set to auto. The index is memory mapped by the reader, so the
+#   n-th sweep is one lookup and a time is a binary search over the
+#   timestamps. Timestamps are expected to be in increasing order.
+#   When a recording is opened to append to, the index is checked
+#   against it. After a crash, a record cut off at the end is removed
+#   and an index that is missing or does not match is rebuilt, so new
+#   sweeps follow the last complete record. rebuild_index() does the
+#   same for the index without changing the recording.
+##--------------------------------------------------------------------\
+
+import math
+import os
+import struct
+
+import numpy as np
+
+try:
+    from src.sweep.sweep_result import sweepResult
+except:
+    from sweep.sweep_result import sweepResult
+
+FILE_MAGIC = b'TSASWEEP'
+FILE_VERSION = 1
+FILE_HEADER = struct.Struct('<8sHHff12x')                # 32 bytes
+RECORD_MAGIC = b'SWP1'
+RECORD_HEADER = struct.Struct('<4sIdqqIff4x')            # 48 bytes
+INDEX_DTYPE = np.dtype([("timestamp", "<f8"), ("offset", "<u8")])
+
+DTYPE_CODES = {"float32": 0, "uint16": 1}
+DTYPE_NAMES = {0: "float32", 1: "uint16"}
+LEVEL_DTYPES = {"float32": np.dtype("<f4"), "uint16": np.dtype("<u2")}
+
+
+def index_file(filename):
+    return filename + ".idx"
+
+
+def cached_value(tsa, stateKey):
+    # value of a setting from the state cache of a tinySA object,
+    # such as 'rbw 100\r\n' -> 100.0. NaN if it is not known or auto
+    if tsa == None:
+        return float('nan')
+    writebyte = tsa.stateCache.get(stateKey)
+    if writebyte == None:
+        return float('nan')
+    try:
+        return float(writebyte.split()[-1])
+    except ValueError:
+        return float('nan')
+
+
+def scan_records(filename):
+    # reads the record headers of a recording. a record cut off at the
+    # end of the file is left out.
+    # returns the (timestamp, offset) of each record, and where the
+    # last complete record ends
+    entries = []
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        offset = FILE_HEADER.size
+        while offset + RECORD_HEADER.size <= size:
+            f.seek(offset)
+            magic, payload, timestamp = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))[:3]
+            if (magic != RECORD_MAGIC) or (offset + RECORD_HEADER.size + payload > size):
+                break
+            entries.append((timestamp, offset))
+            offset = offset + RECORD_HEADER.size + payload
+    return entries, offset
+
+
+def rebuild_index(filename):
+    # writes the index file again from the records in the recording.
+    # a record cut off at the end of the file is left out.
+    # returns the number of sweeps indexed
+    entries, end = scan_records(filename)
+    np.array(entries, dtype=INDEX_DTYPE).tofile(index_file(filename))
+    return len(entries)
+
+
+def index_matches(filename):
+    # True if the index has an entry for every record and the last
+    # entry is a complete record that ends at the end of the recording.
+    # only the last record is read, so this is quick for long recordings
+    size = os.path.getsize(filename)
+    if not(os.path.exists(index_file(filename))):
+        return False
+    indexSize = os.path.getsize(index_file(filename))
+    if indexSize % INDEX_DTYPE.itemsize != 0:
+        return False
+    if indexSize == 0:
+        return size == FILE_HEADER.size
+    with open(index_file(filename), 'rb') as f:
+        f.seek(indexSize - INDEX_DTYPE.itemsize)
+        offset = int(np.frombuffer(f.read(INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)[0]["offset"])
+    if offset + RECORD_HEADER.size > size:
+        return False
+    with open(filename, 'rb') as f:
+        f.seek(offset)
+        magic, payload = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))[:2]
+    return (magic == RECORD_MAGIC) and (offset + RECORD_HEADER.size + payload == size)
+
+
+def recover(filename):
+    # makes a recording ready to append to after a crash. a record cut
+    # off at the end of the recording is removed, and the index is
+    # rebuilt if it does not match the records.
+    # returns the number of sweeps in the recording
+    if index_matches(filename):
+        return os.path.getsize(index_file(filename)) // INDEX_DTYPE.itemsize
+    entries, end = scan_records(filename)
+    if end < os.path.getsize(filename):
+        with open(filename, 'r+b') as f:
+            f.truncate(end)
+    np.array(entries, dtype=INDEX_DTYPE).tofile(index_file(filename))
+    return len(entries)
+
+
+class sweepRecorder():
+    def __init__(self, filename, dtype="float32", scale=32, offset=174, bufferSize=1<<20):
+        # filename: recording to create, or to append to if it exists
+        # dtype: "float32" (dBm) | "uint16" (raw scanraw units, half the size)
+        # scale, offset: raw to dBm, from the device preset
+        # bufferSize: write buffer in bytes. records reach the disk when
+        #   it fills up, on flush() and on close()
+        if not(dtype in DTYPE_CODES):
+            raise ValueError("dtype must be 'float32' or 'uint16'")
+        self.filename = filename
+        self.dtype = dtype
+        self.scale = scale
+        self.offset = offset
+        self.levelDtype = LEVEL_DTYPES[dtype]
+
+        if os.path.exists(filename) and os.path.getsize(filename) >= FILE_HEADER.size:
+            # appending. the settings of the existing file are kept
+            with open(filename, 'rb') as f:
+                magic, version, code, scale, offset = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+            if magic != FILE_MAGIC:
+                raise ValueError(filename + " is not a sweep recording")
+            self.dtype = DTYPE_NAMES[code]
+            self.levelDtype = LEVEL_DTYPES[self.dtype]
+            self.scale = scale
+            self.offset = offset
+            recover(filename)
+            self.dataFile = open(filename, 'ab', buffering=bufferSize)
+        else:
+            self.dataFile = open(filename, 'wb', buffering=bufferSize)
+            self.dataFile.write(FILE_HEADER.pack(FILE_MAGIC, FILE_VERSION, DTYPE_CODES[dtype], scale, offset))
+            open(index_file(filename), 'wb').close()
+        self.indexFile = open(index_file(filename), 'ab', buffering=bufferSize)
+        self.position = self.dataFile.tell()
+        self.count = os.path.getsize(index_file(filename)) // INDEX_DTYPE.itemsize
+        self.entry = np.zeros(1, dtype=INDEX_DTYPE)
+
+    def __len__(self):
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def write(self, levels, timestamp, start, stop, rbw=float('nan'), attenuation=float('nan')):
+        # appends one sweep. levels are dBm (float) or raw units (uint16),
+        # and are converted to the dtype of the recording if needed.
+        # returns the sweep number
+        levels = np.asarray(levels)
+        if (self.dtype == "uint16") and (levels.dtype != np.uint16):
+            raw = (levels.astype(np.float32) + np.float32(self.offset)) * np.float32(self.scale)
+            levels = np.rint(np.clip(raw, 0, 65535)).astype(self.levelDtype)
+        elif (self.dtype == "float32") and (levels.dtype == np.uint16):
+            levels = levels.astype(np.float32) / np.float32(self.scale) - np.float32(self.offset)
+        elif levels.dtype != self.levelDtype:
+            levels = levels.astype(self.levelDtype)
+        pts = len(levels)
+        payload = pts * self.levelDtype.itemsize
+        self.dataFile.write(RECORD_HEADER.pack(RECORD_MAGIC, payload, timestamp, int(start), int(stop),
+                                               pts, rbw, attenuation))
+        self.dataFile.write(levels.data)
+        self.entry[0] = (timestamp, self.position)
+        self.indexFile.write(self.entry.data)
+        self.position = self.position + RECORD_HEADER.size + payload
+        self.count = self.count + 1
+        return self.count - 1
+
+    def write_sweep(self, result, tsa=None):
+        # appends a sweepResult from scan_arrays(), scan_raw_arrays() or
+        # a sweepStream. the rbw and attenuation come from the state
+        # cache of tsa, if given
+        start = result.settings.get("start", result.frequencies[0] if len(result) > 0 else 0)
+        stop = result.settings.get("stop", result.frequencies[-1] if len(result) > 0 else 0)
+        return self.write(result.levels, result.timestamp, start, stop,
+                          cached_value(tsa, 'rbw'), cached_value(tsa, 'attenuate'))
+
+    def flush(self):
+        # the recording is written before the index, so an index entry
+        # never points past the end of the recording
+        self.dataFile.flush()
+        self.indexFile.flush()
+
+    def close(self):
+        if self.dataFile.closed == False:
+            self.flush()
+            self.dataFile.close()
+            self.indexFile.close()
+
+
+class sweepRecording():
+    def __init__(self, filename):
+        # opens a recording for reading. both files are memory mapped,
+        # so only the sweeps that are read are loaded from disk
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            magic, version, code, scale, offset = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != FILE_MAGIC:
+            raise ValueError(filename + " is not a sweep recording")
+        self.version = version
+        self.dtype = DTYPE_NAMES[code]
+        self.levelDtype = LEVEL_DTYPES[self.dtype]
+        self.scale = scale
+        self.offset = offset
+        self.data = None
+        self.index = None
+        self.reload()
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        return self.read(i)
+
+    def __iter__(self):
+        return self.sweeps()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def reload(self):
+        # maps the files again, to see the sweeps appended since opening.
+        # only index entries with a complete record are used
+        size = os.path.getsize(self.filename)
+        self.data = np.memmap(self.filename, dtype=np.uint8, mode='r', shape=(size,))
+        count = 0
+        if os.path.exists(index_file(self.filename)):
+            count = os.path.getsize(index_file(self.filename)) // INDEX_DTYPE.itemsize
+        if count > 0:
+            self.index = np.memmap(index_file(self.filename), dtype=INDEX_DTYPE, mode='r', shape=(count,))
+        else:
+            self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        while (count > 0) and (self.record_end(count - 1) > size):
+            count = count - 1
+        self.index = self.index[:count]
+        self.timestamps = self.index["timestamp"]
+
+    def close(self):
+        self.data = None
+        self.index = np.zeros(0, dtype=INDEX_DTYPE)
+        self.timestamps = self.index["timestamp"]
+
+    def record_end(self, i):
+        offset = int(self.index[i]["offset"])
+        if offset + RECORD_HEADER.size > len(self.data):
+            return offset + RECORD_HEADER.size
+        return offset + RECORD_HEADER.size + self.header(i)[1]
+
+    def header(self, i):
+        # the record header of sweep i as a tuple
+        offset = int(self.index[i]["offset"])
+        return RECORD_HEADER.unpack_from(self.data, offset)
+
+######################################################################
+# Seeking
+######################################################################
+
+    def find_time(self, timestamp):
+        # number of the first sweep at or after timestamp. len() if none
+        return int(np.searchsorted(self.timestamps, timestamp, side='left'))
+
+    def between(self, t0, t1):
+        # range of the sweep numbers from t0 up to (not including) t1
+        return range(self.find_time(t0), self.find_time(t1))
+
+    def time_range(self):
+        # (first, last) timestamps, or None if empty
+        if len(self) == 0:
+            return None
+        return float(self.timestamps[0]), float(self.timestamps[-1])
+
+######################################################################
+# Reading
+######################################################################
+
+    def levels(self, i):
+        # the stored levels of sweep i, as a view of the file. float32
+        # dBm or uint16 raw units, depending on the recording
+        magic, payload, timestamp, start, stop, pts, rbw, att = self.header(i)
+        offset = int(self.index[i]["offset"]) + RECORD_HEADER.size
+        return np.frombuffer(self.data, dtype=self.levelDtype, count=pts, offset=offset)
+
+    def read(self, i, out=None):
+        # sweep i as a sweepResult with the levels in dBm.
+        # out: optional sweepResult to reuse
+        if i < 0:
+            i = i + len(self)
+        if not(0 <= i < len(self)):
+            raise IndexError("sweep " + str(i) + " is not in the recording")
+        magic, payload, timestamp, start, stop, pts, rbw, att = self.header(i)
+        levels = self.levels(i)
+        if out is None:
+            out = sweepResult(pts)
+        out.reserve(pts)
+        if self.dtype == "uint16":
+            np.multiply(levels, np.float32(1.0/self.scale), out=out.levels, casting='unsafe')
+            np.subtract(out.levels, np.float32(self.offset), out=out.levels)
+        else:
+            out.levels[:] = levels
+        out.valid[:] = True
+        out.set_grid(start, stop, pts)
+        out.timestamp = timestamp
+        out.settings = {"start": start, "stop": stop, "pts": pts, "sweep": i}
+        if not(math.isnan(rbw)):
+            out.settings["rbw"] = rbw
+        if not(math.isnan(att)):
+            out.settings["attenuation"] = att
+        return out
+
+    def sweeps(self, first=0, last=None, out=None):
+        # generator of the sweeps from first up to (not including) last.
+        # out: optional sweepResult that is filled and yielded every time.
+        #   use out.copy() to keep a sweep
+        if last == None:
+            last = len(self)
+        for i in range(first, last):
+            yield self.read(i, out)
+
+    def sweeps_between(self, t0, t1, out=None):
+        # generator of the sweeps from t0 up to (not including) t1
+        r = self.between(t0, t1)
+        return self.sweeps(r.start, r.stop, out)
@@ -0,0 +1,52 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  png_writer.py
+#
+#   Minimal PNG encoder using zlib from the standard library, so
+#   screen captures can be saved without Pillow. Writes 8 bit RGB or
+#   RGBA images, no filtering, one IDAT chunk.
+#   https://www.w3.org/TR/png/
+##--------------------------------------------------------------------\
+
+import struct
+import zlib
+
+import numpy as np
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+COLOR_TYPES = {1: 0, 3: 2, 4: 6}    # channels: PNG color type (gray, RGB, RGBA)
+
+
+def png_chunk(tag, data):
+    # length, type, data, crc of type and data
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+
+def encode_png(img, level=6):
+    # img: (height, width, 3|4) or (height, width) uint8 array
+    # level: zlib compression level 0-9. screen captures are mostly
+    #   flat colors and compress well even at low levels
+    # returns: PNG file contents as bytes
+    img = np.asarray(img, dtype=np.uint8)
+    if img.ndim == 2:
+        img = img[:, :, np.newaxis]
+    height, width, channels = img.shape
+    if not(channels in COLOR_TYPES):
+        raise ValueError("encode_png takes images with 1, 3 or 4 channels")
+
+    # every row starts with its filter type byte. 0 = no filter
+    rows = np.zeros((height, 1 + width*channels), dtype=np.uint8)
+    rows[:, 1:] = img.reshape(height, width*channels)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, COLOR_TYPES[channels], 0, 0, 0)
+    return b''.join([PNG_SIGNATURE,
+                     png_chunk(b'IHDR', header),
+                     png_chunk(b'IDAT', zlib.compress(rows.tobytes(), level)),
+                     png_chunk(b'IEND', b'')])
+
+
+def write_png(filename, img, level=6):
+    # saves img (see encode_png()) to filename
+    with open(filename, 'wb') as f:
+        f.write(encode_png(img, level))
@@ -0,0 +1,59 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  rgb565_decode.py
+#
+#   Decodes RGB565 pixel data from capture (and bulk records) into
+#   RGB888 numpy arrays. The 16 bit pixels are viewed in place and
+#   converted with a lookup table of all 65536 colors, built once.
+#
+#   capture sends the pixels big endian, 2 bytes per pixel, row by
+#   row starting at the top left of the screen.
+##--------------------------------------------------------------------\
+
+import numpy as np
+
+RGB565_BE = np.dtype('>u2')  # pixel byte order sent by the device
+RGB565_LE = np.dtype('<u2')  # for data that was byte swapped on the way
+
+_RGB888_LUT = None
+
+
+def rgb888_lut():
+    # (65536, 3) uint8 table of the RGB888 color of every RGB565 value.
+    # the low bits are filled from the high bits, so full scale maps
+    # to 255 instead of 248
+    global _RGB888_LUT
+    if _RGB888_LUT is None:
+        px = np.arange(65536, dtype=np.uint32)
+        r = (px >> 11) & 0x1F
+        g = (px >> 5) & 0x3F
+        b = px & 0x1F
+        lut = np.empty((65536, 3), dtype=np.uint8)
+        lut[:, 0] = (r << 3) | (r >> 2)
+        lut[:, 1] = (g << 2) | (g >> 4)
+        lut[:, 2] = (b << 3) | (b >> 2)
+        _RGB888_LUT = lut
+    return _RGB888_LUT
+
+
+def rgb565_pixels(data, width, height, dtype=RGB565_BE):
+    # zero copy (height, width) uint16 view of the pixel bytes
+    # returns None if data is too short
+    size = width * height * 2
+    if len(data) < size:
+        return None
+    return np.frombuffer(data, dtype=dtype, count=width*height).reshape(height, width)
+
+
+def decode_rgb565(data, width, height, out=None, dtype=RGB565_BE):
+    # RGB565 pixel bytes to a (height, width, 3) uint8 RGB array
+    # out: optional (height, width, 3) uint8 array to write into
+    # returns None if data is too short
+    px = rgb565_pixels(data, width, height, dtype)
+    if px is None:
+        return None
+    if out is None:
+        return rgb888_lut()[px]
+    np.take(rgb888_lut(), px, axis=0, out=out)
+    return out
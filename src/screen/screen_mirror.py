@@ -0,0 +1,324 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  screen_mirror.py
+#
+#   Live copy of the device screen from the auto refresh records.
+#   With 'refresh on', the device sends every region of the screen it
+#   redraws, without being asked:
+#       "bulk\r\n" {X}{Y}{Width}{Height} {pixeldata} "ch> \r\n"
+#       "fill\r\n" {X}{Y}{Width}{Height} {Color} "ch> \r\n"
+#   where X, Y, Width and Height are 2 byte little endian. The pixels
+#   and the color are not: they are copied from the same display
+#   buffer that capture sends, which holds RGB565 big endian (the byte
+#   order of the LCD), so 0xF800 (red) arrives as F8 00. The README
+#   calls all the numbers little endian, but that only holds for the
+#   region header. dtype=RGB565_LE can be passed for data that was
+#   byte swapped on the way.
+#
+#   Each record is applied in place to a framebuffer, and the changed
+#   rectangles are kept until they are taken with take_dirty(). Only
+#   the redrawn regions cross the USB link, instead of a full capture
+#   for every frame.
+#
+#   NOTE: the tinySA object must not be used for other commands while
+#   the mirror is running.
+##--------------------------------------------------------------------\
+
+import threading
+import time
+
+import numpy as np
+
+try:
+    from src.serial_stream import framing
+    from src.screen.rgb565_decode import RGB565_BE, rgb565_pixels, rgb888_lut
+except:
+    from serial_stream import framing
+    from screen.rgb565_decode import RGB565_BE, rgb565_pixels, rgb888_lut
+
+BULK_TAG = b'bulk\r\n'
+FILL_TAG = b'fill\r\n'
+
+MAX_DIRTY = 64          # changed rectangles kept before they are merged into one
+STOP_TIMEOUT = 2.0      # max seconds stop() waits for the end of the stream
+
+
+class screenMirror():
+    def __init__(self, width=480, height=320, dtype=RGB565_BE):
+        # width, height: screen size of the device
+        # dtype: byte order of the pixels
+        self.width = width
+        self.height = height
+        self.dtype = np.dtype(dtype)
+        self.pixels = np.zeros((height, width), dtype=np.uint16)   # RGB565
+        self.rgb = np.zeros((height, width, 3), dtype=np.uint8)    # RGB888
+        self.dirty = []     # (x, y, w, h) changed since take_dirty()
+        self.records = 0
+        self.bytesApplied = 0
+        self.lock = threading.Condition()
+
+        # set by start()
+        self.tsa = None
+        self.thread = None
+        self.stopEvent = threading.Event()
+        self.error = None
+        self.startTime = None
+        self.ended = False  # the reader thread read the end of the stream
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+######################################################################
+# Applying records
+######################################################################
+
+    def clip(self, x, y, w, h):
+        # the part of a region that is on the screen. w or h is 0 if none
+        w = max(0, min(w, self.width - x))
+        h = max(0, min(h, self.height - y))
+        return x, y, w, h
+
+    def mark_dirty(self, x, y, w, h):
+        # if nobody takes the changes, they are merged into one bounding
+        # rectangle instead of growing without limit
+        if len(self.dirty) >= MAX_DIRTY:
+            self.dirty = [self.bounds(self.dirty + [(x, y, w, h)])]
+        else:
+            self.dirty.append((x, y, w, h))
+        self.records = self.records + 1
+        self.lock.notify_all()
+
+    def apply_bulk(self, header, data):
+        # copies the pixels of a bulk record into the framebuffer
+        return self.apply_record("bulk", framing.unpack_record_header(header), data)
+
+    def apply_fill(self, header, data):
+        # fills the region of a fill record with its color
+        return self.apply_record("fill", framing.unpack_record_header(header), data)
+
+    def apply_record(self, kind, header, data):
+        # applies a record that has already been split up, such as one
+        # from serialDemux. 
+        # kind: "bulk"|"fill", header: (X, Y, Width, Height)
+        x, y, w, h = header
+        cx, cy, cw, ch = self.clip(x, y, w, h)
+        if kind == "bulk":
+            px = rgb565_pixels(data, w, h, self.dtype)
+            if px is None:
+                return False
+        else:
+            if len(data) < framing.BYTES_PER_PIXEL:
+                return False
+            color = int(np.frombuffer(data, dtype=self.dtype, count=1)[0])
+        with self.lock:
+            if (cw > 0) and (ch > 0):
+                region = self.pixels[cy:cy+ch, cx:cx+cw]
+                if kind == "bulk":
+                    region[:] = px[:ch, :cw]
+                    np.take(rgb888_lut(), region, axis=0, out=self.rgb[cy:cy+ch, cx:cx+cw])
+                else:
+                    region[:] = color
+                    self.rgb[cy:cy+ch, cx:cx+cw] = rgb888_lut()[color]
+                self.mark_dirty(cx, cy, cw, ch)
+            self.bytesApplied = self.bytesApplied + len(data)
+        return True
+
+    def apply_capture(self, data):
+        # replaces the whole framebuffer with a capture() return
+        px = rgb565_pixels(data, self.width, self.height, self.dtype)
+        if px is None:
+            return False
+        with self.lock:
+            self.pixels[:] = px
+            np.take(rgb888_lut(), self.pixels, axis=0, out=self.rgb)
+            self.mark_dirty(0, 0, self.width, self.height)
+        return True
+
+    def apply_bytes(self, data):
+        # applies every complete record in data, such as a recording of
+        # the serial port. returns the number of bytes used
+        data = bytes(data)
+        view = memoryview(data)
+        pos = 0
+        while True:
+            bulk = data.find(BULK_TAG, pos)
+            fill = data.find(FILL_TAG, pos)
+            if (bulk == -1) and (fill == -1):
+                return pos
+            if (fill == -1) or ((bulk != -1) and (bulk < fill)):
+                start = bulk + len(BULK_TAG)
+                payload_size = framing.bulk_payload_size
+                apply = self.apply_bulk
+            else:
+                start = fill + len(FILL_TAG)
+                payload_size = framing.fill_payload_size
+                apply = self.apply_fill
+            header = view[start:start+framing.RECORD_HEADER_SIZE]
+            if len(header) < framing.RECORD_HEADER_SIZE:
+                return pos
+            end = start + framing.RECORD_HEADER_SIZE + payload_size(header)
+            if len(data) < end:
+                return pos
+            apply(header, view[start+framing.RECORD_HEADER_SIZE:end])
+            pos = end
+
+    def read_record(self, reader, timeout=None):
+        # reads the next line or record from the stream reader and applies it.
+        # returns the line that was read before any record data
+        line = reader.read_until(b'\r\n', timeout)
+        if reader.timedOut == True:
+            return line
+        if line[-len(BULK_TAG):] == BULK_TAG:
+            payload_size = framing.bulk_payload_size
+            apply = self.apply_bulk
+        elif line[-len(FILL_TAG):] == FILL_TAG:
+            payload_size = framing.fill_payload_size
+            apply = self.apply_fill
+        else:
+            # "ch> \r\n" after a record, or a command echo
+            return line
+        line = bytes(line)
+        header = bytes(reader.read_exact(framing.RECORD_HEADER_SIZE, timeout))
+        if len(header) < framing.RECORD_HEADER_SIZE:
+            return line
+        data = reader.read_exact(payload_size(header), timeout)
+        apply(header, data)
+        return line
+
+######################################################################
+# Reading the framebuffer
+######################################################################
+
+    def take_dirty(self):
+        # returns the rectangles changed since the last call, and clears them
+        with self.lock:
+            dirty = self.dirty
+            self.dirty = []
+        return dirty
+
+    def dirty_bounds(self):
+        # one (x, y, w, h) rectangle around every changed region, or None
+        with self.lock:
+            if len(self.dirty) == 0:
+                return None
+            return self.bounds(self.dirty)
+
+    def bounds(self, dirty):
+        # one (x, y, w, h) rectangle around a list of rectangles
+        rects = np.array(dirty)
+        x0 = rects[:, 0].min()
+        y0 = rects[:, 1].min()
+        x1 = (rects[:, 0] + rects[:, 2]).max()
+        y1 = (rects[:, 1] + rects[:, 3]).max()
+        return int(x0), int(y0), int(x1 - x0), int(y1 - y0)
+
+    def wait_update(self, timeout=None):
+        # waits until a region changes. returns False on timeout
+        with self.lock:
+            return self.lock.wait_for(lambda: (len(self.dirty) > 0) or self.stopEvent.is_set(), timeout)
+
+    def snapshot(self):
+        # copy of the current screen as a (height, width, 3) RGB array
+        with self.lock:
+            return self.rgb.copy()
+
+######################################################################
+# Mirroring a device
+######################################################################
+
+    def start(self, tsa, capture=True):
+        # turns on auto refresh and applies the records in a reader thread
+        # tsa: connected tinySA object
+        # capture: start from a full capture() so the regions the device
+        #   does not redraw are known
+        self.tsa = tsa
+        self.width = tsa.screenWidth
+        self.height = tsa.screenHeight
+        if self.pixels.shape != (self.height, self.width):
+            self.pixels = np.zeros((self.height, self.width), dtype=np.uint16)
+            self.rgb = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        if capture == True:
+            self.apply_capture(tsa.capture())
+        tsa.refresh("on")
+        self.stopEvent.clear()
+        self.ended = False
+        self.error = None
+        self.startTime = time.monotonic()
+        self.thread = threading.Thread(target=self.read_loop, daemon=True)
+        self.thread.start()
+
+    def read_loop(self):
+        reader = self.tsa.stream_reader()
+        # the reads are bounded even without a response timeout, so the
+        # thread can see stop() while the device is quiet
+        timeout = self.tsa.responseTimeout
+        if (timeout == None) or (timeout > STOP_TIMEOUT):
+            timeout = STOP_TIMEOUT
+        stopTime = None
+        try:
+            while True:
+                line = self.read_record(reader, timeout)
+                if self.stopEvent.is_set() and (b'refresh off' in bytes(line)):
+                    # the echo of the stop command. its prompt ends the stream
+                    reader.read_until(framing.PROMPT, STOP_TIMEOUT)
+                    self.ended = (reader.timedOut == False)
+                    break
+                if self.stopEvent.is_set():
+                    # give up if the echo never comes. stop() drains the port
+                    if stopTime == None:
+                        stopTime = time.monotonic()
+                    elif time.monotonic() - stopTime > STOP_TIMEOUT:
+                        break
+        except Exception as err:
+            self.error = err
+            self.tsa.print_message("ERROR: screen mirror stopped")
+            self.tsa.print_message(err)
+        finally:
+            with self.lock:
+                self.lock.notify_all()
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        # turns off auto refresh and waits for the reader thread.
+        # timeout: max seconds to wait for the reader thread, and for the
+        #   end of the stream if the thread did not read it
+        # returns True if the port was left at the prompt
+        if self.thread == None:
+            return True
+        self.stopEvent.set()
+        self.tsa.ser.write(b'refresh off\r\n')
+        # a read in the thread takes at most STOP_TIMEOUT, and it gives up
+        # STOP_TIMEOUT after the stop without an echo
+        self.thread.join(timeout + 2*STOP_TIMEOUT)
+        if self.thread.is_alive():
+            # still blocked in a read. the port cannot be drained from here
+            self.tsa.print_message("ERROR: screen mirror did not stop")
+            return False
+        self.thread = None
+        if self.ended == False:
+            # the reader thread died or gave up before the echo, so the
+            # rest of the stream is read here up to the prompt
+            reader = self.tsa.stream_reader()
+            start_time = time.monotonic()
+            while True:
+                line = self.read_record(reader, timeout)
+                if (reader.timedOut == True) or (time.monotonic() - start_time > timeout):
+                    self.tsa.print_message("ERROR: no end of the screen mirror stream")
+                    return False
+                if b'refresh off' in bytes(line):
+                    break
+            reader.read_until(framing.PROMPT, timeout)
+            self.ended = (reader.timedOut == False)
+        return self.ended
+
+    def records_per_sec(self):
+        # records applied per second since start()
+        if self.startTime == None:
+            return 0.0
+        elapsed = time.monotonic() - self.startTime
+        if elapsed <= 0:
+            return 0.0
+        return self.records / elapsed
@@ -0,0 +1,283 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  demux.py
+#
+#   Splits everything received from the tinySA into:
+#       command responses: the echo of a command that was sent,
+#           its response, and the prompt
+#       records: the 'bulk' and 'fill' records sent in auto
+#           refresh mode, read by their declared size
+#       unsolicited: anything else
+#   A reader thread owns the port while the demultiplexer runs. Each
+#   response goes back to the command that is waiting for it, and
+#   records and unsolicited data go to their own queues (or handlers),
+#   so commands and screen streaming can share the port.
+#
+#   The receive buffer is the one of the stream reader, so no bytes
+#   are lost when the demultiplexer is started or stopped.
+##--------------------------------------------------------------------\
+
+from collections import deque
+import queue
+import threading
+
+try:
+    from src.serial_stream import framing
+except:
+    from serial_stream import framing
+
+BULK_TAG = b'bulk\r\n'
+FILL_TAG = b'fill\r\n'
+RECORD_TAGS = {BULK_TAG: "bulk", FILL_TAG: "fill"}
+RECORD_TRAILER = b'ch> \r\n'    # sent after every record
+TAG_SIZE = 6
+
+
+class pendingCommand():
+    # a command that was sent and is waiting for its response
+    def __init__(self, writebyte, size=None, payload_size=None):
+        self.echo = bytes(writebyte.split('\r\n')[0], 'utf-8') + b'\r\n'
+        self.size = size
+        self.payload_size = payload_size
+        self.echoed = False
+        self.body = bytearray()
+        self.result = None
+        self.done = threading.Event()
+
+
+class serialDemux():
+    def __init__(self, tsa, recordHandler=None, unsolicitedHandler=None, maxQueue=0):
+        # tsa: connected tinySA object
+        # recordHandler: optional function(kind, header, payload) called
+        #   from the reader thread for every record, instead of queueing it.
+        #   kind is "bulk"|"fill", header is (X, Y, Width, Height)
+        # unsolicitedHandler: optional function(data) for unsolicited bytes
+        # maxQueue: max items in the record and unsolicited queues, 0 for no limit.
+        #   the oldest item is dropped when a queue is full
+        self.tsa = tsa
+        self.reader = tsa.stream_reader()
+        self.rx = self.reader.rxBuf
+        self.recordHandler = recordHandler
+        self.unsolicitedHandler = unsolicitedHandler
+        self.records = queue.Queue(maxQueue)
+        self.unsolicited = queue.Queue(maxQueue)
+
+        self.pending = deque()
+        self.current = None
+        # the space after a prompt is not unsolicited. the last command
+        # read without the demultiplexer leaves one too
+        self.afterPrompt = True
+        self.writeLock = threading.Lock()
+        self.stopEvent = threading.Event()
+        self.thread = None
+        self.error = None
+
+        self.responseCount = 0
+        self.recordCount = 0
+        self.unsolicitedBytes = 0
+        self.droppedCount = 0
+
+    def __enter__(self):
+        if self.thread == None:
+            self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        self.stopEvent.clear()
+        self.thread = threading.Thread(target=self.read_loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # stops the reader thread. anything not parsed yet stays in the
+        # stream reader. waiting commands get None
+        self.stopEvent.set()
+        if self.thread != None:
+            self.thread.join()
+            self.thread = None
+        for cmd in self.pending:
+            cmd.done.set()
+        self.pending.clear()
+
+######################################################################
+# Commands
+######################################################################
+
+    def command(self, writebyte, size=None, payload_size=None, timeout=None):
+        # sends a command and waits for its response.
+        # size, payload_size: see tinySA.tinySA_serial_binary()
+        # returns the response in the same format as tinySA_serial()
+        #   and tinySA_serial_binary(), or None on timeout
+        cmd = pendingCommand(writebyte, size, payload_size)
+        with self.writeLock:
+            # queued before writing, so the echo is always expected
+            self.pending.append(cmd)
+            self.tsa.ser.write(bytes(writebyte, 'utf-8'))
+        if cmd.done.wait(timeout) == False:
+            self.tsa.print_message("WARNING: Timeout waiting for " + writebyte.strip())
+            return None
+        return cmd.result
+
+######################################################################
+# Parsing
+######################################################################
+
+    def read_loop(self):
+        try:
+            while not self.stopEvent.is_set():
+                # blocks up to the serial timeout, so stop() is noticed.
+                # read through the stream reader, so a wrapped fill (such
+                # as the one of enable_tracing()) sees these reads too
+                if self.reader.fill() > 0:
+                    while self.parse() == True:
+                        pass
+        except Exception as err:
+            self.error = err
+            self.tsa.print_message("ERROR: serial demultiplexer stopped")
+            self.tsa.print_message(err)
+
+    def put(self, q, item):
+        if q.maxsize > 0 and q.full():
+            try:
+                q.get_nowait()
+                self.droppedCount = self.droppedCount + 1
+            except queue.Empty:
+                pass
+        q.put(item)
+
+    def first_record(self):
+        # index and tag of the first record tag in the unread bytes, or -1, None
+        found = -1
+        tag = None
+        for t in RECORD_TAGS:
+            idx = self.rx.index(t)
+            if (idx != -1) and ((found == -1) or (idx < found)):
+                found = idx
+                tag = t
+        return found, tag
+
+    def parse(self):
+        # parses the next complete item in the buffer.
+        # returns True if something was consumed
+        unread = len(self.rx)
+        if unread == 0:
+            return False
+        if self.afterPrompt == True:
+            self.afterPrompt = False
+            if self.rx.peek(1) == b' ':
+                self.rx.take(1)
+                return True
+        if (self.current != None) and (self.current.size != None) and (self.current.result == None):
+            return self.parse_binary()
+
+        recPos, tag = self.first_record()
+        if self.current != None:
+            # a text response (or the rest of a binary one) up to the prompt
+            promptPos = self.rx.index(framing.PROMPT)
+            if (recPos != -1) and ((promptPos == -1) or (recPos < promptPos)):
+                self.current.body += self.rx.take(recPos)
+                return self.parse_record(tag)
+            if promptPos == -1:
+                # keep enough for a tag or prompt split across reads
+                keep = TAG_SIZE - 1
+                if unread > keep:
+                    self.current.body += self.rx.take(unread - keep)
+                return False
+            self.current.body += self.rx.take(promptPos)
+            self.rx.take(len(framing.PROMPT))
+            self.afterPrompt = True
+            self.finish_command()
+            return True
+
+        echoPos = -1
+        if len(self.pending) > 0:
+            echoPos = self.rx.index(self.pending[0].echo)
+        if (recPos != -1) and ((echoPos == -1) or (recPos < echoPos)):
+            self.emit_unsolicited(recPos)
+            return self.parse_record(tag)
+        if echoPos != -1:
+            self.emit_unsolicited(echoPos)
+            self.rx.take(len(self.pending[0].echo))
+            self.current = self.pending.popleft()
+            self.current.echoed = True
+            return True
+        # nothing recognized. hand out what can not be the start of a
+        # tag or echo (a space after a prompt, device messages)
+        keep = TAG_SIZE - 1
+        if len(self.pending) > 0:
+            keep = max(keep, len(self.pending[0].echo) - 1)
+        if unread > keep:
+            self.emit_unsolicited(unread - keep)
+            return True
+        return False
+
+    def parse_binary(self):
+        # sized response of the current command
+        cmd = self.current
+        if len(self.rx) < cmd.size:
+            return False
+        size = cmd.size
+        if cmd.payload_size != None:
+            size = size + cmd.payload_size(self.rx.peek(cmd.size))
+            if len(self.rx) < size:
+                return False
+        cmd.result = bytearray(self.rx.take(size))
+        return True
+
+    def parse_record(self, tag):
+        # a bulk/fill record at the front of the buffer
+        start = TAG_SIZE
+        if len(self.rx) < start + framing.RECORD_HEADER_SIZE:
+            return False
+        header = self.rx.peek(start + framing.RECORD_HEADER_SIZE)[start:]
+        if tag == BULK_TAG:
+            size = framing.bulk_payload_size(header)
+        else:
+            size = framing.fill_payload_size(header)
+        end = start + framing.RECORD_HEADER_SIZE + size
+        if len(self.rx) < end:
+            return False
+        # the trailer is only needed to know it is not the prompt of a command
+        if len(self.rx) < end + len(RECORD_TRAILER):
+            if bytes(self.rx.peek()[end:]) == RECORD_TRAILER[:len(self.rx) - end]:
+                return False
+        data = self.rx.take(end)
+        header = framing.unpack_record_header(data[start:])
+        payload = data[start + framing.RECORD_HEADER_SIZE:]
+        if self.rx.index(RECORD_TRAILER) == 0:
+            self.rx.take(len(RECORD_TRAILER))
+        self.recordCount = self.recordCount + 1
+        if self.recordHandler != None:
+            self.recordHandler(RECORD_TAGS[tag], header, payload)
+        else:
+            self.put(self.records, (RECORD_TAGS[tag], header, bytes(payload)))
+        return True
+
+    def emit_unsolicited(self, n):
+        if n <= 0:
+            return
+        data = bytes(self.rx.take(n))
+        self.unsolicitedBytes = self.unsolicitedBytes + n
+        if self.unsolicitedHandler != None:
+            self.unsolicitedHandler(data)
+        else:
+            self.put(self.unsolicited, data)
+
+    def finish_command(self):
+        cmd = self.current
+        self.current = None
+        if cmd.size == None:
+            # same cleanup as a response read with tinySA_serial()
+            cmd.result = bytearray(self.tsa.clean_return(cmd.echo + bytes(cmd.body) + framing.PROMPT))
+        self.responseCount = self.responseCount + 1
+        cmd.done.set()
+
+    def stats(self):
+        return {"responses": self.responseCount,
+                "records": self.recordCount,
+                "unsolicited_bytes": self.unsolicitedBytes,
+                "dropped": self.droppedCount,
+                "pending": len(self.pending)}
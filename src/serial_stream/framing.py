@@ -0,0 +1,44 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  framing.py
+#
+#   Payload sizes for the binary tinySA responses. Binary payloads
+#   can contain any byte value (including the '>' of the prompt), so
+#   these are read by size instead of by searching for a delimiter.
+#
+#   capture:  {pixeldata} of SCREEN_WIDTH*SCREEN_HEIGHT*2 bytes (RGB565)
+#   scanraw:  '{' ('x' LSB MSB)*points '}'
+#   bulk:     {X}{Y}{Width}{Height}{pixeldata of Width*Height*2 bytes}
+#   fill:     {X}{Y}{Width}{Height}{Color of 2 bytes}
+#       where X, Y, Width, Height and Color are 2 byte little endian
+##--------------------------------------------------------------------\
+
+import struct
+
+RECORD_HEADER_SIZE = 8      # X, Y, Width, Height of bulk/fill records
+BYTES_PER_PIXEL = 2         # RGB565
+SCANRAW_BYTES_PER_PT = 3    # 'x' LSB MSB
+PROMPT = b'ch>'
+
+
+def capture_size(width, height):
+    # screen dump size in bytes
+    return int(width) * int(height) * BYTES_PER_PIXEL
+
+def scanraw_size(pts):
+    # scanraw frame size in bytes, including the '{' and '}'
+    return SCANRAW_BYTES_PER_PT * int(pts) + 2
+
+def unpack_record_header(header):
+    # returns X, Y, Width, Height of a bulk/fill record header
+    return struct.unpack_from('<4H', header)
+
+def bulk_payload_size(header):
+    # pixel data size declared by a bulk record header
+    x, y, w, h = unpack_record_header(header)
+    return w * h * BYTES_PER_PIXEL
+
+def fill_payload_size(header):
+    # a fill record always carries a single color
+    return BYTES_PER_PIXEL
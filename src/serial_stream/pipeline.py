@@ -0,0 +1,84 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  pipeline.py
+#
+#   Command pipelining. Every command is normally a full write and
+#   wait for 'ch>' round trip, which over USB CDC takes longer than
+#   the command itself. In a pipeline, the commands are recorded
+#   (tinySA.commandQueue), written to the device in one burst, and
+#   the responses are split back apart by reading them in order.
+#   The device shell runs the commands one after another, so the
+#   n-th response always belongs to the n-th command.
+#
+#   Only use commands whose return value is not needed inside the
+#   pipeline (setters). The functions return b'' while recording,
+#   and the real responses are in 'results' after the pipeline ends.
+##--------------------------------------------------------------------\
+
+
+class commandPipeline():
+    def __init__(self, tsa):
+        # tsa: connected tinySA object
+        self.tsa = tsa
+        self.commands = []  # (writebyte, size, payload_size, stateKey)
+        self.results = []   # one response per command, after flush()
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type != None:
+            # nothing has been sent. drop the recorded commands
+            self.tsa.commandQueue = None
+            self.commands = []
+            return
+        self.flush()
+
+    def __len__(self):
+        return len(self.commands)
+
+    def begin(self):
+        # start recording commands
+        if self.tsa.commandQueue != None:
+            raise RuntimeError("a pipeline is already recording on this tinySA")
+        self.commands = []
+        self.results = []
+        self.tsa.commandQueue = self.commands
+
+    def flush(self):
+        # stops recording, writes every command at once and reads the
+        # responses in order.
+        # returns: list of responses (bytearray). None for a command
+        #   that did not get a response
+        self.tsa.commandQueue = None
+        self.results = []
+        if len(self.commands) == 0:
+            return self.results
+        burst = ''.join([command[0] for command in self.commands])
+        self.tsa.ser.write(bytes(burst, 'utf-8'))
+        for writebyte, size, payload_size, stateKey in self.commands:
+            try:
+                if size == None:
+                    msgbytes = self.tsa.read_response()
+                else:
+                    msgbytes = self.tsa.read_binary_response(size, payload_size)
+            except Exception as err:
+                # a missing response. the ones after it can not be matched up
+                self.tsa.print_message("ERROR: no response to pipelined command " + writebyte.strip())
+                self.tsa.print_message(err)
+                break
+            # the settings the device has confirmed. not a partial response
+            confirmed = msgbytes
+            if self.tsa.stream_reader().timedOut == True:
+                confirmed = None
+            self.tsa.confirm_state(writebyte, stateKey, confirmed)
+            self.results.append(msgbytes)
+        while len(self.results) < len(self.commands):
+            self.results.append(None)
+        return self.results
+
+    def commands_sent(self):
+        # the recorded command strings, without line endings
+        return [command[0].strip() for command in self.commands]
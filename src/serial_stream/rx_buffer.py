@@ -0,0 +1,114 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  rx_buffer.py
+#
+#   Growable receive buffer for the serial port. Data is read
+#   with readinto() straight into a preallocated bytearray, delimiter
+#   searches only cover the newly arrived bytes, and responses are
+#   handed back as memoryview slices so nothing is copied until the
+#   caller makes its own copy.
+#
+#   NOTE: a returned memoryview is only valid until the next read
+#   into the buffer. Copy it (bytearray(view)) to keep it.
+##--------------------------------------------------------------------\
+
+
+class rxBuffer():
+    def __init__(self, size=4096):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0    # first unread byte
+        self.end = 0      # one past the last received byte
+        self.scanPos = 0  # everything before this has been searched
+        self.received = 0 # bytes ever read into the buffer
+
+    def __len__(self):
+        # number of unread bytes
+        return self.end - self.start
+
+    def capacity(self):
+        return len(self.buf)
+
+    def clear(self):
+        # drop all unread bytes. the memory is kept for reuse
+        self.start = 0
+        self.end = 0
+        self.scanPos = 0
+
+    def reserve(self, n):
+        # make sure there is room for n more bytes after the unread data.
+        # the unread data is moved to the front, and the buffer is only
+        # reallocated (doubling) if it is still too small
+        unread = self.end - self.start
+        if len(self.buf) - self.end >= n:
+            return
+        if len(self.buf) >= unread + n:
+            # compact in place
+            self.view[:unread] = self.view[self.start:self.end]
+        else:
+            size = len(self.buf)
+            while size < unread + n:
+                size = size * 2
+            newBuf = bytearray(size)
+            newBuf[:unread] = self.view[self.start:self.end]
+            self.view.release()
+            self.buf = newBuf
+            self.view = memoryview(self.buf)
+        self.scanPos = self.scanPos - self.start
+        self.start = 0
+        self.end = unread
+
+    def fill(self, ser, n=None):
+        # read from the serial port into the free space of the buffer.
+        # with n=None, whatever is waiting is read, or the read blocks
+        # (up to the serial timeout) for at least 1 byte.
+        # returns the number of bytes read
+        if n == None:
+            n = max(1, ser.in_waiting)
+        self.reserve(n)
+        count = ser.readinto(self.view[self.end:self.end+n])
+        if count == None: # non-blocking port with nothing waiting
+            count = 0
+        self.end = self.end + count
+        self.received = self.received + count
+        return count
+
+    def find(self, marker):
+        # search for marker in the bytes that have not been searched yet.
+        # returns the index relative to the first unread byte, or -1
+        # the last len(marker)-1 bytes are searched again on the next call
+        # in case the marker was split across two reads
+        searchFrom = max(self.start, self.scanPos - len(marker) + 1)
+        idx = self.buf.find(marker, searchFrom, self.end)
+        if idx == -1:
+            self.scanPos = self.end
+            return -1
+        return idx - self.start
+
+    def index(self, marker, offset=0):
+        # search all unread bytes from offset, without the incremental
+        # state of find(). returns the index relative to the first 
+        # unread byte, or -1
+        idx = self.buf.find(marker, self.start + offset, self.end)
+        if idx == -1:
+            return -1
+        return idx - self.start
+
+    def peek(self, n=None):
+        # memoryview of the next n unread bytes (all if None) without consuming
+        if n == None:
+            n = self.end - self.start
+        return self.view[self.start:self.start+n]
+
+    def take(self, n):
+        # memoryview of the next n unread bytes. consumes them
+        frame = self.view[self.start:self.start+n]
+        self.start = self.start + n
+        self.scanPos = max(self.scanPos, self.start)
+        if self.start == self.end:
+            # nothing unread, so the next read can start at the front
+            self.start = 0
+            self.end = 0
+            self.scanPos = 0
+        return frame
@@ -0,0 +1,82 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  stream_reader.py
+#
+#   Connection-scoped reader for the tinySA serial stream. It owns
+#   every byte received from the port that has not been handed to a
+#   parser yet, so data that arrives after a prompt or end marker is
+#   kept for the next response instead of being dropped. All of the
+#   response parsers (prompt delimited, end marker, fixed length)
+#   read through the same reader, so back to back commands stay
+#   aligned without flushing the port.
+#
+#   Reads return memoryviews into the receive buffer. They are only
+#   valid until the next read.
+##--------------------------------------------------------------------\
+
+import time
+
+try:
+    from src.serial_stream.rx_buffer import rxBuffer
+except:
+    from serial_stream.rx_buffer import rxBuffer
+
+
+class streamReader():
+    def __init__(self, ser, size=4096):
+        self.ser = ser
+        self.rxBuf = rxBuffer(size)
+        # set when the last read stopped on a timeout
+        self.timedOut = False
+
+    def __len__(self):
+        # number of received bytes not handed out yet
+        return len(self.rxBuf)
+
+    def fill(self, n=None):
+        # read from the port into the buffer. see rxBuffer.fill()
+        return self.rxBuf.fill(self.ser, n)
+
+    def discard(self):
+        # drop every unread byte. only for explicit resyncs
+        self.rxBuf.clear()
+
+    def read_until(self, marker, timeout=None):
+        # returns everything up to and including marker.
+        # timeout: max seconds overall. None waits until the marker arrives
+        # on timeout, all unread bytes are returned and timedOut is set
+        self.timedOut = False
+        start_time = time.monotonic()
+        while True:
+            # only new bytes are searched
+            end_pos = self.rxBuf.find(marker)
+            if end_pos != -1:
+                return self.rxBuf.take(end_pos + len(marker))
+
+            # take everything waiting, or block until at least 1 byte arrives
+            count = self.fill()
+            if (count == 0) and (timeout != None) and \
+                (time.monotonic() - start_time > timeout):
+                self.timedOut = True
+                return self.rxBuf.take(len(self.rxBuf))
+
+    def read_exact(self, n, timeout=None):
+        # returns exactly n bytes. no delimiter search
+        # on timeout, the bytes read so far are returned and timedOut is set
+        self.timedOut = False
+        start_time = time.monotonic()
+        while len(self.rxBuf) < n:
+            # ask for exactly what is missing
+            count = self.fill(n - len(self.rxBuf))
+            if (count == 0) and (timeout != None) and \
+                (time.monotonic() - start_time > timeout):
+                self.timedOut = True
+                break
+        return self.rxBuf.take(min(n, len(self.rxBuf)))
+
+    def read_available(self):
+        # returns whatever is buffered or waiting on the port, without blocking
+        if self.ser.in_waiting > 0:
+            self.fill(self.ser.in_waiting)
+        return self.rxBuf.take(len(self.rxBuf))
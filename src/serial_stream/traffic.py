@@ -0,0 +1,273 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  traffic.py
+#
+#   Recording and replay of the serial traffic with a tinySA, so the
+#   parsers and decoders can be run (and profiled) on real device
+#   output without the device.
+#
+#   recordingSerial wraps the serial.Serial object and writes every
+#   write and read to a file with the time it happened. replaySerial
+#   is used in place of the port and plays a recording back:
+#       - the bytes the device sent are only handed out after the
+#         commands that came before them in the recording are written,
+#         so responses can not arrive before their command
+#       - speed=1.0 keeps the recorded delay between each command and
+#         its response. speed=None hands out the responses as fast as
+#         they are read
+#
+#   Recording file:
+#       'TSATRAFFIC' start time (float64)
+#       one event per write or read:
+#           direction (b'W'|b'R') time since start (float64) size (uint32) data
+##--------------------------------------------------------------------\
+
+import struct
+import threading
+import time
+
+FILE_MAGIC = b'TSATRAFFIC'
+FILE_HEADER = struct.Struct('<10sd')
+EVENT_HEADER = struct.Struct('<cdI')
+WRITE = b'W'
+READ = b'R'
+
+
+def read_traffic(filename):
+    # returns (start time, [(direction, time, data), ...]) of a recording
+    events = []
+    with open(filename, 'rb') as f:
+        magic, startTime = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+        if magic != FILE_MAGIC:
+            raise ValueError(filename + " is not a serial traffic recording")
+        while True:
+            header = f.read(EVENT_HEADER.size)
+            if len(header) < EVENT_HEADER.size:
+                break
+            direction, t, size = EVENT_HEADER.unpack(header)
+            data = f.read(size)
+            if len(data) < size:
+                break # cut off at the end of the file
+            events.append((direction, t, data))
+    return startTime, events
+
+
+def received_bytes(filename):
+    # everything the device sent in a recording, as one bytes object
+    return b''.join([data for direction, t, data in read_traffic(filename)[1] if direction == READ])
+
+
+class recordingSerial():
+    def __init__(self, ser, filename):
+        # ser: open serial.Serial (or anything with the same methods)
+        # filename: recording to write. an existing file is replaced
+        self.ser = ser
+        self.filename = filename
+        self.file = open(filename, 'wb')
+        self.startTime = time.time()
+        self.t0 = time.perf_counter()
+        self.file.write(FILE_HEADER.pack(FILE_MAGIC, self.startTime))
+        self.lock = threading.Lock()
+        self.bytesWritten = 0
+        self.bytesRead = 0
+
+    def __getattr__(self, name):
+        # anything not recorded goes straight to the port
+        return getattr(self.ser, name)
+
+    def log(self, direction, data):
+        if len(data) == 0:
+            return
+        with self.lock:
+            if self.file.closed == False:
+                self.file.write(EVENT_HEADER.pack(direction, time.perf_counter() - self.t0, len(data)))
+                self.file.write(data)
+
+    @property
+    def in_waiting(self):
+        return self.ser.in_waiting
+
+    @property
+    def timeout(self):
+        return self.ser.timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        self.ser.timeout = value
+
+    def write(self, data):
+        # logged before writing, so it is always ahead of its response
+        self.log(WRITE, bytes(data))
+        self.bytesWritten = self.bytesWritten + len(data)
+        return self.ser.write(data)
+
+    def readinto(self, b):
+        count = self.ser.readinto(b)
+        if count:
+            self.log(READ, bytes(memoryview(b)[:count]))
+            self.bytesRead = self.bytesRead + count
+        return count
+
+    def read(self, size=1):
+        data = self.ser.read(size)
+        self.log(READ, data)
+        self.bytesRead = self.bytesRead + len(data)
+        return data
+
+    def flush_recording(self):
+        with self.lock:
+            self.file.flush()
+
+    def close_recording(self):
+        # stops recording. the port stays open
+        with self.lock:
+            if self.file.closed == False:
+                self.file.close()
+
+    def close(self):
+        self.close_recording()
+        self.ser.close()
+
+
+class replaySerial():
+    def __init__(self, filename, speed=1.0, timeout=1):
+        # filename: recording made with recordingSerial
+        # speed: 1.0 for the recorded timing, 2.0 for twice as fast, ...
+        #   None to hand out the responses as soon as they are read
+        # timeout: read timeout in seconds, as for serial.Serial
+        self.filename = filename
+        self.speed = speed
+        self.timeout = timeout
+        self.is_open = True
+        self.port = filename
+
+        # the received data, in chunks. each one waits for the bytes
+        # written before it in the recording, plus its recorded delay
+        # after the last of those writes
+        self.chunks = []    # (written bytes needed, delay, data)
+        self.expected = bytearray()
+        writtenBefore = 0
+        lastWrite = 0.0
+        for direction, t, data in read_traffic(filename)[1]:
+            if direction == WRITE:
+                writtenBefore = writtenBefore + len(data)
+                lastWrite = t
+                self.expected += data
+            else:
+                self.chunks.append((writtenBefore, max(0.0, t - lastWrite), data))
+
+        self.next = 0           # next chunk to release
+        self.pending = bytearray()
+        self.pos = 0            # first unread byte of pending
+        self.bytesWritten = 0
+        self.writeTimes = {0: time.perf_counter()}  # bytes written -> time reached
+        self.mismatches = 0     # writes that differ from the recording
+        self.cond = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def release_time(self, chunk):
+        # perf_counter time the chunk can be read, or None if it is
+        # still waiting for a write
+        needed, delay, data = chunk
+        if self.bytesWritten < needed:
+            return None
+        if self.speed == None:
+            return 0.0
+        reached = self.writeTimes.get(needed, self.writeTimes[0])
+        return reached + delay / self.speed
+
+    def release(self):
+        # moves the chunks that are due into pending.
+        # returns the time the next chunk is due, or None
+        now = time.perf_counter()
+        while self.next < len(self.chunks):
+            due = self.release_time(self.chunks[self.next])
+            if (due == None) or (due > now):
+                return due
+            self.pending += self.chunks[self.next][2]
+            self.next = self.next + 1
+        return None
+
+    def unread(self):
+        return len(self.pending) - self.pos
+
+    @property
+    def in_waiting(self):
+        with self.cond:
+            self.release()
+            return self.unread()
+
+    def finished(self):
+        # True when every recorded byte has been read
+        with self.cond:
+            return (self.next == len(self.chunks)) and (self.unread() == 0)
+
+    def write(self, data):
+        data = bytes(data)
+        with self.cond:
+            if bytes(self.expected[self.bytesWritten:self.bytesWritten+len(data)]) != data:
+                self.mismatches = self.mismatches + 1
+            now = time.perf_counter()
+            # the write times are only needed for the chunks that wait on them
+            for i in range(self.next, len(self.chunks)):
+                needed = self.chunks[i][0]
+                if needed > self.bytesWritten + len(data):
+                    break
+                if needed > self.bytesWritten:
+                    self.writeTimes[needed] = now
+            self.bytesWritten = self.bytesWritten + len(data)
+            self.cond.notify_all()
+        return len(data)
+
+    def readinto(self, b):
+        # blocks up to the timeout for at least 1 byte, like serial.Serial
+        n = len(b)
+        if n == 0:
+            return 0
+        deadline = None
+        if self.timeout != None:
+            deadline = time.perf_counter() + self.timeout
+        with self.cond:
+            while True:
+                due = self.release()
+                if self.unread() > 0:
+                    count = min(n, self.unread())
+                    b[:count] = self.pending[self.pos:self.pos+count]
+                    self.pos = self.pos + count
+                    if self.pos == len(self.pending):
+                        self.pending = bytearray()
+                        self.pos = 0
+                    elif self.pos > 65536:
+                        del self.pending[:self.pos]
+                        self.pos = 0
+                    return count
+                now = time.perf_counter()
+                if (deadline != None) and (now >= deadline):
+                    return 0
+                wait = None
+                if deadline != None:
+                    wait = deadline - now
+                if due != None:
+                    wait = due - now if wait == None else min(wait, due - now)
+                # woken early by a write
+                self.cond.wait(wait)
+
+    def read(self, size=1):
+        buf = bytearray(size)
+        count = self.readinto(buf)
+        return bytes(buf[:count])
+
+    def reset_input_buffer(self):
+        with self.cond:
+            self.release()
+            self.pending = bytearray()
+            self.pos = 0
+
+    def close(self):
+        self.is_open = False
@@ -0,0 +1,510 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  tinySA_simulator.py
+#
+#   A stand-in for a tinySA on the USB serial port, for running and
+#   load testing the library without the device. It implements the
+#   console protocol the library uses: the echo of each command, its
+#   response, and the 'ch> ' prompt, for
+#       version, info, deviceid, vbat, help, sweep, scan, scanraw
+#       (including continuous scanraw), frequencies, data, capture,
+#       and the setters (rbw, attenuate, lna, agc, spur, mode,
+#       sweeptime, trigger, marker, refresh, pause, resume, ...)
+#   Unknown commands get '<command>?' like the device shell.
+#
+#   The spectrum is a noise floor that follows the RBW plus a list of
+#   signals, with noise from a seeded generator, so runs repeat.
+#   The time of every command is modelled: a sweep takes
+#       overhead + points * (point time + settle / RBW)
+#   and sending the result takes its size / usbRate. Commands run
+#   one after another, like on the device.
+#
+#   clock="realtime": responses arrive after the modelled time
+#   clock="virtual": nothing waits. the clock jumps ahead to each
+#       response as it is read, so a run is as fast as possible and
+#       deterministic, and 'clock' holds the device time it modelled
+#
+#   tinySASimulator is used in place of serial.Serial.
+#   simulatorPty serves it on a pseudo terminal (Linux/macOS), so
+#   programs that open a port by name can use it too.
+##--------------------------------------------------------------------\
+
+from collections import deque
+import os
+import select
+import threading
+import time
+
+import numpy as np
+
+try:
+    from src.device_config.device_config import get_preset
+except:
+    from device_config.device_config import get_preset
+
+PROMPT = b'ch> '
+# (min, max) RBW in Hz
+RBW_LIMITS = {"BASIC": (3e3, 600e3)}
+RBW_LIMITS_ULTRA = (200.0, 850e3)
+VERSIONS = {"BASIC": b'tinySA_v1.4-175-gaa2f2e1\r\nHW Version:V0.3.1',
+            "ULTRA": b'tinySA4_v1.4-143-g864bb27\r\nHW Version:V0.4.5.1.1'}
+# a few signals to find, (frequency Hz, level dBm)
+DEFAULT_SIGNALS = [(100e6, -35.0), (433.92e6, -55.0), (868e6, -62.0), (2.44e9, -48.0)]
+# setters that are accepted and remembered, and print nothing
+SETTERS = ["attenuate", "lna", "lna2", "agc", "spur", "mode", "trigger", "marker",
+           "refresh", "pause", "resume", "abort", "color", "output", "level", "modulation",
+           "calc", "trace", "threads", "ext_gain", "avoid", "selftest", "touch", "release"]
+
+
+class tinySASimulator():
+    def __init__(self, deviceType="ULTRA_ZS405", clock="virtual", seed=0, signals=None,
+                 timeout=1, usbRate=1.0e6, pointTime=50e-6, settle=2.0, sweepOverhead=2e-3):
+        # deviceType: preset to act as (see set_device_type())
+        # clock: "realtime"|"virtual"
+        # seed: noise seed. the same seed gives the same output
+        # signals: list of (frequency Hz, level dBm). None for DEFAULT_SIGNALS
+        # timeout: read timeout in seconds, as for serial.Serial
+        # usbRate: bytes per second sent to the host
+        # pointTime, settle, sweepOverhead: sweep time model (see above)
+        if not(clock in ["realtime", "virtual"]):
+            raise ValueError("clock must be 'realtime' or 'virtual'")
+        preset = get_preset(deviceType)
+        if preset == None:
+            raise ValueError("unknown device type " + str(deviceType))
+        self.deviceType = preset.DEVICE_TYPE
+        self.family = "BASIC" if self.deviceType == "BASIC" else "ULTRA"
+        self.maxPoints = preset.DISPLAY_PTS
+        self.screenWidth = preset.SCREEN_WIDTH
+        self.screenHeight = preset.SCREEN_HEIGHT
+        self.scanrawScale = preset.SCANRAW_SCALE
+        self.scanrawOffset = preset.SCANRAW_OFFSET
+        self.rbwLimits = RBW_LIMITS.get(self.deviceType, RBW_LIMITS_ULTRA)
+
+        self.clockMode = clock
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.signals = list(DEFAULT_SIGNALS if signals == None else signals)
+        self.timeout = timeout
+        self.usbRate = usbRate
+        self.pointTime = pointTime
+        self.settle = settle
+        self.sweepOverhead = sweepOverhead
+        self.is_open = True
+        self.port = "simulator"
+
+        # device state
+        self.start = 0
+        self.stop = int(preset.SA_INPUT_FREQS["low"][1])
+        self.pts = self.maxPoints
+        self.rbwSetting = "auto"    # kHz or "auto"
+        self.sweepTimeSetting = 0.0 # seconds, 0 for auto
+        self.settings = {}          # other setters, by command
+        self.measured = np.full(self.pts, -100.0, dtype=np.float64)
+        self.stored = np.full(self.pts, -100.0, dtype=np.float64)
+
+        # io
+        self.t0 = time.perf_counter()
+        self.clock = 0.0            # virtual device time, seconds
+        self.busyUntil = 0.0        # device time the last command finishes
+        self.lineBuf = bytearray()
+        self.outQueue = deque()     # (device time due, bytes)
+        self.pending = bytearray()  # due bytes not read yet
+        self.pos = 0
+        self.continuous = None      # (start, stop, pts) of a continuous scanraw
+        self.nextFrame = 0.0
+        self.commandCount = 0
+        self.sweepCount = 0
+        self.bytesSent = 0
+        self.cond = threading.Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+######################################################################
+# Model
+######################################################################
+
+    def now(self):
+        # current device time
+        if self.clockMode == "virtual":
+            return self.clock
+        return time.perf_counter() - self.t0
+
+    def rbw_hz(self, start, stop, pts):
+        # the RBW a sweep runs with. auto picks about one point per RBW
+        low, high = self.rbwLimits
+        if self.rbwSetting != "auto":
+            return min(max(float(self.rbwSetting) * 1e3, low), high)
+        return min(max((stop - start) / max(pts - 1, 1), low), high)
+
+    def sweep_time(self, start, stop, pts):
+        # modelled seconds for one sweep
+        t = self.sweepOverhead + pts * (self.pointTime + self.settle / self.rbw_hz(start, stop, pts))
+        return max(t, self.sweepTimeSetting)
+
+    def transfer_time(self, size):
+        return size / float(self.usbRate)
+
+    def spectrum(self, start, stop, pts):
+        # levels (dBm) of one sweep: the noise floor for the RBW, the
+        # signals shaped by the RBW filter, and measurement noise
+        rbw = self.rbw_hz(start, stop, pts)
+        freqs = np.linspace(start, stop, pts)
+        power = np.full(pts, 10**((-174.0 + 10*np.log10(rbw) + 18.0) / 10))
+        sigma = rbw / 2.355
+        for f0, level in self.signals:
+            d = (freqs - f0) / sigma
+            power = power + 10**(level / 10) * np.exp(-0.5 * np.minimum(d*d, 700.0))
+        levels = 10*np.log10(power) + self.rng.normal(0.0, 1.0, pts)
+        self.sweepCount = self.sweepCount + 1
+        self.measured = levels
+        return levels
+
+    def raw_levels(self, levels):
+        # dBm to the 16 bit scanraw values
+        raw = np.rint((levels + self.scanrawOffset) * self.scanrawScale)
+        return np.clip(raw, 0, 65535).astype('<u2')
+
+######################################################################
+# Output
+######################################################################
+
+    def queue(self, due, data):
+        # schedules data to arrive at device time 'due', after the
+        # bytes before it have been sent. returns when it has arrived
+        if len(self.outQueue) > 0:
+            due = max(due, self.outQueue[-1][0])
+        due = due + self.transfer_time(len(data))
+        self.outQueue.append((due, bytes(data)))
+        return due
+
+    def frame(self, start, stop, pts):
+        raw = self.raw_levels(self.spectrum(start, stop, pts))
+        out = np.empty((pts, 3), dtype=np.uint8)
+        out[:, 0] = ord('x')
+        out[:, 1:] = raw.view(np.uint8).reshape(pts, 2)
+        return b'{' + out.tobytes() + b'}'
+
+    def release(self):
+        # moves the output that is due into pending.
+        # returns the device time of the next output, or None
+        now = self.now()
+        while True:
+            if (len(self.outQueue) == 0) and (self.continuous != None):
+                # continuous frames are made as they are due
+                start, stop, pts = self.continuous
+                self.nextFrame = self.queue(self.nextFrame + self.sweep_time(start, stop, pts),
+                                            self.frame(start, stop, pts))
+            if len(self.outQueue) == 0:
+                return None
+            due, data = self.outQueue[0]
+            if due > now:
+                return due
+            self.outQueue.popleft()
+            self.pending += data
+            self.bytesSent = self.bytesSent + len(data)
+
+    def unread(self):
+        return len(self.pending) - self.pos
+
+######################################################################
+# Serial port interface
+######################################################################
+
+    @property
+    def in_waiting(self):
+        with self.cond:
+            self.release()
+            return self.unread()
+
+    def write(self, data):
+        # returns the number of bytes written, including a stop character
+        data = bytes(data)
+        n = len(data)
+        with self.cond:
+            if self.continuous != None:
+                # any character stops a continuous scanraw, after the
+                # frame being sent
+                self.continuous = None
+                self.outQueue.append((self.nextFrame, PROMPT))
+                self.busyUntil = self.nextFrame
+                data = data[1:]
+            for c in data:
+                if c in b'\r\n':
+                    if (c == ord('\n')) and (len(self.lineBuf) == 0):
+                        continue
+                    line = bytes(self.lineBuf)
+                    self.lineBuf = bytearray()
+                    self.run_line(line)
+                else:
+                    self.lineBuf.append(c)
+            self.cond.notify_all()
+        return n
+
+    def readinto(self, b):
+        # blocks up to the timeout for at least 1 byte, like serial.Serial
+        n = len(b)
+        if n == 0:
+            return 0
+        deadline = None
+        if self.timeout != None:
+            deadline = time.perf_counter() + self.timeout
+        with self.cond:
+            while True:
+                due = self.release()
+                if self.unread() > 0:
+                    count = min(n, self.unread())
+                    b[:count] = self.pending[self.pos:self.pos+count]
+                    self.pos = self.pos + count
+                    if self.pos == len(self.pending):
+                        self.pending = bytearray()
+                        self.pos = 0
+                    return count
+                if (self.clockMode == "virtual") and (due != None):
+                    # nothing to wait for. the device time jumps ahead
+                    self.clock = due
+                    continue
+                now = time.perf_counter()
+                if (deadline != None) and (now >= deadline):
+                    return 0
+                wait = None
+                if deadline != None:
+                    wait = deadline - now
+                if due != None:
+                    untilDue = max(0.0, due - self.now())
+                    wait = untilDue if wait == None else min(wait, untilDue)
+                self.cond.wait(wait)
+
+    def read(self, size=1):
+        buf = bytearray(size)
+        count = self.readinto(buf)
+        return bytes(buf[:count])
+
+    def reset_input_buffer(self):
+        with self.cond:
+            self.release()
+            self.pending = bytearray()
+            self.pos = 0
+
+    def close(self):
+        self.is_open = False
+
+######################################################################
+# Shell
+######################################################################
+
+    def run_line(self, line):
+        # echoes a command line and schedules its response and prompt
+        arrive = self.now()
+        self.queue(arrive, line + b'\r\n')
+        begin = max(arrive, self.busyUntil)
+        words = line.decode('utf-8', 'replace').split()
+        if len(words) == 0:
+            self.busyUntil = self.queue(begin, PROMPT)
+            return
+        self.commandCount = self.commandCount + 1
+        handler = getattr(self, "cmd_" + words[0], None)
+        if handler == None:
+            if words[0] in SETTERS:
+                self.settings[words[0]] = words[1:]
+                response, duration = b'', 0.0
+            else:
+                response, duration = bytes(words[0], 'utf-8') + b'?\r\n', 0.0
+        else:
+            response, duration = handler(words[1:])
+        if response == None:
+            # continuous output, no prompt until it is stopped
+            return
+        done = self.queue(begin + duration, response) if len(response) > 0 else begin + duration
+        self.busyUntil = self.queue(done, PROMPT)
+
+    def sweep_args(self, args):
+        # start stop [points] from a scan/scanraw/sweep command
+        start = int(float(args[0]))
+        stop = int(float(args[1]))
+        pts = self.pts
+        if len(args) > 2:
+            pts = int(args[2])
+        return start, stop, max(1, pts)
+
+    def cmd_version(self, args):
+        return VERSIONS[self.family] + b'\r\n', 0.0
+
+    def cmd_info(self, args):
+        name = b'tinySA' if self.family == "BASIC" else b'tinySA ULTRA'
+        return name + b' simulator\r\n' + VERSIONS[self.family] + b'\r\n', 0.0
+
+    def cmd_deviceid(self, args):
+        return b'deviceid 0\r\n', 0.0
+
+    def cmd_vbat(self, args):
+        return b'4132 mV\r\n', 0.0
+
+    def cmd_help(self, args):
+        names = [n[4:] for n in dir(self) if n.startswith("cmd_")] + SETTERS
+        return b'commands: ' + bytes(' '.join(sorted(names)), 'utf-8') + b'\r\n', 0.0
+
+    def cmd_rbw(self, args):
+        if len(args) == 0:
+            return b'usage: rbw 0.2..850|auto\r\n', 0.0
+        if args[0] == "auto":
+            self.rbwSetting = "auto"
+        else:
+            self.rbwSetting = float(args[0])
+        return b'', 0.0
+
+    def cmd_sweeptime(self, args):
+        if len(args) > 0:
+            self.sweepTimeSetting = float(args[0])
+        return b'', 0.0
+
+    def cmd_sweep(self, args):
+        if len(args) == 0:
+            return bytes(str(self.start) + ' ' + str(self.stop) + ' ' + str(self.pts), 'utf-8') + b'\r\n', 0.0
+        if args[0] in ["start", "stop", "center", "span", "cw"]:
+            if len(args) < 2:
+                return b'usage: sweep {start(Hz)} [stop(Hz)] [points]\r\n', 0.0
+            val = int(float(args[1]))
+            center = (self.start + self.stop) // 2
+            span = self.stop - self.start
+            if args[0] == "start":
+                self.start = val
+            elif args[0] == "stop":
+                self.stop = val
+            elif args[0] == "center":
+                self.start, self.stop = val - span//2, val + span//2
+            elif args[0] == "span":
+                self.start, self.stop = center - val//2, center + val//2
+            else:
+                self.start, self.stop = val, val
+            return b'', 0.0
+        self.start, self.stop, self.pts = self.sweep_args(args)
+        return b'', 0.0
+
+    def cmd_frequencies(self, args):
+        freqs = np.linspace(self.start, self.stop, self.pts).astype(np.int64)
+        return b''.join([b'%d\r\n' % f for f in freqs]), 0.0
+
+    def cmd_data(self, args):
+        trace = self.stored if (len(args) > 0 and args[0] == "1") else self.measured
+        return b''.join([b'%e\r\n' % v for v in trace]), 0.0
+
+    def cmd_scan(self, args):
+        if len(args) < 2:
+            return b'usage: scan {start(Hz)} {stop(Hz)} [points] [outmask]\r\n', 0.0
+        self.start, self.stop, self.pts = self.sweep_args(args)
+        outmask = 0
+        if len(args) > 3:
+            outmask = int(args[3])
+        duration = self.sweep_time(self.start, self.stop, self.pts)
+        levels = self.spectrum(self.start, self.stop, self.pts)
+        freqs = np.linspace(self.start, self.stop, self.pts).astype(np.int64)
+        if (outmask & 0x7) == 0:
+            return b'', duration
+        rows = []
+        for i in range(self.pts):
+            row = b''
+            if outmask & 1:
+                row += b'%d ' % freqs[i]
+            if outmask & 2:
+                row += b'%e ' % levels[i]
+            if outmask & 4:
+                row += b'%e ' % self.stored[i % len(self.stored)]
+            rows.append(row + b'\r\n')
+        return b''.join(rows), duration
+
+    def cmd_scanraw(self, args):
+        if len(args) < 2:
+            return b'usage: scanraw {start(Hz)} {stop(Hz)} [points] [option]\r\n', 0.0
+        self.start, self.stop, self.pts = self.sweep_args(args)
+        option = 0
+        if len(args) > 3:
+            option = int(args[3])
+        if option & 2:
+            # continuous. frames are made by release() until a write
+            self.continuous = (self.start, self.stop, self.pts)
+            self.nextFrame = max(self.now(), self.busyUntil)
+            return None, 0.0
+        duration = self.sweep_time(self.start, self.stop, self.pts)
+        return self.frame(self.start, self.stop, self.pts), duration
+
+    def cmd_capture(self, args):
+        return self.screen().astype('>u2').tobytes(), 0.0
+
+    def screen(self):
+        # RGB565 screen with a grid and the last measured trace
+        h, w = self.screenHeight, self.screenWidth
+        img = np.zeros((h, w), dtype=np.uint16)
+        img[::h//8, :] = 0x4208     # grey
+        img[:, ::w//10] = 0x4208
+        levels = self.measured
+        x = np.linspace(0, w - 1, len(levels)).astype(np.int64)
+        y = np.clip(((-levels) / 120.0 * (h - 1)).astype(np.int64), 0, h - 1)
+        img[y, x] = 0xFFE0          # yellow
+        return img
+
+
+class simulatorPty():
+    def __init__(self, sim=None, **kwargs):
+        # serves a tinySASimulator on a pseudo terminal
+        # sim: simulator to use. otherwise one is made from kwargs
+        import tty
+        self.sim = sim if sim != None else tinySASimulator(**kwargs)
+        self.sim.timeout = 0
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.name = os.ttyname(self.slave)
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def start(self):
+        # returns the port name to open, such as /dev/pts/3
+        self.stopEvent.clear()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        return self.name
+
+    def serve(self):
+        # moves the commands from the terminal to the simulator, and
+        # the output back as it is due
+        buf = bytearray(65536)
+        out = b''
+        os.set_blocking(self.master, False)
+        while not self.stopEvent.is_set():
+            wait = 0.05
+            with self.sim.cond:
+                due = self.sim.release()
+            if (len(out) == 0) and (due != None):
+                wait = min(wait, max(0.0, due - self.sim.now()))
+            writers = [self.master] if len(out) > 0 else []
+            readable, writable = select.select([self.master], writers, [], wait)[:2]
+            try:
+                if len(readable) > 0:
+                    self.sim.write(os.read(self.master, 4096))
+                if len(out) == 0:
+                    out = bytes(buf[:self.sim.readinto(buf)])
+                if len(out) > 0:
+                    out = out[os.write(self.master, out):]
+            except BlockingIOError:
+                pass
+            except OSError:
+                break
+
+    def stop(self):
+        self.stopEvent.set()
+        if self.thread != None:
+            self.thread.join()
+            self.thread = None
+        os.close(self.master)
+        os.close(self.slave)
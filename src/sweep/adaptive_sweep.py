@@ -0,0 +1,136 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  adaptive_sweep.py
+#
+#   Coarse to fine sweeps for finding signals. One coarse sweep covers
+#   the whole band, the windows around anything above a threshold (or
+#   around the strongest peaks) are picked out, and only those windows
+#   are swept again at full resolution. The narrower span also lets
+#   the RBW go down when it is set to auto.
+#
+#   The result is one trace: the fine points inside the windows and
+#   the coarse points everywhere else, in frequency order.
+##--------------------------------------------------------------------\
+
+import time
+
+import numpy as np
+
+try:
+    from src.sweep.sweep_result import sweepResult
+except:
+    from sweep.sweep_result import sweepResult
+
+
+def merge_windows(windows):
+    # merges overlapping (low, high) windows. returns them sorted
+    merged = []
+    for low, high in sorted(windows):
+        if (len(merged) > 0) and (low <= merged[-1][1]):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def find_windows(frequencies, levels, threshold=None, top_n=None, pad=2):
+    # picks the windows to sweep again from a coarse sweep.
+    # threshold: dBm. every run of points above it becomes a window
+    # top_n: the strongest top_n local peaks each become a window
+    # pad: coarse points added on each side of a window
+    # returns: list of (low, high) frequencies, merged and sorted
+    pts = len(levels)
+    windows = []
+    if pts < 3:
+        return windows
+    if threshold != None:
+        above = np.concatenate(([False], levels > threshold, [False]))
+        edges = np.flatnonzero(np.diff(above.astype(np.int8)))
+        for first, last in zip(edges[0::2], edges[1::2] - 1):
+            windows.append((max(first - pad, 0), min(last + pad, pts - 1)))
+    if top_n != None:
+        # local maxima, strongest first. NaN levels are never peaks
+        peaks = np.flatnonzero((levels[1:-1] >= levels[:-2]) & (levels[1:-1] > levels[2:])) + 1
+        peaks = peaks[np.argsort(levels[peaks], kind='stable')[::-1][:int(top_n)]]
+        for i in peaks:
+            windows.append((max(i - pad, 0), min(i + pad, pts - 1)))
+    return merge_windows([(float(frequencies[i0]), float(frequencies[i1])) for i0, i1 in windows])
+
+
+def merge_trace(coarse, fines, out=None):
+    # one trace from the coarse sweep and the fine sweeps. coarse points
+    # inside a fine window are replaced by the fine points
+    # fines: list of sweepResults, with non-overlapping ranges
+    bounds = np.array([[f.frequencies[0], f.frequencies[-1]] for f in fines], dtype=np.float64).reshape(-1)
+    # inside a window if an odd number of window edges are below it
+    inside = (np.searchsorted(bounds, coarse.frequencies, side='right') % 2) == 1
+    inside |= np.isin(coarse.frequencies, bounds)
+    keep = ~inside
+    freqs = np.concatenate([coarse.frequencies[keep]] + [f.frequencies for f in fines])
+    order = np.argsort(freqs, kind='stable')
+    pts = len(order)
+    if out is None:
+        out = sweepResult(pts)
+    out.reserve(pts)
+    out.frequencies[:] = freqs[order]
+    out.levels[:] = np.concatenate([coarse.levels[keep]] + [f.levels for f in fines])[order]
+    out.valid[:] = np.concatenate([coarse.valid[keep]] + [f.valid for f in fines])[order]
+    out.gridKey = None # not a linear grid
+    return out
+
+
+def previous_rbw(tsa):
+    # the rbw to set back after the fine sweeps: the last one set 
+    # through tsa (from its state cache), or "auto" if it is not known.
+    # the device has no command that reads the rbw back
+    writebyte = tsa.stateCache.get('rbw')
+    if writebyte != None:
+        val = writebyte.split()[-1]
+        if val != "auto":
+            try:
+                return int(val)
+            except ValueError:
+                pass
+    return "auto"
+
+
+def adaptive_sweep(tsa, start, stop, coarse_pts=450, fine_pts=450, threshold=None, top_n=None,
+                   pad=2, fine_rbw=None, unbuf=1, out=None):
+    # coarse sweep, then fine sweeps of the windows found in it.
+    # tsa: connected tinySA object
+    # threshold, top_n, pad: see find_windows()
+    # fine_rbw: optional rbw (kHz) for the fine sweeps. the rbw is set
+    #   back afterwards, even if a fine sweep fails (see previous_rbw()).
+    #   None leaves the rbw alone
+    # out: optional sweepResult to reuse for the merged trace
+    # returns: merged sweepResult, None if a sweep failed
+    coarse = tsa.scan_raw_arrays(start, stop, coarse_pts, unbuf)
+    if coarse == None:
+        return None
+    windows = find_windows(coarse.frequencies, coarse.levels, threshold, top_n, pad)
+
+    fines = []
+    changeRbw = (len(windows) > 0) and (fine_rbw != None)
+    if changeRbw == True:
+        previous = previous_rbw(tsa)
+        tsa.rbw(fine_rbw)
+    try:
+        for low, high in windows:
+            fine = tsa.scan_raw_arrays(int(round(low)), int(round(high)), fine_pts, unbuf)
+            if fine == None:
+                tsa.print_message("ERROR: fine sweep " + str(low) + " to " + str(high) + " failed")
+                break
+            fines.append(fine)
+    finally:
+        if changeRbw == True:
+            tsa.rbw(previous)
+    if len(fines) != len(windows):
+        return None
+
+    out = merge_trace(coarse, fines, out)
+    out.timestamp = time.time()
+    out.settings = {"command": "scanraw", "start": start, "stop": stop, "pts": len(out),
+                    "coarse_pts": coarse_pts, "fine_pts": fine_pts, "windows": windows,
+                    "device_type": tsa.deviceType}
+    return out
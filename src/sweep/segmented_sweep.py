@@ -0,0 +1,85 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  segmented_sweep.py
+#
+#   Sweeps wider (or finer) than the device allows in one scan. The
+#   requested sweep is laid out as one linear grid of points, and the
+#   grid is split into consecutive segments of at most maxPoints. Each
+#   segment is scanned from its first to its last grid point, so no
+#   point is measured twice and nothing has to be merged at the
+#   segment edges.
+#
+#   The segments are decoded straight into slices of one result, so
+#   a reused 'out' means nothing is allocated per sweep.
+##--------------------------------------------------------------------\
+
+import math
+import time
+
+import numpy as np
+
+try:
+    from src.sweep.sweep_result import sweepResult
+except:
+    from sweep.sweep_result import sweepResult
+
+
+def total_points(start, stop, resolution):
+    # number of grid points for a sweep with points at most
+    # resolution (Hz) apart
+    return int(math.ceil((stop - start) / float(resolution))) + 1
+
+
+def plan_segments(start, stop, pts, maxPoints):
+    # splits a sweep of pts points into segments of at most maxPoints.
+    # the segments are as even in size as possible.
+    # returns: list of (segStart, segStop, segPts, index), where index
+    #   is the position of the first point of the segment in the sweep
+    grid = np.linspace(start, stop, pts)
+    nseg = int(math.ceil(pts / float(maxPoints)))
+    bounds = np.linspace(0, pts, nseg + 1).round().astype(np.int64)
+    segments = []
+    for i in range(nseg):
+        i0 = int(bounds[i])
+        i1 = int(bounds[i+1])
+        segments.append((int(round(grid[i0])), int(round(grid[i1-1])), i1 - i0, i0))
+    return segments
+
+
+def segmented_sweep(tsa, start, stop, pts=None, resolution=None, unbuf=1, out=None, method="scanraw"):
+    # runs the segments of a wide sweep back to back.
+    # tsa: connected tinySA object
+    # pts: total points, or resolution: max Hz between points
+    # method: "scanraw"|"scan", the command used for each segment
+    # out: optional sweepResult to reuse
+    # returns: sweepResult of the whole sweep, None if any segment failed
+    if pts == None:
+        pts = total_points(start, stop, resolution)
+    pts = int(pts)
+    if out is None:
+        out = sweepResult(pts)
+    out.reserve(pts)
+
+    segments = plan_segments(start, stop, pts, tsa.maxPoints)
+    for segStart, segStop, segPts, index in segments:
+        # the segment result writes straight into the slices of out
+        seg = sweepResult(0, out.frequencies[index:index+segPts],
+                          out.levels[index:index+segPts], out.valid[index:index+segPts])
+        if method == "scan":
+            res = tsa.scan_arrays(segStart, segStop, segPts, seg)
+        else:
+            res = tsa.scan_raw_arrays(segStart, segStop, segPts, unbuf, seg)
+        if res == None:
+            tsa.print_message("ERROR: segment " + str(segStart) + " to " + str(segStop) + " failed")
+            return None
+
+    # the segments wrote their own frequencies
+    out.gridKey = None
+    if method != "scan":
+        # the exact sweep grid, instead of the rounded segment edges
+        out.set_grid(start, stop, pts)
+    out.timestamp = time.time()
+    out.settings = {"command": method, "start": start, "stop": stop, "pts": pts,
+                    "segments": len(segments), "device_type": tsa.deviceType}
+    return out
@@ -0,0 +1,96 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  sweep_result.py
+#
+#   Result of a single sweep as numpy arrays, plus the settings and
+#   time it was taken with. A result can be passed back in as 'out'
+#   to the sweep functions so that its arrays are reused instead of
+#   allocating new ones for every sweep.
+##--------------------------------------------------------------------\
+
+import numpy as np
+
+
+def frequency_grid(start, stop, pts, out=None):
+    # the frequencies of a sweep of pts points from start to stop (Hz)
+    # out: optional float64 array of at least pts values to write into
+    if out is None:
+        return np.linspace(start, stop, pts)
+    out = out[:pts]
+    out[:] = np.linspace(start, stop, pts)
+    return out
+
+
+class sweepResult():
+    def __init__(self, pts=0, frequencies=None, levels=None, valid=None):
+        # pts: number of points to allocate for
+        # frequencies, levels, valid: optional preallocated arrays
+        #   (float64, float32, bool) to use instead. they can be
+        #   longer than a sweep, only the first pts values are used
+        if frequencies is None:
+            frequencies = np.empty(pts, dtype=np.float64)
+        if levels is None:
+            levels = np.empty(pts, dtype=np.float32)
+        if valid is None:
+            valid = np.ones(pts, dtype=bool)
+        self.freqBuf = frequencies
+        self.levelBuf = levels
+        self.validBuf = valid
+
+        # views of the current sweep
+        self.frequencies = self.freqBuf[:0]
+        self.levels = self.levelBuf[:0]
+        self.valid = self.validBuf[:0]
+
+        self.timestamp = None   # time.time() when the sweep finished
+        self.settings = {}      # start, stop, pts, and anything else known
+        self.gridKey = None     # (start, stop, pts) the frequencies were computed for
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __repr__(self):
+        return "sweepResult(pts=" + str(len(self)) + ", settings=" + str(self.settings) + ")"
+
+    def capacity(self):
+        return min(len(self.freqBuf), len(self.levelBuf), len(self.validBuf))
+
+    def reserve(self, pts):
+        # sizes the current sweep views to pts. the buffers are only
+        # reallocated if they are too small
+        if self.capacity() < pts:
+            self.freqBuf = np.empty(pts, dtype=np.float64)
+            self.levelBuf = np.empty(pts, dtype=np.float32)
+            self.validBuf = np.ones(pts, dtype=bool)
+            self.gridKey = None
+        if len(self.levels) != pts:
+            self.frequencies = self.freqBuf[:pts]
+            self.levels = self.levelBuf[:pts]
+            self.valid = self.validBuf[:pts]
+
+    def set_grid(self, start, stop, pts):
+        # fills in the frequencies for a start/stop/pts sweep.
+        # skipped when the grid is unchanged from the last sweep
+        key = (start, stop, pts)
+        if self.gridKey != key:
+            frequency_grid(start, stop, pts, self.frequencies)
+            self.gridKey = key
+
+    def set_settings(self, command, start, stop, pts, deviceType):
+        # writes the settings of a sweep into the existing settings dict,
+        # so a reused result does not get a new dict every sweep
+        self.settings["command"] = command
+        self.settings["start"] = start
+        self.settings["stop"] = stop
+        self.settings["pts"] = pts
+        self.settings["device_type"] = deviceType
+
+    def copy(self):
+        # an independent copy of the current sweep
+        res = sweepResult(0, self.frequencies.copy(), self.levels.copy(), self.valid.copy())
+        res.reserve(len(self))
+        res.timestamp = self.timestamp
+        res.settings = dict(self.settings)
+        res.gridKey = self.gridKey
+        return res
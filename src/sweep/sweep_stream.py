@@ -0,0 +1,271 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  sweep_stream.py
+#
+#   Continuous scanraw streaming. The device is started once with the
+#   continuous option of scanraw and keeps sending '{...}' frames
+#   back to back until any character is received. A reader thread
+#   decodes each frame straight into a fixed size ring buffer, and the
+#   stream is iterated to get the sweeps out.
+#
+#   When the ring is full, the policy decides what happens:
+#       "drop_oldest": the oldest sweep is overwritten and counted as dropped
+#       "block": the reader waits for the consumer. the device output
+#                backs up in the USB buffers until there is room
+#
+#   NOTE: the tinySA object must not be used for other commands while
+#   a stream is running.
+##--------------------------------------------------------------------\
+
+import threading
+import time
+
+import numpy as np
+
+try:
+    from src.data_decode.scanraw_decode import decode_scanraw
+    from src.recording.sweep_recording import cached_value
+    from src.serial_stream import framing
+    from src.sweep.sweep_result import sweepResult
+except:
+    from data_decode.scanraw_decode import decode_scanraw
+    from recording.sweep_recording import cached_value
+    from serial_stream import framing
+    from sweep.sweep_result import sweepResult
+
+SCANRAW_CONTINUOUS = 2  # scanraw option bit
+STOP_CHAR = b' '        # any character stops the stream. a space is
+                        # ignored by the shell if it is not consumed
+
+
+class sweepRing():
+    def __init__(self, capacity, pts, policy="drop_oldest"):
+        # capacity: number of sweeps held
+        # pts: points per sweep
+        # policy: "drop_oldest"|"block"
+        if not(policy in ["drop_oldest", "block"]):
+            raise ValueError("policy must be 'drop_oldest' or 'block'")
+        self.capacity = int(capacity)
+        self.pts = int(pts)
+        self.policy = policy
+        self.levels = np.empty((self.capacity, self.pts), dtype=np.float32)
+        self.timestamps = np.zeros(self.capacity, dtype=np.float64)
+        self.head = 0       # next slot to write
+        self.count = 0      # sweeps held
+        self.pushed = 0
+        self.dropped = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def __len__(self):
+        return self.count
+
+    def reserve_slot(self):
+        # returns the row to write the next sweep into, or None if closed.
+        # under "block" this waits for room, under "drop_oldest" a full
+        # ring gives up its oldest sweep
+        with self.cond:
+            while (self.count == self.capacity) and (self.closed == False):
+                if self.policy == "drop_oldest":
+                    self.count = self.count - 1
+                    self.dropped = self.dropped + 1
+                    break
+                self.cond.wait()
+            if self.closed == True:
+                return None
+            return self.levels[self.head]
+
+    def commit(self, timestamp):
+        # marks the reserved slot as a finished sweep
+        with self.cond:
+            self.timestamps[self.head] = timestamp
+            self.head = (self.head + 1) % self.capacity
+            self.count = min(self.count + 1, self.capacity)
+            self.pushed = self.pushed + 1
+            self.cond.notify_all()
+
+    def pop_into(self, out, timeout=None):
+        # copies the oldest sweep into out.levels and returns its timestamp.
+        # returns None if the ring is closed and empty, or on timeout
+        with self.cond:
+            if self.cond.wait_for(lambda: (self.count > 0) or self.closed, timeout) == False:
+                return None
+            if self.count == 0:
+                return None
+            tail = (self.head - self.count) % self.capacity
+            out.levels[:] = self.levels[tail]
+            timestamp = self.timestamps[tail]
+            self.count = self.count - 1
+            self.cond.notify_all()
+            return timestamp
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class sweepStream():
+    def __init__(self, tsa, start, stop, pts=250, unbuf=1, capacity=16, policy="drop_oldest", spectrogram=None,
+                 recorder=None):
+        # tsa: connected tinySA object
+        # start, stop, pts: sweep settings
+        # unbuf: 0|1, the unbuffered option of scanraw
+        # capacity, policy: see sweepRing
+        # spectrogram: optional spectrogramRing every sweep is also 
+        #   appended to, from the reader thread
+        # recorder: optional sweepRecorder every sweep is also written
+        #   to, from the reader thread
+        self.tsa = tsa
+        self.start = start
+        self.stop_freq = stop
+        self.pts = pts
+        self.unbuf = unbuf
+        self.ring = sweepRing(capacity, pts, policy)
+        self.spectrogram = spectrogram
+        self.recorder = recorder
+        self.frameSize = framing.scanraw_size(pts) - 1 # after the '{'
+
+        self.stopEvent = threading.Event()
+        self.thread = None
+        self.error = None
+        self.resyncs = 0
+        self.startTime = None
+        self.stopTime = None
+
+    def __enter__(self):
+        if self.thread == None:
+            self.begin()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def __iter__(self):
+        return self.sweeps()
+
+    def begin(self):
+        # sends the continuous scanraw command and starts the reader thread
+        option = SCANRAW_CONTINUOUS | (int(self.unbuf) & 1)
+        writebyte = 'scanraw '+str(self.start)+' '+str(self.stop_freq)+' '+str(self.pts)+' '+str(option)+'\r\n'
+        self.tsa.expire_state(writebyte)
+        self.tsa.ser.write(bytes(writebyte, 'utf-8'))
+        self.startTime = time.monotonic()
+        self.thread = threading.Thread(target=self.read_loop, daemon=True)
+        self.thread.start()
+
+    def read_loop(self):
+        # reader thread. decodes frames into the ring until stopped
+        reader = self.tsa.stream_reader()
+        timeout = self.tsa.responseTimeout
+        scale = self.tsa.scanrawScale
+        offset = self.tsa.scanrawOffset
+        tracer = self.tsa.tracer
+        if self.recorder is not None:
+            # settings can not change while the stream runs
+            rbw = cached_value(self.tsa, 'rbw')
+            attenuation = cached_value(self.tsa, 'attenuate')
+        try:
+            # the command echo
+            reader.read_until(b'\r\n', timeout)
+            while not self.stopEvent.is_set():
+                # anything before the '{' is out of frame
+                skipped = reader.read_until(b'{', timeout)
+                if reader.timedOut == True:
+                    raise TimeoutError("no scanraw frame received")
+                if len(skipped) > 1:
+                    self.resyncs = self.resyncs + 1
+                frame = reader.read_exact(self.frameSize, timeout)
+                if reader.timedOut == True:
+                    raise TimeoutError("incomplete scanraw frame")
+                if frame[-1:] != b'}':
+                    self.resyncs = self.resyncs + 1
+                    continue
+                slot = self.ring.reserve_slot()
+                if slot is None:
+                    break
+                if tracer != None:
+                    decodeStart = time.perf_counter_ns()
+                decode_scanraw(frame, self.pts, scale, offset, slot)
+                if tracer != None:
+                    tracer.add("decode", "decode", decodeStart, time.perf_counter_ns())
+                timestamp = time.time()
+                if self.spectrogram is not None:
+                    self.spectrogram.append(slot, timestamp)
+                if self.recorder is not None:
+                    self.recorder.write(slot, timestamp, self.start, self.stop_freq, rbw, attenuation)
+                self.ring.commit(timestamp)
+        except Exception as err:
+            self.error = err
+            self.tsa.print_message("ERROR: scanraw stream stopped")
+            self.tsa.print_message(err)
+        finally:
+            self.end_stream(reader)
+            self.stopTime = time.monotonic()
+            self.ring.close()
+
+    def end_stream(self, reader):
+        # stops the device and reads up to its prompt, skipping whole
+        # frames so binary data is never mistaken for the prompt
+        try:
+            self.tsa.ser.write(STOP_CHAR)
+            while True:
+                lead = reader.read_exact(1, 2.0)
+                if reader.timedOut == True:
+                    break
+                if lead == b'{':
+                    reader.read_exact(self.frameSize, 2.0)
+                elif lead == b'c':
+                    reader.read_until(b'>', 2.0)
+                    break
+        except Exception as err:
+            self.tsa.print_message("ERROR: could not stop the scanraw stream")
+            self.tsa.print_message(err)
+
+    def stop(self):
+        # stops the device stream and the reader thread.
+        # sweeps already in the ring can still be iterated
+        self.stopEvent.set()
+        if self.ring.policy == "block":
+            # wake the reader if it is waiting for room
+            self.ring.close()
+        if self.thread != None:
+            self.thread.join()
+
+    def sweeps(self, out=None, timeout=None):
+        # generator of sweepResults, oldest first. ends when the stream
+        # is stopped and the ring is empty.
+        # out: optional sweepResult that is filled and yielded every time.
+        #   use out.copy() to keep a sweep
+        if out is None:
+            out = sweepResult(self.pts)
+        out.reserve(self.pts)
+        out.set_grid(self.start, self.stop_freq, self.pts)
+        out.valid[:] = True
+        out.settings = {"command": "scanraw", "start": self.start, "stop": self.stop_freq,
+                        "pts": self.pts, "device_type": self.tsa.deviceType, "continuous": True}
+        if self.thread == None:
+            self.begin()
+        while True:
+            timestamp = self.ring.pop_into(out, timeout)
+            if timestamp == None:
+                return
+            out.timestamp = timestamp
+            yield out
+
+    def sweeps_per_sec(self):
+        # sweeps received per second since the stream started
+        if self.startTime == None:
+            return 0.0
+        end = self.stopTime if self.stopTime != None else time.monotonic()
+        if end <= self.startTime:
+            return 0.0
+        return self.ring.pushed / (end - self.startTime)
+
+    def stats(self):
+        return {"sweeps": self.ring.pushed,
+                "dropped": self.ring.dropped,
+                "queued": len(self.ring),
+                "resyncs": self.resyncs,
+                "sweeps_per_sec": self.sweeps_per_sec()}
@@ -0,0 +1,547 @@
+#! /usr/bin/python3
+
+##------------------------------------------------------------------------------------------------\
+#   tinySA_python
+#   './tinySA_async.py'
+#   asyncio client for the tinySA. The device commands of the tinySA class are
+#   available as awaitables, so one event loop can drive several devices without
+#   a thread per device.
+#
+#   For the commands in ASYNC_COMMANDS, which send their command(s) and return the
+#   response as is, the tinySA class is used to check the arguments and build the
+#   command strings (its commands are recorded instead of sent). The functions
+#   that decode or combine responses (scan_arrays(), capture_array(), 
+#   scan_segmented(), sweeps(), ...) have their own implementations here. 
+#   The port is read when the event loop reports it readable. On platforms where
+#   the loop cannot watch a serial port (Windows), the port is polled with short
+#   sleeps instead.
+##--------------------------------------------------------------------------------------------------\
+
+import asyncio
+import time
+
+import serial
+import serial.tools.list_ports
+
+try:
+    from src.tinySA_python import tinySA
+    from src.serial_stream.rx_buffer import rxBuffer
+    from src.serial_stream import framing
+    from src.data_decode.scanraw_decode import decode_scanraw
+    from src.data_decode.text_decode import parse_scan_into
+    from src.sweep.sweep_result import sweepResult
+    from src.sweep.sweep_stream import SCANRAW_CONTINUOUS, STOP_CHAR
+    from src.sweep.segmented_sweep import total_points, plan_segments
+    from src.screen.rgb565_decode import decode_rgb565
+    from src.screen.png_writer import encode_png
+except:
+    from tinySA_python import tinySA
+    from serial_stream.rx_buffer import rxBuffer
+    from serial_stream import framing
+    from data_decode.scanraw_decode import decode_scanraw
+    from data_decode.text_decode import parse_scan_into
+    from sweep.sweep_result import sweepResult
+    from sweep.sweep_stream import SCANRAW_CONTINUOUS, STOP_CHAR
+    from sweep.segmented_sweep import total_points, plan_segments
+    from screen.rgb565_decode import decode_rgb565
+    from screen.png_writer import encode_png
+
+# tinySA functions available as awaitables through the recorded commands.
+# they only send commands and return the response of the last one as is.
+# functions that decode or combine responses are written out in asyncTinySA
+ASYNC_COMMANDS = [
+    "abort", "enable_abort", "disable_abort", "abort_action", "actual_freq",
+    "set_actual_freq", "get_actual_freq", "agc", "set_agc", "attenuate",
+    "set_attenuation", "bulk", "get_bulk_data", "calc", "set_calc_off",
+    "set_calc_minh", "set_calc_maxh", "set_calc_maxd", "set_calc_aver4",
+    "set_calc_aver16", "set_calc_quasip", "cal_output", "capture", "capture_screen",
+    "clear_config", "clear_and_reset", "color", "get_all_colors", "get_color",
+    "set_color", "command", "correction", "dac", "set_dac", "get_dac", "data",
+    "get_temporary_data", "get_stored_trace_data", "dump_measurement_data",
+    "device_id", "get_device_id", "set_device_id", "direct", "set_direct_on",
+    "set_direct_off", "set_direct_start", "set_direct_stop", "ext_gain",
+    "set_ext_gain", "fill", "get_fill_data", "freq", "set_freq", "freq_corr",
+    "get_frequency_correction", "frequencies", "get_last_freqs", "hop",
+    "get_sample_pts", "set_IF", "set_IF1", "info", "get_info", "level", "set_level",
+    "level_change", "set_level_change", "line", "line_off", "set_line", "load", "lna",
+    "set_lna_on", "set_lna_off", "lna2", "set_lna2", "marker", "marker_on",
+    "marker_off", "marker_peak", "marker_freq", "marker_index", "menu", "mode",
+    "set_low_input_mode", "set_low_output_mode", "set_high_input_mode",
+    "set_high_output_mode", "modulation", "set_mod_off", "set_mod_AM_1khz",
+    "set_mod_AM_10Hz", "set_mod_NFM", "set_mod_WFM", "set_mod_extern", "nf", "get_nf",
+    "output", "set_output_on", "set_output_off", "pause", "rbw", "set_rbw_auto",
+    "recall", "refresh", "refresh_on", "refresh_off", "release", "remark", "repeat",
+    "reset", "reset_device", "restart", "restart_device", "cancel_restart", "resume",
+    "save", "save_config", "scan", "sd_delete", "sd_list", "sd_read", "self_test",
+    "spur", "spur_on", "spur_off", "status", "config_sweep", "get_sweep_params",
+    "set_sweep_start", "set_sweep_stop", "set_sweep_center", "set_sweep_span",
+    "set_sweep_cw", "run_sweep", "sweep_time", "temp", "get_temp", "text", "threads",
+    "touch", "preform_touch", "touch_cal", "start_touch_cal", "touch_test",
+    "start_touch_test", "trace_select", "trace_units", "trace_scale", "trace_reflevel",
+    "trace_value", "trace_toggle", "trace_subtract", "trace_copy", "trace_freeze",
+    "trace_clear", "trace_action", "trigger", "trigger_auto",
+    "trigger_normal", "trigger_single", "trigger_level", "ultra", "set_ultra_on",
+    "set_ultra_off", "set_ultra_auto", "set_ultra_start", "set_ultra_harmonic",
+    "usart_cfg", "get_usart_cfg", "vbat", "get_vbat", "vbat_offset", "get_vbat_offset",
+    "set_vbat_offset", "version", "get_version", "wait", "zero", "get_zero_offset",
+    "tinySA_help"]
+
+
+class asyncStreamReader():
+    # asyncio version of streamReader. owns every received byte that
+    # has not been handed out yet
+    def __init__(self, ser, pollInterval=0.002):
+        self.ser = ser
+        self.rxBuf = rxBuffer()
+        self.pollInterval = pollInterval
+        self.dataEvent = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        self.watching = False
+        try:
+            self.loop.add_reader(self.ser.fileno(), self.on_readable)
+            self.watching = True
+        except Exception:
+            # no fileno() or the loop cannot watch it. poll instead
+            self.watching = False
+
+    def __len__(self):
+        return len(self.rxBuf)
+
+    def close(self):
+        if self.watching == True:
+            self.loop.remove_reader(self.ser.fileno())
+            self.watching = False
+
+    def discard(self):
+        self.rxBuf.clear()
+
+    def on_readable(self):
+        # called by the event loop. the port has a timeout of 0, so this never blocks
+        self.rxBuf.fill(self.ser, max(1, self.ser.in_waiting))
+        self.dataEvent.set()
+
+    async def wait_data(self):
+        if self.watching == True:
+            self.dataEvent.clear()
+            await self.dataEvent.wait()
+        else:
+            await asyncio.sleep(self.pollInterval)
+            if self.ser.in_waiting > 0:
+                self.rxBuf.fill(self.ser, self.ser.in_waiting)
+
+    async def read_until(self, marker, timeout=None):
+        # returns everything up to and including marker. see streamReader
+        async def until():
+            while True:
+                end_pos = self.rxBuf.find(marker)
+                if end_pos != -1:
+                    return end_pos + len(marker)
+                await self.wait_data()
+        n = await asyncio.wait_for(until(), timeout)
+        return self.rxBuf.take(n)
+
+    async def read_exact(self, n, timeout=None):
+        # returns exactly n bytes. see streamReader
+        async def exact():
+            while len(self.rxBuf) < n:
+                await self.wait_data()
+        await asyncio.wait_for(exact(), timeout)
+        return self.rxBuf.take(n)
+
+
+class asyncTinySA():
+    def __init__(self, parent=None):
+        # used to check args and build commands. never touches the port
+        self.tsa = tinySA()
+        self.tsa.commandQueue = []
+
+        self.ser = None
+        self.reader = None
+        self.lock = None
+        # cleanup left by a cancelled command. run before the next command
+        self.recovery = None
+
+        # max seconds to wait for a response. None waits for the prompt
+        self.responseTimeout = None
+        # send 'abort' when a running command is cancelled
+        self.abortOnCancel = True
+
+######################################################################
+# Serial management
+######################################################################
+
+    async def autoconnect(self, timeout=1):
+        # connects to the first tinySA found. see tinySA.autoconnect()
+        # returns: found_bool, connected_bool
+        for port_info in serial.tools.list_ports.comports():
+            if (port_info.vid != None) and (hex(port_info.vid) == '0x483') and (hex(port_info.pid) == '0x5740'):
+                self.print_message(f"tinySA device identified at port: {port_info.device}")
+                return True, await self.connect(port_info.device, timeout)
+        return False, False
+
+    async def connect(self, port, timeout=1, enable_abort=True):
+        # opens the port. timeout is only used while opening, reads
+        # are driven by the event loop.
+        # enable_abort: send 'abort on' so a cancelled command can abort the sweep
+        # returns: True if successful, False otherwise
+        try:
+            self.ser = serial.Serial(port=port, timeout=timeout)
+        except Exception as err:
+            self.print_message("ERROR: cannot open port at " + str(port))
+            self.print_message(err)
+            return False
+        self.open(self.ser)
+        if enable_abort == True:
+            await self.abort("on")
+        return True
+
+    def open(self, ser):
+        # use an already open pyserial compatible port
+        self.ser = ser
+        self.ser.timeout = 0 # reads never block the loop
+        self.reader = asyncStreamReader(self.ser)
+        self.lock = asyncio.Lock()
+        self.recovery = None
+
+    def disconnect(self):
+        if self.reader != None:
+            self.reader.close()
+        self.ser.close()
+
+    def print_message(self, msg):
+        self.tsa.print_message(msg)
+
+    def set_response_timeout(self, timeout=None):
+        self.responseTimeout = timeout
+
+    def set_verbose(self, verbose=False):
+        self.tsa.set_verbose(verbose)
+
+    def set_error_byte_return(self, errByte=False):
+        self.tsa.set_error_byte_return(errByte)
+
+    def set_device_type(self, device):
+        # see tinySA.set_device_type()
+        return self.tsa.set_device_type(device)
+
+    def get_device_type(self):
+        return self.tsa.get_device_type()
+
+    def clear_state_cache(self):
+        self.tsa.clear_state_cache()
+
+######################################################################
+# Sending commands
+######################################################################
+
+    def __getattr__(self, name):
+        # the tinySA functions in ASYNC_COMMANDS, as coroutines. the 
+        # tinySA function checks the args and builds the command(s), 
+        # which are then sent here.
+        # returns the cleaned response of the last command, or what the
+        # tinySA function returned if it did not send anything (errors)
+        if not(name in ASYNC_COMMANDS):
+            raise AttributeError("'asyncTinySA' object has no attribute '" + name + "'")
+        method = getattr(self.tsa, name)
+        async def call(*args, **kwargs):
+            queue = self.tsa.commandQueue
+            del queue[:]
+            result = method(*args, **kwargs)
+            commands = list(queue)
+            del queue[:]
+            if len(commands) == 0:
+                return result
+            for writebyte, size, payload_size, stateKey in commands:
+                result = await self.send(writebyte, size, payload_size)
+                # only after the device has answered
+                self.tsa.confirm_state(writebyte, stateKey, result)
+            return result
+        return call
+
+    async def send(self, writebyte, size=None, payload_size=None):
+        # sends one command and returns its response as a bytearray
+        # size: None for prompt delimited responses, otherwise the binary
+        #   payload size (see tinySA.tinySA_serial_binary())
+        # if the response does not arrive (timeout, cancellation or any
+        # other error), the rest of it is skipped before the next command
+        async with self.lock:
+            if self.recovery != None:
+                await self.recovery
+                self.recovery = None
+            self.ser.write(bytes(writebyte, 'utf-8'))
+            try:
+                if size == None:
+                    msgbytes = await self.reader.read_until(b'>', self.responseTimeout)
+                    return bytearray(self.tsa.clean_return(msgbytes))
+                await self.reader.read_until(b'\r\n', self.responseTimeout)
+                msgbytes = bytearray(await self.reader.read_exact(size, self.responseTimeout))
+                if payload_size != None:
+                    msgbytes += await self.reader.read_exact(payload_size(msgbytes), self.responseTimeout)
+                await self.reader.read_until(framing.PROMPT, self.responseTimeout)
+                return msgbytes
+            except BaseException:
+                self.start_recovery()
+                raise
+
+    def start_recovery(self):
+        # a command failed (cancelled, timed out or raised) while the 
+        # device was still answering it. abort the sweep, and skip the
+        # rest of the response in the background so the next command 
+        # starts aligned. the device state is unknown after an abort
+        self.tsa.clear_state_cache()
+        prompts = 1
+        if (self.abortOnCancel == True) and (self.tsa.abortEnabled == True):
+            self.ser.write(b'abort\r\n')
+            prompts = 2
+        self.recovery = asyncio.ensure_future(self.resync(prompts))
+
+    async def resync(self, prompts, quiet=0.05):
+        # reads through the given number of prompts, then drops anything
+        # that arrives before the port goes quiet
+        try:
+            for _ in range(prompts):
+                await self.reader.read_until(framing.PROMPT, 5.0)
+            while True:
+                await asyncio.sleep(quiet)
+                if (len(self.reader) == 0) and (self.ser.in_waiting == 0):
+                    break
+                self.reader.discard()
+        except asyncio.TimeoutError:
+            self.reader.discard()
+
+######################################################################
+# Sweeps and captures
+######################################################################
+
+    async def scan_raw(self, start, stop, pts=250, unbuf=1):
+        # awaitable tinySA.scan_raw(). the closing '}' is removed the same way
+        if not((0<=start) and (start < stop) and (pts <= self.tsa.maxPoints) and (unbuf in [0,1])):
+            return self.tsa.scan_raw(start, stop, pts, unbuf) # error message and return
+        writebyte = 'scanraw '+str(start)+' '+str(stop)+' '+str(pts)+ ' '+str(unbuf)+'\r\n'
+        self.tsa.expire_state(writebyte)
+        msgbytes = await self.send(writebyte, framing.scanraw_size(pts))
+        if msgbytes[-1:] == b'}':
+            msgbytes = msgbytes[:-1]
+        return msgbytes
+
+    async def scan_raw_array(self, start, stop, pts=250, unbuf=1, out=None):
+        # awaitable tinySA.scan_raw_array()
+        msgbytes = await self.scan_raw(start, stop, pts, unbuf)
+        if len(msgbytes) < framing.scanraw_size(pts) - 1: # no closing '}'
+            self.print_message("ERROR: scanraw returned " + str(len(msgbytes)) + " bytes for " + str(pts) + " points")
+            return None
+        return decode_scanraw(msgbytes, pts, self.tsa.scanrawScale, self.tsa.scanrawOffset, out)
+
+    async def scan_raw_arrays(self, start, stop, pts=250, unbuf=1, out=None):
+        # awaitable tinySA.scan_raw_arrays()
+        if not((0<=start) and (start < stop) and (pts <= self.tsa.maxPoints) and (unbuf in [0,1])):
+            self.print_message("ERROR: scan_raw_arrays takes START STOP PTS UNBUF=0|1 as args. Check doc for format and limits")
+            return None
+        writebyte = 'scanraw '+str(start)+' '+str(stop)+' '+str(pts)+ ' '+str(unbuf)+'\r\n'
+        self.tsa.expire_state(writebyte)
+        frame = await self.send(writebyte, framing.scanraw_size(pts))
+        if len(frame) != framing.scanraw_size(pts):
+            self.print_message("ERROR: scanraw returned an incomplete frame")
+            return None
+        if out is None:
+            out = sweepResult(pts)
+        out.reserve(pts)
+        decode_scanraw(frame, pts, self.tsa.scanrawScale, self.tsa.scanrawOffset, out.levels)
+        out.valid[:] = True
+        out.set_grid(start, stop, pts)
+        out.timestamp = time.time()
+        out.set_settings("scanraw", start, stop, pts, self.tsa.deviceType)
+        return out
+
+    async def scan_arrays(self, start, stop, pts=250, out=None):
+        # awaitable tinySA.scan_arrays()
+        msgbytes = await self.scan(start, stop, pts, 3)
+        if out is None:
+            out = sweepResult(pts)
+        out.reserve(pts)
+        rows = parse_scan_into(msgbytes, out.frequencies, out.levels, out.valid)
+        out.gridKey = None
+        if rows != pts:
+            self.print_message("ERROR: scan returned " + str(rows) + " of " + str(pts) + " points")
+            return None
+        out.timestamp = time.time()
+        out.set_settings("scan", start, stop, pts, self.tsa.deviceType)
+        return out
+
+    async def scan_segmented(self, start, stop, pts=None, resolution=None, unbuf=1, out=None, method="scanraw"):
+        # awaitable tinySA.scan_segmented(). see segmented_sweep()
+        if (pts == None) and (resolution == None):
+            self.print_message("ERROR: scan_segmented needs PTS or RESOLUTION")
+            return None
+        if (pts == None) and not(resolution > 0):
+            self.print_message("ERROR: scan_segmented needs a RESOLUTION greater than 0")
+            return None
+        if not((0<=start) and (start < stop) and (pts == None or pts >= 2) \
+            and (unbuf in [0,1]) and (method in ["scanraw", "scan"])):
+            self.print_message("ERROR: scan_segmented takes START STOP PTS|RESOLUTION UNBUF=0|1 METHOD=\"scanraw\"|\"scan\" as args")
+            return None
+        if pts == None:
+            pts = total_points(start, stop, resolution)
+        pts = int(pts)
+        if out is None:
+            out = sweepResult(pts)
+        out.reserve(pts)
+
+        segments = plan_segments(start, stop, pts, self.tsa.maxPoints)
+        for segStart, segStop, segPts, index in segments:
+            seg = sweepResult(0, out.frequencies[index:index+segPts],
+                              out.levels[index:index+segPts], out.valid[index:index+segPts])
+            if method == "scan":
+                res = await self.scan_arrays(segStart, segStop, segPts, seg)
+            else:
+                res = await self.scan_raw_arrays(segStart, segStop, segPts, unbuf, seg)
+            if res == None:
+                self.print_message("ERROR: segment " + str(segStart) + " to " + str(segStop) + " failed")
+                return None
+
+        out.gridKey = None
+        if method != "scan":
+            out.set_grid(start, stop, pts)
+        out.timestamp = time.time()
+        out.set_settings(method, start, stop, pts, self.tsa.deviceType)
+        out.settings["segments"] = len(segments)
+        return out
+
+    async def capture_array(self, out=None):
+        # awaitable tinySA.capture_array()
+        width = self.tsa.screenWidth
+        height = self.tsa.screenHeight
+        frame = await self.send('capture\r\n', framing.capture_size(width, height))
+        img = decode_rgb565(frame, width, height, out)
+        if img is None:
+            self.print_message("ERROR: capture returned an incomplete screen")
+        return img
+
+    async def capture_png(self, filename=None, level=6):
+        # awaitable tinySA.capture_png()
+        img = await self.capture_array()
+        if img is None:
+            return None
+        png = encode_png(img, level)
+        if filename != None:
+            with open(filename, 'wb') as f:
+                f.write(png)
+            self.print_message("screen capture saved to " + str(filename))
+        return png
+
+    def sweeps(self, start, stop, pts=250, unbuf=1, out=None):
+        # continuous scanraw as an asyncSweepStream. see tinySA.continious_scanraw()
+        #   async with atsa.sweeps(start, stop, pts) as stream:
+        #       async for sweep in stream: ...
+        # the port is held from the start to the end of the 'async with'
+        # block, and the device is stopped when the block is left (break,
+        # exception or cancellation). send no other commands inside it
+        # out: optional sweepResult that is filled and yielded every time
+        # returns None if the args are not valid
+        if not((0<=start) and (start < stop) and (pts <= self.tsa.maxPoints) and (unbuf in [0,1])):
+            self.print_message("ERROR: sweeps takes START STOP PTS UNBUF=0|1 as args. Check doc for format and limits")
+            return None
+        return asyncSweepStream(self, start, stop, pts, unbuf, out)
+
+    def continious_scanraw(self, start, stop, pts=250, unbuf=1, out=None):
+        # alias for sweeps()
+        return self.sweeps(start, stop, pts, unbuf, out)
+
+    def continuous_scanraw(self, start, stop, pts=250, unbuf=1, out=None):
+        # alias for sweeps()
+        return self.sweeps(start, stop, pts, unbuf, out)
+
+
+class asyncSweepStream():
+    # a continuous scanraw on an asyncTinySA, used as
+    #   async with atsa.sweeps(start, stop, pts) as stream:
+    #       async for sweep in stream: ...
+    # the port lock is taken in __aenter__ and only released in __aexit__,
+    # after the device has been stopped. iterating outside of the 
+    # 'async with' block raises a RuntimeError, so the lock is never 
+    # left held by an unfinished loop
+    def __init__(self, atsa, start, stop, pts, unbuf, out=None):
+        self.atsa = atsa
+        self.start = start
+        self.stop = stop
+        self.pts = pts
+        if out is None:
+            out = sweepResult(pts)
+        out.reserve(pts)
+        out.set_grid(start, stop, pts)
+        out.valid[:] = True
+        out.set_settings("scanraw", start, stop, pts, atsa.tsa.deviceType)
+        out.settings["continuous"] = True
+        self.out = out
+        self.frameSize = framing.scanraw_size(pts) - 1 # after the '{'
+        option = SCANRAW_CONTINUOUS | (int(unbuf) & 1)
+        self.writebyte = 'scanraw '+str(start)+' '+str(stop)+' '+str(pts)+' '+str(option)+'\r\n'
+        self.running = False
+
+    async def __aenter__(self):
+        atsa = self.atsa
+        await atsa.lock.acquire()
+        try:
+            if atsa.recovery != None:
+                await atsa.recovery
+                atsa.recovery = None
+            atsa.tsa.expire_state(self.writebyte)
+            atsa.ser.write(bytes(self.writebyte, 'utf-8'))
+            self.running = True
+            await atsa.reader.read_until(b'\r\n', atsa.responseTimeout)
+        except BaseException:
+            await self.end()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.end()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.running == False:
+            raise RuntimeError("iterate the sweeps inside 'async with atsa.sweeps(...) as stream'")
+        atsa = self.atsa
+        out = self.out
+        while True:
+            await atsa.reader.read_until(b'{', atsa.responseTimeout)
+            frame = await atsa.reader.read_exact(self.frameSize, atsa.responseTimeout)
+            if frame[-1:] == b'}':
+                break
+            # out of frame. look for the next '{'
+        decode_scanraw(frame, self.pts, atsa.tsa.scanrawScale, atsa.tsa.scanrawOffset, out.levels)
+        out.timestamp = time.time()
+        return out
+
+    async def end(self):
+        # stops the device and releases the port
+        atsa = self.atsa
+        try:
+            if self.running == True:
+                self.running = False
+                await self.end_stream()
+        except BaseException:
+            # cancelled while stopping. the rest is skipped before the next command
+            atsa.start_recovery()
+            raise
+        finally:
+            atsa.lock.release()
+
+    async def end_stream(self):
+        # stops a continuous scanraw and reads up to the prompt,
+        # skipping whole frames. see sweepStream.end_stream()
+        atsa = self.atsa
+        atsa.ser.write(STOP_CHAR)
+        try:
+            while True:
+                lead = await atsa.reader.read_exact(1, 2.0)
+                if lead == b'{':
+                    await atsa.reader.read_exact(self.frameSize, 2.0)
+                elif lead == b'c':
+                    await atsa.reader.read_until(b'>', 2.0)
+                    break
+        except asyncio.TimeoutError:
+            atsa.print_message("WARNING: Timeout stopping the scanraw stream")
+            atsa.reader.discard()
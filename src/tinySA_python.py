@@ -19,18 +19,88 @@ import serial
 import serial.tools.list_ports # COM search method wants full path
 import numpy as np
 import re
+import struct
+import time
 
 
 try:
-    from src.device_config.device_config import deviceConfig
+    from src.device_config.device_config import deviceConfig, get_preset
+    from src.serial_stream.stream_reader import streamReader
+    from src.serial_stream import framing
+    from src.data_decode.scanraw_decode import decode_scanraw
+    from src.data_decode.text_decode import parse_scan_into
+    from src.sweep.sweep_result import sweepResult
+    from src.sweep.sweep_stream import sweepStream
+    from src.sweep.segmented_sweep import segmented_sweep
+    from src.sweep.adaptive_sweep import adaptive_sweep
+    from src.screen.rgb565_decode import decode_rgb565
+    from src.screen.png_writer import encode_png
+    from src.screen.screen_mirror import screenMirror
+    from src.serial_stream.pipeline import commandPipeline
+    from src.serial_stream.demux import serialDemux
+    from src.serial_stream.traffic import recordingSerial, replaySerial
+    from src.simulator.tinySA_simulator import tinySASimulator
+    from src.instrumentation.command_metrics import commandMetrics
+    from src.instrumentation.session_trace import sessionTracer
 except:
-    from device_config.device_config import deviceConfig
+    from device_config.device_config import deviceConfig, get_preset
+    from serial_stream.stream_reader import streamReader
+    from serial_stream import framing
+    from data_decode.scanraw_decode import decode_scanraw
+    from data_decode.text_decode import parse_scan_into
+    from sweep.sweep_result import sweepResult
+    from sweep.sweep_stream import sweepStream
+    from sweep.segmented_sweep import segmented_sweep
+    from sweep.adaptive_sweep import adaptive_sweep
+    from screen.rgb565_decode import decode_rgb565
+    from screen.png_writer import encode_png
+    from screen.screen_mirror import screenMirror
+    from serial_stream.pipeline import commandPipeline
+    from serial_stream.demux import serialDemux
+    from serial_stream.traffic import recordingSerial, replaySerial
+    from simulator.tinySA_simulator import tinySASimulator
+    from instrumentation.command_metrics import commandMetrics
+    from instrumentation.session_trace import sessionTracer
+
+# commands that can change any setting. the state cache is cleared when they are sent
+STATE_RESET_COMMANDS = ["reset", "recall", "load", "clearconfig", "mode", 
+                        "touch", "release", "menu", "restart"]
+# commands that change the sweep settings as a side effect
+SWEEP_STATE_COMMANDS = ["sweep", "scan", "scanraw", "hop"]
+# sweep settings that 'sweep {setting} {frequency}' moves, by setting
+SWEEP_STATE_LINKS = {"start": ["center", "span", "cw"],
+                     "stop": ["center", "span", "cw"],
+                     "center": ["start", "stop", "cw"],
+                     "span": ["start", "stop", "cw"],
+                     "cw": ["start", "stop", "center", "span"]}
 
 
 class tinySA():
     def __init__(self, parent=None):
         # serial port
         self.ser = None
+        # owns every received byte not handed to a parser yet.
+        # one per connection, created in connect()
+        self.reader = None
+        # when set to a list, commands are recorded to it instead of 
+        # being sent. (writebyte, size, payload_size, stateKey) per 
+        # command, where size is None for prompt delimited responses.
+        # whoever sends them calls confirm_state() with each response
+        self.commandQueue = None
+        # when set, a serialDemux owns the port and commands are sent through it
+        self.demux = None
+        # when set, a commandMetrics that every command sent is measured by
+        self.metrics = None
+        # when set, a sessionTracer recording spans (see enable_tracing())
+        self.tracer = None
+
+        # shadow copy of the device settings last set (or read) through
+        # this object. a setter sent with the same value as the copy is 
+        # skipped. {stateKey: writebyte}
+        self.stateCacheEnabled = True
+        self.stateCache = {}
+        self.stateCacheHits = 0     # setter calls skipped
+        self.stateCacheMisses = 0   # setter calls sent
 
         # user device class (to account for custom settings) 
         self.dev = deviceConfig #TODO, finish this class and integrate
@@ -39,6 +109,11 @@ class tinySA():
         self.verboseEnabled = False
         self.returnErrorByte = False
 
+        # max seconds to wait for a full response. None waits until the prompt
+        # arrives (slow sweeps can take a while). each individual read
+        # is still bounded by the serial timeout set in connect()
+        self.responseTimeout = None
+
 
 
         # VARS BELOW HERE will be largely replaced with device class config calls
@@ -64,6 +139,9 @@ class tinySA():
         # screen 
         self.screenWidth = 480
         self.screenHeight = 320
+        # scanraw to dBm. dBm = raw / scale - offset
+        self.scanrawScale = 32
+        self.scanrawOffset = 174
 
 
 ######################################################################
@@ -123,6 +201,12 @@ class tinySA():
 # Serial management and message processing
 ######################################################################
 
+    def set_response_timeout(self, timeout=None):
+        self.responseTimeout = timeout
+
+    def get_response_timeout(self):
+        return self.responseTimeout
+
     def autoconnect(self, timeout=1):
         # attempt to autoconnect to a detected port. 
         # returns: found_bool, connected_bool
@@ -158,6 +242,9 @@ class tinySA():
 
         try:
             self.ser = serial.Serial(port=port, timeout=timeout)
+            self.reader = streamReader(self.ser)
+            # nothing is known about a newly connected device
+            self.clear_state_cache()
             return True
         except Exception as err:
             self.print_message("ERROR: cannot open port at " + str(port))
@@ -166,88 +253,478 @@ class tinySA():
 
     def disconnect(self):
         # closes the serial port
+        self.stop_demux()
         self.ser.close()
+        self.clear_state_cache()
+
+    def record_traffic(self, filename):
+        # records every write to and read from the port, with the time,
+        # to filename (see src/serial_stream/traffic.py). the recording 
+        # can be played back with replay_traffic() without the device
+        # returns: True if recording started, False otherwise
+        if self.ser == None:
+            self.print_message("ERROR: connect before recording traffic")
+            return False
+        if isinstance(self.ser, recordingSerial):
+            self.stop_recording_traffic()
+        try:
+            ser = recordingSerial(self.ser, filename)
+        except OSError as err:
+            self.print_message("ERROR: cannot open " + str(filename))
+            self.print_message(err)
+            return False
+        self.swap_port(ser)
+        return True
+
+    def stop_recording_traffic(self):
+        # closes the recording. the port stays connected
+        if isinstance(self.ser, recordingSerial):
+            self.ser.close_recording()
+            self.swap_port(self.ser.ser)
+
+    def replay_traffic(self, filename, speed=1.0, timeout=1):
+        # connects to a recording made with record_traffic() instead of 
+        # a device. the recorded responses are returned to the same 
+        # commands, in the same order
+        # speed: 1.0 for the recorded timing, None for as fast as possible
+        # returns: True if successful, False otherwise
+        try:
+            self.ser = replaySerial(filename, speed, timeout)
+            self.reader = streamReader(self.ser)
+            self.clear_state_cache()
+            return True
+        except (OSError, ValueError, struct.error) as err:
+            self.print_message("ERROR: cannot replay " + str(filename))
+            self.print_message(err)
+            return False
 
+    def connect_simulator(self, clock="virtual", seed=0, signals=None, timeout=1):
+        # connects to a simulated device of the current device type
+        # (see src/simulator/tinySA_simulator.py) instead of a port
+        # clock: "realtime" for the modelled sweep timing, "virtual" to
+        #   run as fast as possible with the same results every time
+        # seed: noise seed
+        # signals: list of (frequency Hz, level dBm) in the spectrum
+        # returns: True if successful, False otherwise
+        try:
+            self.ser = tinySASimulator(self.deviceType, clock, seed, signals, timeout)
+            self.reader = streamReader(self.ser)
+            self.clear_state_cache()
+            return True
+        except ValueError as err:
+            self.print_message("ERROR: cannot start the simulator")
+            self.print_message(err)
+            return False
+
+    def swap_port(self, ser):
+        # replaces the port object, keeping the bytes already received
+        if self.demux != None:
+            self.print_message("WARNING: stop the demultiplexer before changing the port")
+        self.ser = ser
+        if self.reader != None:
+            self.reader.ser = ser
 
-    def tinySA_serial(self, writebyte, printBool=False):
+
+    def tinySA_serial(self, writebyte, printBool=False, stateKey=None):
         # write out to serial, get message back, clean up, return
-        
-        self.ser.write(bytes(writebyte, 'utf-8'))
-        msgbytes = self.get_serial_return()
-        msgbytes = self.clean_return(msgbytes)
+        # stateKey: set by setters. the command is skipped if it was the 
+        #   last one sent for that key (see set_state_cache())
+
+        if stateKey != None and self.state_cache_hit(stateKey, writebyte) == True:
+            return bytearray(b'')
+        self.expire_state(writebyte)
+
+        if self.commandQueue != None:
+            # deferred: record the command instead of sending it. the 
+            # state is stored once the response arrives
+            self.commandQueue.append((writebyte, None, None, stateKey))
+            return bytearray(b'')
+
+        if self.demux != None:
+            # None on timeout
+            if self.metrics != None:
+                msgbytes = self.metrics.command(self, writebyte, lambda: self.demux.command(writebyte, 
+                                                timeout=self.responseTimeout), write=False)
+            else:
+                msgbytes = self.demux.command(writebyte, timeout=self.responseTimeout)
+        else:
+            if self.metrics != None:
+                msgbytes = self.metrics.command(self, writebyte, self.read_response)
+            else:
+                self.ser.write(bytes(writebyte, 'utf-8'))
+                msgbytes = self.read_response()
+            if (msgbytes is not None) and (self.stream_reader().timedOut == True):
+                # a partial response. the device has not confirmed anything
+                stateKey = None
+        if msgbytes is None:
+            # no response: the port could not be read or the demux timed out
+            msgbytes = self.error_byte_return()
+        elif stateKey != None:
+            self.store_state(stateKey, writebyte, msgbytes)
+
+        if printBool == True:
+            print(msgbytes) #overrides verbose for debug
+
+        return msgbytes
+
+    def tinySA_serial_binary(self, writebyte, size, payload_size=None, printBool=False, handler=None):
+        # write out to serial, then read a binary payload by size.
+        # binary data can contain the '>' of the prompt, so the payload 
+        # is read with sized reads and the prompt is consumed after it.
+        # size: number of payload bytes after the command echo
+        # payload_size: optional function for records that declare their
+        #   own size. 'size' bytes of header are read first, then
+        #   payload_size(header) more bytes
+        # handler: optional function called with a memoryview of the payload,
+        #   which is only valid during the call. its return value is 
+        #   returned instead of a copy of the payload
+
+        self.expire_state(writebyte)
+        if self.commandQueue != None:
+            # deferred: record the command instead of sending it
+            self.commandQueue.append((writebyte, size, payload_size, None))
+            return bytearray(b'')
+
+        if self.demux != None:
+            if self.metrics != None:
+                msgbytes = self.metrics.command(self, writebyte, lambda: self.demux.command(writebyte, 
+                                                size, payload_size, self.responseTimeout), write=False, size=size)
+            else:
+                msgbytes = self.demux.command(writebyte, size, payload_size, self.responseTimeout)
+            if msgbytes == None:
+                msgbytes = bytearray(b'')
+            if handler != None:
+                msgbytes = handler(memoryview(msgbytes))
+        elif self.metrics != None:
+            msgbytes = self.metrics.command(self, writebyte, lambda: self.read_binary_response(size, 
+                                            payload_size, handler), size=size)
+        else:
+            self.ser.write(bytes(writebyte, 'utf-8'))
+            msgbytes = self.read_binary_response(size, payload_size, handler)
 
         if printBool == True:
             print(msgbytes) #overrides verbose for debug
 
         return msgbytes
 
+    def read_response(self):
+        # reads one prompt delimited response and returns a cleaned copy
+        # returns None if the port could not be read
+        msgbytes = self.get_serial_view()
+        if msgbytes is None:
+            return None
+        msgbytes = self.clean_return(msgbytes)
+        # the only copy made of the response
+        return bytearray(msgbytes)
+
+    def read_binary_response(self, size, payload_size=None, handler=None):
+        # reads one binary response. see tinySA_serial_binary()
+        # if the port could not be read, the response is empty (short),
+        # the same as a response that timed out
+        # the command echo
+        if self.get_serial_until(b'\r\n') is None:
+            return self.binary_result(bytearray(b''), handler)
+        msgbytes = self.get_serial_sized(size)
+        if (msgbytes is not None) and (payload_size != None):
+            msgbytes = bytearray(msgbytes)
+            if len(msgbytes) == size:
+                payload = self.get_serial_sized(payload_size(msgbytes))
+                if payload is None:
+                    return self.binary_result(msgbytes, handler)
+                msgbytes += payload
+        if msgbytes is None:
+            return self.binary_result(bytearray(b''), handler)
+        msgbytes = self.binary_result(msgbytes, handler)
+        # consume the prompt that follows the payload
+        self.get_serial_until(framing.PROMPT)
+        return msgbytes
+
+    def binary_result(self, msgbytes, handler):
+        # handler(memoryview) if there is a handler, otherwise a copy
+        if handler != None:
+            return handler(memoryview(msgbytes))
+        return bytearray(msgbytes)
+
+######################################################################
+# Command metrics
+#   Count, bytes, time to first byte and time to prompt of every 
+#   command sent through tinySA_serial() and tinySA_serial_binary(), 
+#   by command verb. See src/instrumentation/command_metrics.py
+######################################################################
+
+    def enable_metrics(self, metrics=None):
+        # starts measuring every command sent.
+        # metrics: optional commandMetrics to add to, such as one 
+        #   shared by several devices
+        # returns the commandMetrics
+        if metrics == None:
+            metrics = commandMetrics()
+        self.metrics = metrics
+        return self.metrics
+
+    def disable_metrics(self):
+        # stops measuring. the numbers so far are kept in the returned commandMetrics
+        metrics = self.metrics
+        self.metrics = None
+        return metrics
+
+    def get_metrics(self):
+        # counts, bytes and latency percentiles (seconds) by command verb. 
+        # returns None if metrics are not enabled
+        if self.metrics == None:
+            return None
+        return self.metrics.summary()
+
+######################################################################
+# Session tracing
+#   A timeline of the commands, serial reads and writes and decoding,
+#   saved as Chrome trace event JSON for Perfetto. 
+#   See src/instrumentation/session_trace.py
+######################################################################
+
+    def enable_tracing(self, tracer=None):
+        # starts recording spans. call it after connecting, since the
+        # port and its reader are traced too
+        # tracer: optional sessionTracer to add to, such as one shared
+        #   by several devices or with the processing code
+        # returns the sessionTracer. save it with tracer.write(filename)
+        if self.tracer != None:
+            self.disable_tracing()
+        if tracer == None:
+            tracer = sessionTracer()
+        tracer.attach(self)
+        self.tracer = tracer
+        return self.tracer
+
+    def disable_tracing(self):
+        # stops recording. returns the sessionTracer with the spans so far
+        tracer = self.tracer
+        if tracer != None:
+            tracer.detach(self)
+        self.tracer = None
+        return tracer
+
+    def pipeline(self):
+        # batches commands into one write. inside the with block, commands
+        # are recorded instead of sent. they are all written at once when
+        # the block ends and the responses are split apart by prompt.
+        #   with tsa.pipeline() as pipe:
+        #       tsa.attenuate(10)
+        #       tsa.rbw(100)
+        #   print(pipe.results) # one response per command
+        return commandPipeline(self)
+
+######################################################################
+# Device state cache
+#   Setters that are called again with the value they last set are
+#   skipped instead of sent. The cache only knows about commands sent
+#   through this object, so clear it if the settings are changed on
+#   the device screen.
+######################################################################
+
+    def set_state_cache(self, enabled=True):
+        # turns the state cache on or off. the cache is cleared either way
+        self.stateCacheEnabled = enabled
+        self.clear_state_cache()
+
+    def get_state_cache(self):
+        return self.stateCacheEnabled
+
+    def clear_state_cache(self):
+        # forget the device state. the next setter calls are all sent
+        self.stateCache = {}
+
+    def get_state_cache_stats(self):
+        # hits: setter calls skipped, misses: setter calls sent
+        return {"hits": self.stateCacheHits,
+                "misses": self.stateCacheMisses,
+                "entries": len(self.stateCache)}
+
+    def reset_state_cache_stats(self):
+        self.stateCacheHits = 0
+        self.stateCacheMisses = 0
+
+    def state_cache_hit(self, stateKey, writebyte):
+        # True if writebyte was the last command sent for stateKey
+        if self.stateCacheEnabled == False:
+            return False
+        if self.stateCache.get(stateKey) == writebyte:
+            self.stateCacheHits = self.stateCacheHits + 1
+            self.print_message("state cache: " + writebyte.strip() + " already set")
+            return True
+        self.stateCacheMisses = self.stateCacheMisses + 1
+        return False
+
+    def store_state(self, stateKey, writebyte, msgbytes):
+        # call only with a response that has arrived.
+        # setters return nothing. anything else is an error or usage 
+        # message, so the value is not known to be set
+        if (self.stateCacheEnabled == True) and (len(msgbytes) == 0):
+            self.stateCache[stateKey] = writebyte
+
+    def confirm_state(self, writebyte, stateKey, msgbytes):
+        # for commands recorded in commandQueue and sent later, in the
+        # order they were sent. msgbytes: the response, None if none arrived
+        self.expire_state(writebyte)
+        if msgbytes is None:
+            return
+        if stateKey != None:
+            self.store_state(stateKey, writebyte, msgbytes)
+        elif writebyte.split() == ["sweep"]:
+            # see config_sweep()
+            self.read_sweep_state(msgbytes)
+
+    def expire_state(self, writebyte):
+        # drops the cached settings that sending writebyte can change
+        if len(self.stateCache) == 0:
+            return
+        words = writebyte.split()
+        if len(words) == 0:
+            return
+        cmd = words[0]
+        if cmd in STATE_RESET_COMMANDS:
+            self.clear_state_cache()
+        elif (cmd == "sweep") and (len(words) == 1):
+            # only reads the sweep settings
+            return
+        elif (cmd == "sweep") and (words[1] in SWEEP_STATE_LINKS):
+            # the settings this one moves. its own entry is replaced 
+            # when the new value is stored
+            for setting in SWEEP_STATE_LINKS[words[1]] + [words[1]]:
+                self.stateCache.pop("sweep " + setting, None)
+        elif cmd in SWEEP_STATE_COMMANDS:
+            # a new start and stop, which moves all of them
+            for stateKey in list(self.stateCache.keys()):
+                if stateKey.split()[0] == "sweep":
+                    del self.stateCache[stateKey]
+        else:
+            for stateKey in list(self.stateCache.keys()):
+                if stateKey.split()[0] == cmd:
+                    del self.stateCache[stateKey]
+
+    def read_sweep_state(self, msgbytes):
+        # stores the sweep start and stop from the 'sweep' response 
+        # 'start stop points', as if they had been set
+        if self.stateCacheEnabled == False:
+            return
+        vals = bytes(msgbytes).split()
+        if len(vals) < 2:
+            return
+        try:
+            start = int(vals[0])
+            stop = int(vals[1])
+        except ValueError:
+            return
+        self.stateCache['sweep start'] = 'sweep start ' + str(start) + '\r\n'
+        self.stateCache['sweep stop'] = 'sweep stop ' + str(stop) + '\r\n'
+
+    def start_demux(self, recordHandler=None, unsolicitedHandler=None, maxQueue=0):
+        # hands the port to a serialDemux. a reader thread splits what the
+        # device sends into command responses, bulk/fill records and 
+        # unsolicited data, so commands keep working with refresh on.
+        # recordHandler: optional function(kind, header, payload) for each
+        #   record, such as screenMirror.apply_record. otherwise records
+        #   are put in demux.records
+        # unsolicitedHandler: optional function(data). otherwise the data 
+        #   is put in demux.unsolicited
+        # returns the running serialDemux
+        if self.demux != None:
+            return self.demux
+        self.demux = serialDemux(self, recordHandler, unsolicitedHandler, maxQueue)
+        self.demux.start()
+        self.print_message("serial demultiplexer started")
+        return self.demux
+
+    def stop_demux(self):
+        # stops the serialDemux. commands read the port directly again
+        if self.demux == None:
+            return
+        self.demux.stop()
+        self.demux = None
+
+    def stream_reader(self):
+        # the reader for the current port. a new one is made if the 
+        # port was replaced without connect()
+        if (self.reader == None) or (self.reader.ser is not self.ser):
+            self.reader = streamReader(self.ser)
+        return self.reader
+
     
     def get_serial_return(self):
-        # while there's a buffer, read in the returned message
+        # read in the returned message until the prompt is found
         # original buffer reading from: https://groups.io/g/tinysa/topic/tinysa_screen_capture_using/82218670
-
-        buffer = bytes()
-        while True:
-            if self.ser.in_waiting > 0:
-                buffer += self.ser.read(self.ser.in_waiting)
-                try:
-                    # split the stream to take a chunk at a time
-                    # get up to '>' of the prompt
-                    complete = buffer[:buffer.index(b'>')+1]  
-                    # leave the rest in buffer
-                    buffer = buffer[buffer.index(b'ch>')+1:]  
-                except ValueError:
-                    # this is an acceptable err, so can skip it and keep looping
-                    continue 
-                except Exception as err:
-                    # otherwise, something else is wrong
-                    self.print_message("ERROR: exception thrown while reading serial")
-                    self.print_message(err)
-                    return None
-                break
-            
-        return bytearray(complete)
-
+        # anything received after the prompt stays in the stream reader
+        # for the next response.
+        # returns a bytearray, or None if the port could not be read
+        msgbytes = self.get_serial_view()
+        if msgbytes is None:
+            return None
+        return bytearray(msgbytes)
+
+    def get_serial_view(self):
+        # get_serial_return() without the copy. returns a memoryview into
+        # the receive buffer, which is only valid until the next read
+
+        # get up to '>' of the prompt
+        return self.get_serial_until(b'>')
+
+    def get_serial_until(self, marker, timeout=None):
+        # read until marker, and return everything up to and including it
+        # the read blocks on the port (bounded by the serial timeout) instead of 
+        # polling in_waiting, so the CPU is idle while the device is sweeping
+        # timeout: seconds, defaults to the response timeout
+
+        if timeout == None:
+            timeout = self.responseTimeout
+        reader = self.stream_reader()
+        try:
+            frame = reader.read_until(marker, timeout)
+        except Exception as err:
+            # something is wrong with the port
+            self.print_message("ERROR: exception thrown while reading serial")
+            self.print_message(err)
+            return None
+        if reader.timedOut == True:
+            self.print_message(f"WARNING: Timeout waiting for {marker}")
+        return frame
+
+    def get_serial_sized(self, size, timeout=None):
+        # read exactly size bytes. no delimiter search
+        # returns a memoryview into the receive buffer (see get_serial_view())
+
+        if timeout == None:
+            timeout = self.responseTimeout
+        reader = self.stream_reader()
+        try:
+            frame = reader.read_exact(size, timeout)
+        except Exception as err:
+            self.print_message("ERROR: exception thrown while reading serial")
+            self.print_message(err)
+            return None
+        if reader.timedOut == True:
+            self.print_message(f"WARNING: Timeout with {len(frame)} of {size} bytes read")
+        return frame
 
     def read_until_end_marker(self, end_marker=b'}', timeout=5.0):
         # scan and scan raw might return early with tinySA_serial
-        # so this is written to 
-        import time
-        
-        buffer = bytes()
-        start_time = time.time()
-        
-        while True:
-            if self.ser.in_waiting > 0:
-                buffer += self.ser.read(self.ser.in_waiting)
-                
-                # Check if we have the end marker
-                if end_marker in buffer:
-                    # Find the position after the end marker
-                    end_pos = buffer.find(end_marker) + len(end_marker)
-                    complete = buffer[:end_pos]
-                    # Keep any remaining data for next read
-                    self.remaining_buffer = buffer[end_pos:]
-                    return bytearray(complete)
-            
-            # Timeout check
-            if time.time() - start_time > timeout:
-                self.print_message(f"WARNING: Timeout waiting for end marker {end_marker}")
-                break
-            
-            time.sleep(0.01)
-        
-        return bytearray(buffer)
+        # so this is written to read until a specific marker is found.
+        # any data after the marker stays in the stream reader
+        msgbytes = self.get_serial_until(end_marker, timeout)
+        if msgbytes == None:
+            return None
+        return bytearray(msgbytes)
 
     def clean_return(self, data):
-        # takes in a bytearray and removes 1) the text up to the first '\r\n' (includes the command), an 2) the ending 'ch>'
+        # takes in a bytearray (or memoryview of the receive buffer) and removes 
+        # 1) the text up to the first '\r\n' (includes the command), an 2) the ending 'ch>'
+        # slicing a memoryview does not copy the data
         # Find the first occurrence of \r\n (carriage return + newline)
-        first_newline_index = data.find(b'\r\n')
-        if first_newline_index != -1:
-            # Slice the bytearray to remove everything before and including the first '\r\n'
-            data = data[first_newline_index + 2:]  # Skip past '\r\n'
+        first_newline = re.search(rb'\r\n', data)
+        if first_newline != None:
+            # Slice to remove everything before and including the first '\r\n'
+            data = data[first_newline.end():]  # Skip past '\r\n'
         # Check if the message ends with 'ch>'
-        if data.endswith(b'ch>'):
+        if data[-3:] == b'ch>':
             # Remove 'ch>' from the end
             data = data[:-4]  # Remove the last 4 bytes ('ch>')
         return data
@@ -363,7 +840,7 @@ class tinySA():
         #check input
         if (str(val) == "auto") or (val in accepted_vals):
             writebyte = 'agc '+str(val)+'\r\n'
-            msgbytes = self.tinySA_serial(writebyte, printBool=False)     
+            msgbytes = self.tinySA_serial(writebyte, printBool=False, stateKey='agc')     
             self.print_message("agc() set with " + str(val))
         else:
             self.print_message("ERROR: agc() takes vals [0 - 7]|\"auto\"")
@@ -384,7 +861,7 @@ class tinySA():
         #check input
         if (str(val) == "auto") or (val in accepted_vals):
             writebyte = 'attenuate '+str(val)+'\r\n'
-            msgbytes = self.tinySA_serial(writebyte, printBool=False)
+            msgbytes = self.tinySA_serial(writebyte, printBool=False, stateKey='attenuate')
             self.print_message("attenuate() set with " + str(val))           
         else:
             self.print_message("ERROR: attenuate() takes vals [0 - 31]|\"auto\"")
@@ -403,8 +880,10 @@ class tinySA():
         # bytes little endian. The Pixeldata is
         # encoded as 2 bytes per pixel. similar to fill()
 
+        # the header declares the size of the pixel data that follows
         writebyte = 'bulk\r\n'
-        msgbytes = self.tinySA_serial(writebyte, printBool=False) 
+        msgbytes = self.tinySA_serial_binary(writebyte, framing.RECORD_HEADER_SIZE,
+                                             framing.bulk_payload_size, printBool=False) 
         self.print_message("bulk() called for screen data")   
         return msgbytes
 
@@ -492,17 +971,48 @@ class tinySA():
     
     def capture(self):
         # requests a screen dump to be sent in binary format 
-        # of 320x240 pixels of each 2 bytes
+        # of screenWidth x screenHeight pixels of each 2 bytes
         # usage: capture
         # example return: bytearray(b'\x00 ...\x00\x00\x00')
+        # the screen size depends on the device (see set_device_type())
         writebyte = 'capture\r\n'
-        msgbytes = self.tinySA_serial(writebyte, printBool=False) 
+        size = framing.capture_size(self.screenWidth, self.screenHeight)
+        msgbytes = self.tinySA_serial_binary(writebyte, size, printBool=False) 
         self.print_message("capture() called for screen data")   
         return msgbytes
     
     def capture_screen(self):
         return self.capture()
 
+    def capture_array(self, out=None):
+        # capture() decoded to a (screenHeight, screenWidth, 3) uint8 RGB array.
+        # the pixels are decoded straight from the receive buffer
+        # out: optional uint8 array of that shape to write into
+        # returns None if the capture was incomplete
+        writebyte = 'capture\r\n'
+        size = framing.capture_size(self.screenWidth, self.screenHeight)
+        def decode(frame):
+            return decode_rgb565(frame, self.screenWidth, self.screenHeight, out)
+        img = self.tinySA_serial_binary(writebyte, size, handler=decode)
+        if img is None:
+            self.print_message("ERROR: capture returned an incomplete screen")
+        return img
+
+    def capture_png(self, filename=None, level=6):
+        # capture() saved as a PNG, without needing an imaging library
+        # filename: optional file to write. the PNG bytes are returned either way
+        # level: zlib compression level 0-9
+        # returns None if the capture was incomplete
+        img = self.capture_array()
+        if img is None:
+            return None
+        png = encode_png(img, level)
+        if filename != None:
+            with open(filename, 'wb') as f:
+                f.write(png)
+            self.print_message("screen capture saved to " + str(filename))
+        return png
+
     def clear_config(self):
         # resets the configuration data to factory defaults. requires password
         # NOTE: does take other commands to fully clear all
@@ -776,7 +1286,8 @@ class tinySA():
         # bytes little endian. Similar ot bulk()
 
         writebyte = 'fill\r\n'
-        msgbytes = self.tinySA_serial(writebyte, printBool=False) 
+        msgbytes = self.tinySA_serial_binary(writebyte, framing.RECORD_HEADER_SIZE,
+                                             framing.fill_payload_size, printBool=False) 
         self.print_message("fill() called for screen data")   
         return msgbytes
     
@@ -1030,7 +1541,7 @@ class tinySA():
         #check input
         if (str(val) in accepted_vals):
             writebyte = 'lna '+str(val)+'\r\n'
-            msgbytes = self.tinySA_serial(writebyte, printBool=False)   
+            msgbytes = self.tinySA_serial(writebyte, printBool=False, stateKey='lna')   
             self.print_message("lna() set to " + str(val))        
         else:
             self.print_message("ERROR: lna() takes vals [on|off]")
@@ -1056,7 +1567,7 @@ class tinySA():
         #check input
         if (val == "auto") or (val in accepted_vals):
             writebyte = 'lna2 '+str(val)+'\r\n'
-            msgbytes = self.tinySA_serial(writebyte, printBool=False)     
+            msgbytes = self.tinySA_serial(writebyte, printBool=False, stateKey='lna2')     
             self.print_message("lna2() set to " + str(val))      
         else:
             self.print_message("ERROR: lna2() takes vals [0 - 7]|auto")
@@ -1137,8 +1648,8 @@ class tinySA():
         accepted_val2= ["input", "output"]
         #check input
         if (val1 in accepted_val1) and (val2 in accepted_val2):
-            writebyte = 'mode '+str(val1)+ + ' ' +str(val2)+'\r\n'
-            msgbytes = self.tinySA_serial(writebyte, printBool=False)           
+            writebyte = 'mode '+str(val1)+' '+str(val2)+'\r\n'
+            msgbytes = self.tinySA_serial(writebyte, printBool=False, stateKey='mode')           
         else:
             self.print_message("ERROR: output() takes vals [on|off]")
             msgbytes = self.error_byte_return()
@@ -1256,10 +1767,10 @@ class tinySA():
         #check input
         if (val == "auto"):
             writebyte = 'rbw '+str(val)+'\r\n'
-            msgbytes = self.tinySA_serial(writebyte, printBool=False)                
+            msgbytes = self.tinySA_serial(writebyte, printBool=False, stateKey='rbw')                
         elif (isinstance(val, int)):
             writebyte = 'rbw '+str(val)+'\r\n'
-            msgbytes = self.tinySA_serial(writebyte, printBool=False)           
+            msgbytes = self.tinySA_serial(writebyte, printBool=False, stateKey='rbw')           
         else:
             self.print_message("ERROR: rbw() takes vals [auto |0 - 600] in kHz as integers")
             msgbytes = self.error_byte_return()
@@ -1304,6 +1815,17 @@ class tinySA():
             msgbytes = self.error_byte_return()
         return msgbytes
 
+    def screen_mirror(self, capture=True):
+        # keeps a live copy of the screen from the auto refresh records.
+        # turns refresh on and returns a running screenMirror. 
+        # its framebuffer is updated in place as the device redraws
+        # capture: start from a full capture() of the screen
+        # stop() the mirror (turns refresh off) before sending any other command
+        mirror = screenMirror(self.screenWidth, self.screenHeight)
+        self.print_message("mirroring the screen...")
+        mirror.start(self, capture)
+        return mirror
+
     def refresh_on(self):
         # alias for refresh()
         return self.refresh("on")
@@ -1457,12 +1979,19 @@ class tinySA():
             # the README has examples for processing
 
         if (0<=start) and (start < stop) and (pts <= self.maxPoints):
-            if (unbuf == 1) or (unbuf==2) or (unbuf==3):
+            if (unbuf==2) or (unbuf==3):
+                # continuous scans never end on their own
+                self.print_message("ERROR: use continious_scanraw() for continuous scanraw")
+                msgbytes = self.error_byte_return()
+            elif (unbuf == 0) or (unbuf == 1):
                 writebyte = 'scanraw '+str(start)+' '+str(stop)+' '+str(pts)+ ' '+str(unbuf)+'\r\n'
 
-                # write out to serial, get message back, clean up, return
+                # write out to serial, read the '{...}' frame by size
                 self.print_message("scanning...")  
-                msgbytes = self.tinySA_serial(writebyte, printBool=False)
+                msgbytes = self.tinySA_serial_binary(writebyte, framing.scanraw_size(pts), printBool=False)
+                # drop the closing '}' to match the cleaned return format
+                if msgbytes[-1:] == b'}':
+                    msgbytes = msgbytes[:-1]
                 return msgbytes
             else:
                 self.print_message("ERROR: unrecognized UBUF for scanraw")
@@ -1472,8 +2001,152 @@ class tinySA():
             msgbytes = self.error_byte_return()
         return msgbytes
     
-    def continious_scanraw(self):
-        pass # the continious scan might need to be handled differently
+    def scan_raw_array(self, start, stop, pts=250, unbuf=1, out=None):
+        # scan_raw() decoded to dBm as a float32 numpy array.
+        # the scale and offset come from the device type (see set_device_type())
+        # out: optional preallocated float32 array of at least pts values
+        # returns None if the scan could not be run
+
+        msgbytes = self.scan_raw(start, stop, pts, unbuf)
+        if len(msgbytes) < framing.scanraw_size(pts) - 1: # no closing '}'
+            self.print_message("ERROR: scanraw returned " + str(len(msgbytes)) + " bytes for " + str(pts) + " points")
+            return None
+        return decode_scanraw(msgbytes, pts, self.scanrawScale, self.scanrawOffset, out)
+
+    def scan_arrays(self, start, stop, pts=250, out=None):
+        # scan() with frequencies and measured data (outmask=3),
+        # parsed into a sweepResult
+        # out: optional sweepResult to reuse. its arrays are only 
+        #   reallocated if they are too small
+        # returns None if the scan could not be run
+
+        msgbytes = self.scan(start, stop, pts, outmask=3)
+        if out is None:
+            out = sweepResult(pts)
+        out.reserve(pts)
+        # parsed straight into the arrays of out
+        rows = parse_scan_into(msgbytes, out.frequencies, out.levels, out.valid)
+        out.gridKey = None # frequencies came from the device
+        if rows != pts:
+            self.print_message("ERROR: scan returned " + str(rows) + " of " + str(pts) + " points")
+            return None
+        out.timestamp = time.time()
+        out.set_settings("scan", start, stop, pts, self.deviceType)
+        return out
+
+    def scan_raw_arrays(self, start, stop, pts=250, unbuf=1, out=None):
+        # scan_raw() decoded to dBm into a sweepResult. 
+        # frequencies are the linear grid from start to stop.
+        # the frame is decoded straight from the receive buffer, so
+        # with a reused 'out' nothing is allocated per sweep
+        # unbuf: 0|1. use continious_scanraw() for continuous scans
+        # out: optional sweepResult to reuse
+        # returns None if the scan could not be run
+
+        if (0<=start) and (start < stop) and (pts <= self.maxPoints) and (unbuf in [0,1]):
+            if out is None:
+                out = sweepResult(pts)
+            out.reserve(pts)
+            writebyte = 'scanraw '+str(start)+' '+str(stop)+' '+str(pts)+ ' '+str(unbuf)+'\r\n'
+            self.print_message("scanning...")
+            size = framing.scanraw_size(pts)
+            def decode(frame):
+                if len(frame) != size:
+                    return False
+                decode_scanraw(frame, pts, self.scanrawScale, self.scanrawOffset, out.levels)
+                return True
+            if self.tinySA_serial_binary(writebyte, size, handler=decode) == False:
+                self.print_message("ERROR: scanraw returned an incomplete frame")
+                return None
+            out.valid[:] = True
+            out.set_grid(start, stop, pts)
+            out.timestamp = time.time()
+            out.set_settings("scanraw", start, stop, pts, self.deviceType)
+            return out
+        else:
+            self.print_message("ERROR: scan_raw_arrays takes START STOP PTS UNBUF=0|1 as args. Check doc for format and limits")
+            return None
+
+    def scan_segmented(self, start, stop, pts=None, resolution=None, unbuf=1, out=None, method="scanraw"):
+        # sweeps with more points than maxPoints by splitting the sweep
+        # into segments that are scanned back to back and returned as 
+        # one sweepResult. each point is measured once, by one segment
+        # pts: total number of points, or
+        # resolution: max Hz between points (used if pts is None)
+        # method: "scanraw"|"scan", the command used for each segment
+        # out: optional sweepResult to reuse
+        # returns None if the args are not valid or a segment failed
+
+        if (pts == None) and (resolution == None):
+            self.print_message("ERROR: scan_segmented needs PTS or RESOLUTION")
+            return None
+        if (pts == None) and not(resolution > 0):
+            self.print_message("ERROR: scan_segmented needs a RESOLUTION greater than 0")
+            return None
+        if (0<=start) and (start < stop) and (pts == None or pts >= 2) \
+            and (unbuf in [0,1]) and (method in ["scanraw", "scan"]):
+            return segmented_sweep(self, start, stop, pts, resolution, unbuf, out, method)
+        else:
+            self.print_message("ERROR: scan_segmented takes START STOP PTS|RESOLUTION UNBUF=0|1 METHOD=\"scanraw\"|\"scan\" as args")
+            return None
+
+    def scan_adaptive(self, start, stop, coarse_pts=250, fine_pts=250, threshold=None, top_n=None, 
+                      pad=2, fine_rbw=None, unbuf=1, out=None):
+        # coarse to fine sweep. one coarse scanraw covers start to stop, 
+        # then only the windows around points above threshold (dBm) and/or
+        # the top_n strongest peaks are swept again with fine_pts points.
+        # returns one sweepResult with the fine points inside the windows 
+        # and the coarse points everywhere else, in frequency order
+        # pad: coarse points added on each side of a window
+        # fine_rbw: optional rbw (kHz) for the fine sweeps. the rbw set before 
+        #   (from the state cache, auto if not known) is set back after
+        # out: optional sweepResult to reuse
+        # returns None if the args are not valid or a sweep failed
+
+        if (threshold == None) and (top_n == None):
+            self.print_message("ERROR: scan_adaptive needs a THRESHOLD and/or TOP_N")
+            return None
+        if (0<=start) and (start < stop) and (3 <= coarse_pts <= self.maxPoints) \
+            and (2 <= fine_pts <= self.maxPoints) and (unbuf in [0,1]) and (pad >= 1):
+            return adaptive_sweep(self, start, stop, coarse_pts, fine_pts, threshold, top_n,
+                                  pad, fine_rbw, unbuf, out)
+        else:
+            self.print_message("ERROR: scan_adaptive takes START STOP COARSE_PTS FINE_PTS THRESHOLD TOP_N PAD>=1 as args. Check doc for format and limits")
+            return None
+
+    def continious_scanraw(self, start, stop, pts=250, unbuf=1, capacity=16, policy="drop_oldest", spectrogram=None,
+                           recorder=None):
+        # starts scanraw in continuous mode and returns a sweepStream.
+        # the device sends sweeps back to back until stopped, and they 
+        # are decoded into a ring buffer of 'capacity' sweeps
+        # usage: scanraw {start(Hz)} {stop(Hz)} [points] [option]
+        #   option is the sum of 1=unbuffered and 2=continuous
+        # policy: "drop_oldest"|"block" when the ring is full
+        # spectrogram: optional spectrogramRing of pts bins that every 
+        #   sweep is also appended to (see src/recording/spectrogram.py)
+        # recorder: optional sweepRecorder that every sweep is also 
+        #   written to (see src/recording/sweep_recording.py)
+        # iterate the stream to get sweepResults. stop() it before
+        # sending any other command
+        # returns None if the args are not valid
+
+        if (0<=start) and (start < stop) and (pts <= self.maxPoints) and (unbuf in [0,1]) \
+            and (policy in ["drop_oldest", "block"]) and (capacity > 0):
+            if (spectrogram is not None) and (spectrogram.bins != pts):
+                self.print_message("ERROR: the spectrogram needs " + str(pts) + " bins")
+                return None
+            stream = sweepStream(self, start, stop, pts, unbuf, capacity, policy, spectrogram, recorder)
+            self.print_message("continuous scanning...")
+            stream.begin()
+            return stream
+        else:
+            self.print_message("ERROR: continious_scanraw takes START STOP PTS UNBUF=0|1 CAPACITY POLICY=\"drop_oldest\"|\"block\" as args")
+            return None
+
+    def continuous_scanraw(self, start, stop, pts=250, unbuf=1, capacity=16, policy="drop_oldest", spectrogram=None,
+                           recorder=None):
+        # alias for continious_scanraw()
+        return self.continious_scanraw(start, stop, pts, unbuf, capacity, policy, spectrogram, recorder)
     
     def sd_delete(self, val):
         # delete a specific file on the sd card
@@ -1532,7 +2205,7 @@ class tinySA():
         #check input
         if (str(val) in accepted_vals):
             writebyte = 'spur '+str(val)+'\r\n'
-            msgbytes = self.tinySA_serial(writebyte, printBool=False)
+            msgbytes = self.tinySA_serial(writebyte, printBool=False, stateKey='spur')
             self.print_message("spur() set to " + str(val))           
         else:
             self.print_message("ERROR: spur() takes vals [on|off]")
@@ -1587,6 +2260,8 @@ class tinySA():
             # do sweep
             writebyte = 'sweep\r\n'
             msgbytes = self.tinySA_serial(writebyte, printBool=False)
+            # the current 'start stop points' are remembered as if they were set
+            self.read_sweep_state(msgbytes)
 
         elif (argName in accepted_table_args): 
             if val == None:
@@ -1597,7 +2272,7 @@ class tinySA():
                 #do stuff, error checking needed
                 writebyte = 'sweep ' + str(argName)+ ' ' + str(val)+ '\r\n'
                 self.print_message("sweep " +str(argName) + " is " + str(val))
-                msgbytes = self.tinySA_serial(writebyte, printBool=False)
+                msgbytes = self.tinySA_serial(writebyte, printBool=False, stateKey='sweep '+str(argName))
 
         else: #not in table of accepted args, so doesn't matter what val is
             self.print_message("ERROR: " + str(argName) + " invalid argument for sweep")
@@ -1659,7 +2334,7 @@ class tinySA():
         # needs some error checking
 
         writebyte = 'sweeptime '+str(val)+'\r\n'
-        msgbytes = self.tinySA_serial(writebyte, printBool=False)   
+        msgbytes = self.tinySA_serial(writebyte, printBool=False, stateKey='sweeptime')   
         self.print_message("sweeptime set to " + str(val))
         return msgbytes
 
@@ -1939,11 +2614,11 @@ class tinySA():
 
         if str(val) in accepted_vals:
             writebyte = 'trigger ' + str(val) +'\r\n'
-            msgbytes = self.tinySA_serial(writebyte, printBool=False) 
+            msgbytes = self.tinySA_serial(writebyte, printBool=False, stateKey='trigger') 
             self.print_message("setting trigger to " + str(val))
         elif val==None and isinstance(freq,int):
             writebyte = 'trigger ' + str(freq) +'\r\n'
-            msgbytes = self.tinySA_serial(writebyte, printBool=False) 
+            msgbytes = self.tinySA_serial(writebyte, printBool=False, stateKey='trigger level') 
             self.print_message("setting trigger level (dBm) to " + str(freq))
         else:
             self.print_message("ERROR: trigger takes inputs auto|normal|single|{level(dBm)}")
@@ -2159,6 +2834,29 @@ class tinySA():
 # be researched
 ######################################################################
 
+    def set_device_type(self, deviceType="ULTRA_ZS405"):
+        # sets the library device params from a device preset
+        # deviceType: BASIC|ULTRA_ZS405|ULTRA_P_ZS406|ULTRA_P_ZS407
+        # WARNING: this DOES NOT change the settings on the DEVICE. just the library.
+        preset = get_preset(deviceType)
+        if preset == None:
+            self.print_message("ERROR: set_device_type() takes BASIC|ULTRA_ZS405|ULTRA_P_ZS406|ULTRA_P_ZS407")
+            return False
+        self.deviceType = preset.DEVICE_TYPE
+        self.maxPoints = preset.DISPLAY_PTS
+        self.minSADeviceFreq = min(preset.SA_INPUT_FREQS["low"][0], preset.SA_INPUT_FREQS["high"][0])
+        self.maxSADeviceFreq = preset.SA_INPUT_FREQS["high"][1]
+        self.maxDeviceBattery = preset.MAX_DEVICE_BATTERY
+        self.screenWidth = preset.SCREEN_WIDTH
+        self.screenHeight = preset.SCREEN_HEIGHT
+        self.scanrawScale = preset.SCANRAW_SCALE
+        self.scanrawOffset = preset.SCANRAW_OFFSET
+        self.print_message("device type set to " + str(self.deviceType))
+        return True
+
+    def get_device_type(self):
+        return self.deviceType
+
 
 
 
@@ -0,0 +1,96 @@
+#! /usr/bin/python3
+
+##--------------------------------------------------------------------\
+#   tinySA_python  conftest.py
+#
+#   Shared fixtures. Run from the repository root with
+#       python -m pytest -q
+#   scriptedSerial answers each command with a fixed reply, and bytes
+#   the device would send on its own can be added with inject().
+#   The sim fixture uses src/simulator/tinySA_simulator.py.
+##--------------------------------------------------------------------\
+
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.tinySA_python import tinySA
+
+
+class scriptedSerial():
+    def __init__(self, replies=None, timeout=0.05):
+        # replies: {command name: response bytes}. other commands get b''
+        self.replies = {} if replies == None else replies
+        self.timeout = timeout
+        self.rx = bytearray()
+        self.written = []   # command lines in the order they were written
+        self.silent = False # True: commands get no echo or reply (a stuck device)
+        self.is_open = True
+        self.port = "scripted"
+        self.cond = threading.Condition()
+
+    @property
+    def in_waiting(self):
+        with self.cond:
+            return len(self.rx)
+
+    def inject(self, data):
+        # bytes sent by the device without a command
+        with self.cond:
+            self.rx += data
+            self.cond.notify_all()
+
+    def write(self, data):
+        data = bytes(data)
+        with self.cond:
+            for line in data.split(b'\r\n')[:-1]:
+                self.written.append(line)
+                if self.silent == True:
+                    continue
+                reply = self.replies.get(line.split()[0] if len(line) > 0 else b'', b'')
+                self.rx += line + b'\r\n' + reply + b'ch> '
+            self.cond.notify_all()
+        return len(data)
+
+    def read(self, n=1):
+        b = bytearray(n)
+        return bytes(b[:self.readinto(b)])
+
+    def readinto(self, b):
+        # blocks up to the timeout for at least 1 byte, like serial.Serial
+        with self.cond:
+            self.cond.wait_for(lambda: len(self.rx) > 0, self.timeout)
+            n = min(len(b), len(self.rx))
+            b[:n] = self.rx[:n]
+            del self.rx[:n]
+        return n
+
+    def reset_input_buffer(self):
+        with self.cond:
+            self.rx.clear()
+
+    def close(self):
+        self.is_open = False
+
+
+@pytest.fixture
+def scripted():
+    # a tinySA object on a scriptedSerial. set tsa.ser.replies as needed
+    tsa = tinySA()
+    tsa.ser = scriptedSerial()
+    tsa.set_response_timeout(1.0)
+    yield tsa
+    tsa.stop_demux()
+
+
+@pytest.fixture
+def sim():
+    # a tinySA object on the simulator with the virtual clock
+    tsa = tinySA()
+    assert tsa.connect_simulator("virtual", seed=0) == True
+    yield tsa
+    tsa.disconnect()
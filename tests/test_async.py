@@ -0,0 +1,100 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from src.tinySA_async import asyncTinySA
+from src.tinySA_python import tinySA
+from src.simulator.tinySA_simulator import tinySASimulator
+
+START = int(100e6)
+STOP = int(200e6)
+
+
+def run(test):
+    # runs an async test against the simulator. the async client waits
+    # for the port to be readable, so the simulator uses real time
+    async def main():
+        atsa = asyncTinySA()
+        atsa.open(tinySASimulator("ULTRA_ZS405", "realtime", 0, None, 1))
+        atsa.set_response_timeout(5.0)
+        try:
+            return await test(atsa)
+        finally:
+            atsa.disconnect()
+    return asyncio.run(main())
+
+
+def test_text_command():
+    async def test(atsa):
+        return await atsa.version()
+    tsa = tinySA()
+    tsa.connect_simulator("virtual")
+    assert run(test) == tsa.version()
+
+
+def test_decoded_like_the_sync_client():
+    async def test(atsa):
+        levels = await atsa.scan_raw_array(START, STOP, 100)
+        result = await atsa.scan_arrays(START, STOP, 100)
+        image = await atsa.capture_array()
+        return levels, result, image
+    levels, result, image = run(test)
+    assert isinstance(levels, np.ndarray) and len(levels) == 100
+    assert len(result) == 100
+    assert result.frequencies[0] == START
+    assert result.valid.all()
+    assert image.shape[:2] == (320, 480)
+
+
+@pytest.mark.parametrize("name", ["scan_adaptive", "pipeline", "screen_mirror", "maxPoints", "not_a_command"])
+def test_not_available_raises(name):
+    atsa = asyncTinySA()
+    with pytest.raises(AttributeError):
+        getattr(atsa, name)
+
+
+def test_state_cache_after_reply():
+    async def test(atsa):
+        await atsa.rbw(100)
+        await atsa.rbw(100)
+        return atsa.tsa.get_state_cache_stats(), atsa.tsa.stateCache.get('rbw')
+    stats, cached = run(test)
+    assert stats["hits"] == 1
+    assert cached == 'rbw 100\r\n'
+
+
+def test_recovers_after_timeout():
+    async def test(atsa):
+        atsa.set_response_timeout(0.0005)
+        with pytest.raises(asyncio.TimeoutError):
+            await atsa.scan_raw_arrays(START, STOP, 450)
+        atsa.set_response_timeout(5.0)
+        return await atsa.version(), atsa.lock.locked()
+    version, locked = run(test)
+    assert b'tinySA' in version
+    assert locked == False
+
+
+def test_sweep_stream_releases_the_port():
+    async def test(atsa):
+        count = 0
+        async with atsa.sweeps(START, STOP, 100) as stream:
+            async for sweep in stream:
+                assert len(sweep) == 100
+                count = count + 1
+                if count == 3:
+                    break
+        return count, atsa.lock.locked(), await atsa.version()
+    count, locked, version = run(test)
+    assert count == 3
+    assert locked == False
+    assert b'tinySA' in version
+
+
+def test_sweep_stream_needs_async_with():
+    async def test(atsa):
+        with pytest.raises(RuntimeError):
+            async for sweep in atsa.sweeps(START, STOP, 100):
+                pass
+    run(test)
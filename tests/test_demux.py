@@ -0,0 +1,80 @@
+import struct
+import time
+
+import numpy as np
+
+
+def bulk_record(x, y, w, h, color):
+    pixels = np.full(w*h, color, dtype='>u2').tobytes()
+    return b'bulk\r\n' + struct.pack('<4H', x, y, w, h) + pixels + b'ch> \r\n'
+
+
+def fill_record(x, y, w, h, color):
+    return b'fill\r\n' + struct.pack('<4H', x, y, w, h) + struct.pack('>H', color) + b'ch> \r\n'
+
+
+def wait_for(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if condition():
+            return True
+        time.sleep(0.005)
+    return False
+
+
+def test_responses_with_records_between(scripted):
+    # the same response as without the demultiplexer
+    scripted.ser.replies[b'version'] = b'tinySA4_v1.4-143\r\nHW Version:V0.4.5.1\r\n'
+    expected = scripted.version()
+    demux = scripted.start_demux()
+    scripted.ser.inject(bulk_record(1, 2, 3, 4, 0x1234))
+    assert scripted.version() == expected
+    scripted.ser.inject(fill_record(0, 0, 10, 10, 0xF800))
+    assert scripted.version() == expected
+    assert wait_for(lambda: demux.stats()["records"] == 2)
+    kind, header, payload = demux.records.get_nowait()
+    assert kind == "bulk"
+    assert tuple(header) == (1, 2, 3, 4)
+    assert len(payload) == 3*4*2
+    kind, header, payload = demux.records.get_nowait()
+    assert kind == "fill"
+    assert demux.error == None
+    assert demux.stats()["responses"] == 2
+
+
+def test_record_handler(scripted):
+    got = []
+    scripted.start_demux(recordHandler=lambda kind, header, payload: got.append((kind, tuple(header))))
+    scripted.ser.inject(fill_record(5, 6, 7, 8, 0))
+    assert wait_for(lambda: len(got) == 1)
+    assert got[0] == ("fill", (5, 6, 7, 8))
+
+
+def test_unsolicited_data(scripted):
+    demux = scripted.start_demux()
+    scripted.ser.inject(b'hello\r\n')
+    # the last bytes are held back until it is known they are not the
+    # start of a tag or echo. the next response releases them
+    scripted.rbw(100)
+    data = b''
+    while demux.unsolicited.empty() == False:
+        data = data + demux.unsolicited.get_nowait()
+    assert data == b'hello\r\n'
+
+
+def test_timeout_returns_error_bytes(scripted):
+    scripted.set_error_byte_return(True)
+    scripted.set_response_timeout(0.1)
+    scripted.start_demux()
+    scripted.ser.silent = True
+    assert scripted.rbw(100) == bytearray(b'ERROR')
+    assert 'rbw' not in scripted.stateCache
+
+
+def test_stop_keeps_unread_bytes(scripted):
+    scripted.ser.replies[b'version'] = b'v1\r\n'
+    expected = scripted.version()
+    scripted.start_demux()
+    scripted.stop_demux()
+    assert scripted.demux == None
+    assert scripted.version() == expected
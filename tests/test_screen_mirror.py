@@ -0,0 +1,53 @@
+import struct
+
+import numpy as np
+
+from src.screen import screen_mirror
+from src.screen.rgb565_decode import RGB565_LE
+from src.screen.screen_mirror import screenMirror
+
+
+def test_apply_bytes():
+    mirror = screenMirror()
+    data = b'junk' + b'bulk\r\n' + struct.pack('<4H', 1, 2, 3, 4) + np.full(12, 0x3E3E, '>u2').tobytes() + \
+           b'ch> \r\n' + b'fill\r\n' + struct.pack('<4H', 0, 0, 2, 2) + b'\xf8\x00' + b'ch> \r\nfill\r\n\x00'
+    used = mirror.apply_bytes(data)
+    # used up to the end of the last complete record
+    assert used == len(data) - len(b'ch> \r\nfill\r\n\x00')
+    assert mirror.pixels[2, 1] == 0x3E3E
+    assert mirror.pixels[0, 0] == 0xF800
+    assert list(mirror.rgb[0, 0]) == [255, 0, 0]
+    assert mirror.take_dirty() == [(1, 2, 3, 4), (0, 0, 2, 2)]
+
+
+def test_fill_is_clipped():
+    mirror = screenMirror(480, 320)
+    mirror.apply_record("fill", (470, 300, 20, 30), b'\xf8\x00')
+    assert mirror.take_dirty() == [(470, 300, 10, 20)]
+
+
+def test_dirty_list_is_bounded():
+    mirror = screenMirror()
+    for i in range(10*screen_mirror.MAX_DIRTY):
+        mirror.apply_record("fill", (i % 400, i % 300, 2, 2), b'\x00\x00')
+    assert len(mirror.dirty) <= screen_mirror.MAX_DIRTY
+    assert mirror.dirty_bounds() == (0, 0, 401, 301)
+
+
+def test_pixel_byte_order():
+    # the region header is little endian, the pixels and color big
+    # endian like capture. 0xF800 is red and 0x001F blue, so a swap shows
+    mirror = screenMirror()
+    data = b'bulk\r\n' + struct.pack('<4H', 0, 0, 2, 1) + struct.pack('>2H', 0xF800, 0x001F) + b'ch> \r\n' + \
+           b'fill\r\n' + struct.pack('<4H', 0, 1, 1, 1) + struct.pack('>H', 0x07E0) + b'ch> \r\n'
+    mirror.apply_bytes(data)
+    assert list(mirror.pixels[0, :2]) == [0xF800, 0x001F]
+    assert list(mirror.rgb[0, 0]) == [255, 0, 0]
+    assert list(mirror.rgb[0, 1]) == [0, 0, 255]
+    assert list(mirror.rgb[1, 0]) == [0, 255, 0]
+
+
+def test_byte_swapped_data():
+    mirror = screenMirror(dtype=RGB565_LE)
+    mirror.apply_record("fill", (0, 0, 1, 1), struct.pack('<H', 0xF800))
+    assert list(mirror.rgb[0, 0]) == [255, 0, 0]
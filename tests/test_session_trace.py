@@ -0,0 +1,58 @@
+import json
+import threading
+
+
+def spans(tracer, name):
+    # (name, category, start, end, thread id, args) of every span called name
+    return [e for e in tracer.events if e[0] == name]
+
+
+def test_serial_spans(scripted):
+    tracer = scripted.enable_tracing()
+    scripted.rbw(100)
+    scripted.disable_tracing()
+    names = set(e[0] for e in tracer.events)
+    assert {"tinySA_serial", "read_response", "serial write", "serial read"} <= names
+    assert spans(tracer, "tinySA_serial")[0][5] == {"command": "rbw 100"}
+
+
+def test_read_until_end_marker_is_traced(scripted):
+    tracer = scripted.enable_tracing()
+    scripted.ser.write(b'version\r\n')
+    scripted.read_until_end_marker(b'ch> ', 1.0)
+    scripted.disable_tracing()
+    assert len(spans(tracer, "read_until_end_marker")) == 1
+
+
+def test_demux_reads_are_traced(scripted):
+    tracer = scripted.enable_tracing()
+    demux = scripted.start_demux()
+    scripted.rbw(100)
+    scripted.attenuate(10)
+    scripted.stop_demux()
+    scripted.disable_tracing()
+    reads = spans(tracer, "serial read")
+    # the demultiplexer thread reads the port, not the caller
+    assert len(reads) > 0
+    assert all(e[4] != threading.get_ident() for e in reads)
+    assert len(spans(tracer, "tinySA_serial")) == 2
+
+
+def test_tracing_started_after_the_demux(scripted):
+    scripted.start_demux()
+    tracer = scripted.enable_tracing()
+    scripted.rbw(100)
+    scripted.disable_tracing()
+    assert len(spans(tracer, "serial read")) > 0
+
+
+def test_chrome_trace_file(scripted, tmp_path):
+    tracer = scripted.enable_tracing()
+    scripted.rbw(100)
+    scripted.disable_tracing()
+    filename = str(tmp_path / "trace.json")
+    tracer.write(filename)
+    with open(filename) as f:
+        trace = json.load(f)
+    phases = set(e["ph"] for e in trace["traceEvents"])
+    assert {"M", "X"} <= phases
@@ -0,0 +1,28 @@
+import numpy as np
+
+from src.simulator.tinySA_simulator import tinySASimulator
+
+
+def test_write_returns_full_length():
+    sim = tinySASimulator()
+    sim.write(b'scanraw 100000000 200000000 50 3\r\n')
+    # the byte that stops a continuous scanraw is counted too
+    assert sim.write(b'x') == 1
+    assert sim.write(b'version\r\n') == 9
+
+
+def test_unknown_command(sim):
+    assert bytes(sim.command("notacommand")).strip().endswith(b'?')
+
+
+def test_sweep_finds_the_signals(sim):
+    result = sim.scan_raw_arrays(int(90e6), int(110e6), 201)
+    assert len(result) == 201
+    peak = result.frequencies[int(np.argmax(result.levels))]
+    assert abs(peak - 100e6) < 1e6
+
+
+def test_same_seed_same_sweep():
+    a = tinySASimulator(seed=3)
+    b = tinySASimulator(seed=3)
+    assert np.array_equal(a.spectrum(0, 1e9, 100), b.spectrum(0, 1e9, 100))
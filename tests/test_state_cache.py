@@ -0,0 +1,84 @@
+def sent(tsa, command):
+    # how many times a command line was written to the port
+    return tsa.ser.written.count(command)
+
+
+def test_repeated_setter_is_sent_once(scripted):
+    scripted.rbw(100)
+    scripted.rbw(100)
+    scripted.rbw(100)
+    assert sent(scripted, b'rbw 100') == 1
+    assert scripted.get_state_cache_stats()["hits"] == 2
+
+
+def test_changed_value_is_sent(scripted):
+    scripted.attenuate(10)
+    scripted.attenuate(20)
+    scripted.attenuate(10)
+    assert sent(scripted, b'attenuate 10') == 2
+
+
+def test_rejected_setting_is_not_cached(scripted):
+    scripted.ser.replies[b'rbw'] = b'usage: rbw 2..600|auto\r\n'
+    scripted.rbw(100)
+    scripted.rbw(100)
+    assert sent(scripted, b'rbw 100') == 2
+    assert 'rbw' not in scripted.stateCache
+
+
+def test_no_response_is_not_cached(scripted):
+    scripted.set_response_timeout(0.1)
+    scripted.ser.silent = True
+    scripted.rbw(100)
+    scripted.ser.silent = False
+    scripted.ser.reset_input_buffer()
+    scripted.rbw(100)
+    assert sent(scripted, b'rbw 100') == 2
+
+
+def test_linked_sweep_settings_expire(scripted):
+    scripted.set_sweep_start(100000000)
+    scripted.set_sweep_stop(200000000)
+    scripted.set_sweep_start(100000000)
+    assert sent(scripted, b'sweep start 100000000') == 1
+    # center moves start and stop, but not the other settings
+    scripted.rbw(100)
+    scripted.set_sweep_center(150000000)
+    scripted.set_sweep_start(100000000)
+    scripted.rbw(100)
+    assert sent(scripted, b'sweep start 100000000') == 2
+    assert sent(scripted, b'rbw 100') == 1
+
+
+def test_sweep_read_fills_the_cache(scripted):
+    scripted.ser.replies[b'sweep'] = b'100000000 200000000 450\r\n'
+    scripted.get_sweep_params()
+    scripted.set_sweep_start(100000000)
+    scripted.set_sweep_stop(200000000)
+    assert sent(scripted, b'sweep start 100000000') == 0
+    assert sent(scripted, b'sweep stop 200000000') == 0
+
+
+def test_reset_command_clears_the_cache(scripted):
+    scripted.rbw(100)
+    scripted.recall(0)
+    scripted.rbw(100)
+    assert sent(scripted, b'rbw 100') == 2
+
+
+def test_pipeline_stores_state_after_flush(scripted):
+    with scripted.pipeline() as pipe:
+        scripted.rbw(100)
+        scripted.lna("on")
+        # recorded, not sent. nothing is known about the device yet
+        assert 'rbw' not in scripted.stateCache
+    assert len(pipe.results) == 2
+    scripted.rbw(100)
+    assert sent(scripted, b'rbw 100') == 1
+
+
+def test_disabled_cache_sends_everything(scripted):
+    scripted.set_state_cache(False)
+    scripted.rbw(100)
+    scripted.rbw(100)
+    assert sent(scripted, b'rbw 100') == 2
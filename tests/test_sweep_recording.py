@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.recording.sweep_recording import (INDEX_DTYPE, RECORD_HEADER, index_file, rebuild_index,
+                                           sweepRecorder, sweepRecording)
+
+PTS = 10
+
+
+@pytest.fixture
+def recording(tmp_path):
+    # a recording of 3 sweeps with levels 0, -1, -2
+    filename = str(tmp_path / "sweeps.tsr")
+    with sweepRecorder(filename) as rec:
+        for i in range(3):
+            rec.write(np.full(PTS, -i, dtype=np.float32), float(i), 0, 10)
+    return filename
+
+
+def append_and_read(filename):
+    # appends a sweep with level -99, returns its number and the first
+    # level of every sweep in the recording
+    with sweepRecorder(filename) as rec:
+        n = rec.write(np.full(PTS, -99, dtype=np.float32), 99.0, 0, 10)
+    with sweepRecording(filename) as r:
+        return n, [float(r[i].levels[0]) for i in range(len(r))]
+
+
+def test_round_trip(recording):
+    with sweepRecording(recording) as r:
+        assert len(r) == 3
+        assert r.time_range() == (0.0, 2.0)
+        assert list(r.between(1.0, 2.0)) == [1]
+        sweep = r[2]
+        assert sweep.levels[0] == -2
+        assert sweep.settings["pts"] == PTS
+
+
+def test_append(recording):
+    assert append_and_read(recording) == (3, [0.0, -1.0, -2.0, -99.0])
+
+
+def test_partial_record_is_removed(recording):
+    size = os.path.getsize(recording)
+    with open(recording, 'ab') as f:
+        f.write(b'SWP1\x28\x00\x00\x00cut off')
+    assert append_and_read(recording) == (3, [0.0, -1.0, -2.0, -99.0])
+    assert os.path.getsize(recording) == size + RECORD_HEADER.size + PTS*4
+
+
+def test_index_behind(recording):
+    with open(index_file(recording), 'rb') as f:
+        entries = f.read()
+    with open(index_file(recording), 'wb') as f:
+        f.write(entries[:INDEX_DTYPE.itemsize])
+    assert append_and_read(recording) == (3, [0.0, -1.0, -2.0, -99.0])
+
+
+def test_index_ahead(recording):
+    # an index entry for a record that never reached the disk
+    with open(index_file(recording), 'ab') as f:
+        f.write(np.array([(3.0, os.path.getsize(recording))], dtype=INDEX_DTYPE).tobytes())
+    assert append_and_read(recording) == (3, [0.0, -1.0, -2.0, -99.0])
+
+
+def test_partial_index_entry(recording):
+    with open(index_file(recording), 'ab') as f:
+        f.write(b'\x01\x02\x03')
+    assert append_and_read(recording) == (3, [0.0, -1.0, -2.0, -99.0])
+
+
+def test_missing_index(recording):
+    os.remove(index_file(recording))
+    assert append_and_read(recording) == (3, [0.0, -1.0, -2.0, -99.0])
+
+
+def test_rebuild_index_keeps_the_recording(recording):
+    with open(recording, 'ab') as f:
+        f.write(b'SWP1')
+    size = os.path.getsize(recording)
+    assert rebuild_index(recording) == 3
+    assert os.path.getsize(recording) == size
+
+
+def test_uint16_recording(tmp_path):
+    filename = str(tmp_path / "raw.tsr")
+    with sweepRecorder(filename, "uint16") as rec:
+        rec.write(np.full(PTS, -90, dtype=np.float32), 1.0, 0, 10)
+    with sweepRecording(filename) as r:
+        assert r.levels(0).dtype == np.uint16
+        assert np.allclose(r[0].levels, -90)
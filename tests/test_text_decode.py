@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from src.data_decode.text_decode import parse_columns, parse_data, parse_scan, parse_scan_into
+
+
+def test_parse_columns_rows():
+    values, valid = parse_columns(b'1.0e8 -90.5\r\n2.0e8 -80.25\r\n', 2)
+    assert values.shape == (2, 2)
+    assert values[1, 1] == -80.25
+    assert valid.all()
+
+
+def test_parse_columns_drops_partial_row():
+    values, valid = parse_columns(b'1 2\r\n3 4\r\n5', 2)
+    assert values.shape == (2, 2)
+
+
+@pytest.mark.parametrize("data", [b'ERROR', b'usage: scan {start(Hz)} {stop(Hz)} [points] [outmask]',
+                                  b'scann?', b'1.0 nan-ish 2.0'])
+def test_parse_columns_not_numeric(data):
+    # the device answers bad commands with text. no exception, no rows
+    values, valid = parse_columns(data, 2)
+    assert values.shape == (0, 2)
+    assert valid.shape == (0, 2)
+    assert valid.dtype == bool
+
+
+def test_parse_columns_corrupt_value():
+    values, valid = parse_columns(b'1.0e8 -:.000000e+01\r\n2.0e8 -80.0\r\n', 2)
+    assert np.isnan(values[0, 1])
+    assert valid[0, 1] == False
+    assert valid[1].all()
+
+
+def test_parse_data_error_is_empty():
+    values, valid = parse_data(b'ERROR')
+    assert len(values) == 0
+    assert len(valid) == 0
+
+
+def test_parse_scan_outmask_columns():
+    values, valid = parse_scan(b'1 2 3\r\n4 5 6\r\n', 7)
+    assert values.shape == (2, 3)
+
+
+def test_parse_scan_into():
+    freqs = np.zeros(4)
+    levels = np.zeros(4, dtype=np.float32)
+    valid = np.zeros(4, dtype=bool)
+    rows = parse_scan_into(b'1.0e8 -90.0\r\n2.0e8 -:.5\r\n', freqs, levels, valid)
+    assert rows == 2
+    assert freqs[1] == 2.0e8
+    assert levels[0] == -90.0
+    assert np.isnan(levels[1])
+    assert list(valid[:2]) == [True, False]
+
+
+def test_parse_scan_into_not_numeric():
+    freqs = np.zeros(4)
+    levels = np.zeros(4, dtype=np.float32)
+    valid = np.zeros(4, dtype=bool)
+    assert parse_scan_into(b'usage: scan', freqs, levels, valid) == 0
+
+
+def test_parse_scan_into_too_many_rows():
+    # nothing is written when the arrays are too small
+    freqs = np.zeros(1)
+    levels = np.zeros(1, dtype=np.float32)
+    valid = np.zeros(1, dtype=bool)
+    assert parse_scan_into(b'1 2\r\n3 4\r\n', freqs, levels, valid) == 2
+    assert freqs[0] == 0
+
+
+def test_parse_columns_bytearray():
+    # responses arrive as bytearrays
+    data = b' '.join(b'%d -%d.5' % (i, i) for i in range(1000))
+    values, valid = parse_columns(bytearray(data), 2)
+    assert values.shape == (1000, 2)
+    assert values[999, 1] == -999.5